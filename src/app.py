@@ -7,10 +7,8 @@ from pathlib import Path
 
 import yaml
 
-from src.callbacks import get_callbacks, get_callbacks_pdb
-from src.preprocessing import DataPreprocessor
-from src.structurecontainer import StructureContainer
-from src.visualization.visualizator import Visualizator
+# The application modules pull in pandas, dash and plotly. They are imported in
+# setup() and main(), so that argument parsing (e.g. --help) returns instantly.
 
 
 class LoadConfFile(argparse.Action):
@@ -117,12 +115,54 @@ class LoadConfFile(argparse.Action):
             arguments.append(str(dictionary["verbose"]))
         if "v" in dictionary.keys():
             arguments.append("-v")
+        if "profile" in dictionary.keys():
+            if dictionary["profile"]:
+                arguments.append("--profile")
+        if "cprofile" in dictionary.keys():
+            if dictionary["cprofile"]:
+                arguments.append("--cprofile")
+        if "production" in dictionary.keys():
+            if dictionary["production"]:
+                arguments.append("--production")
+        if "workers" in dictionary.keys():
+            arguments.append("--workers")
+            arguments.append(str(dictionary["workers"]))
+        if "threads" in dictionary.keys():
+            arguments.append("--threads")
+            arguments.append(str(dictionary["threads"]))
+        if "memory_budget" in dictionary.keys():
+            arguments.append("--memory_budget")
+            arguments.append(str(dictionary["memory_budget"]))
+        if "umap_mode" in dictionary.keys():
+            arguments.append("--umap_mode")
+            arguments.append(str(dictionary["umap_mode"]))
+        if "umap_threads" in dictionary.keys():
+            arguments.append("--umap_threads")
+            arguments.append(str(dictionary["umap_threads"]))
+        if "tsne_backend" in dictionary.keys():
+            arguments.append("--tsne_backend")
+            arguments.append(str(dictionary["tsne_backend"]))
+        if "pre_reduction" in dictionary.keys():
+            arguments.append("--pre_reduction")
+            arguments.append(str(dictionary["pre_reduction"]))
+        if "dtype" in dictionary.keys():
+            arguments.append("--dtype")
+            arguments.append(str(dictionary["dtype"]))
+        if "lod_points" in dictionary.keys():
+            arguments.append("--lod_points")
+            arguments.append(str(dictionary["lod_points"]))
+        if "figure_cache" in dictionary.keys():
+            arguments.append("--figure_cache")
+            arguments.append(str(dictionary["figure_cache"]))
+        if "clientside" in dictionary.keys():
+            if dictionary["clientside"]:
+                arguments.append("--clientside")
 
         return arguments
 
 
 class Parser:
-    def __init__(self):
+    def __init__(self, arguments: list = None):
         (
             self.output_d,
             self.hdf_path,
@@ -146,7 +186,22 @@ class Parser:
             self.metric,
             self.port,
             self.verbose,
-        ) = self._parse_args()
+            self.profile,
+            self.cprofile,
+            self.production,
+            self.workers,
+            self.threads,
+            self.datasets,
+            self.memory_budget,
+            self.umap_mode,
+            self.umap_threads,
+            self.tsne_backend,
+            self.pre_reduction,
+            self.dtype,
+            self.lod_points,
+            self.figure_cache,
+            self.clientside,
+        ) = self._parse_args(arguments)
 
     def get_params(self):
         """
@@ -175,12 +230,28 @@ class Parser:
             self.metric,
             self.port,
             self.verbose,
+            self.profile,
+            self.cprofile,
+            self.production,
+            self.workers,
+            self.threads,
+            self.datasets,
+            self.memory_budget,
+            self.umap_mode,
+            self.umap_threads,
+            self.tsne_backend,
+            self.pre_reduction,
+            self.dtype,
+            self.lod_points,
+            self.figure_cache,
+            self.clientside,
         )
 
     @staticmethod
-    def _parse_args():
+    def _parse_args(arguments: list = None):
         """
         Creates and returns the ArgumentParser object
+        :param arguments: arguments in parser list format, sys.argv if None
         """
 
         # Instantiate the parser
@@ -213,7 +284,7 @@ class Parser:
             type=str,
             help=(
                 "Path to CSV-file containing groups/features by which the dots"
-                " in the 3D-plot are colored"
+                " in the 3D-plot are colored, a Parquet file is read as well"
             ),
         )
         parser.add_argument(
@@ -279,7 +350,7 @@ class Parser:
             "--reset",
             required=False,
             action="store_true",
-            help="Precomputed file df.csv is deleted and recalculated.",
+            help="Precomputed projections are deleted and recalculated.",
         )
         # Optional argument
         parser.add_argument(
@@ -363,8 +434,158 @@ class Parser:
                 " internal operations."
             ),
         )
+        parser.add_argument(
+            "--profile",
+            required=False,
+            action="store_true",
+            help=(
+                "Records wall time, CPU time and peak memory of each"
+                " preprocessing stage and saves a Chrome trace timeline"
+                " (profile_<hdf name>.json) to the output directory."
+            ),
+        )
+        parser.add_argument(
+            "--cprofile",
+            required=False,
+            action="store_true",
+            help=(
+                "Like --profile, additionally saves a cProfile dump per"
+                " preprocessing stage to the output directory."
+            ),
+        )
+        parser.add_argument(
+            "--production",
+            required=False,
+            action="store_true",
+            help=(
+                "Serve with a multi-worker production server (gunicorn or"
+                " waitress) on localhost instead of the debug server."
+                " Embeddings and distance matrices are shared between the"
+                " workers as memory-mapped files."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            required=False,
+            type=int,
+            default=2,
+            help="Number of worker processes in production mode, default: 2",
+        )
+        parser.add_argument(
+            "--threads",
+            required=False,
+            type=int,
+            default=4,
+            help="Number of threads per worker in production mode, default: 4",
+        )
+        parser.add_argument(
+            "--datasets",
+            required=False,
+            type=str,
+            nargs="+",
+            help=(
+                "Configuration files of several datasets served by one"
+                " process, e.g. conf/*.yaml. Datasets are loaded on first"
+                " access and selected on the start page."
+            ),
+        )
+        parser.add_argument(
+            "--memory_budget",
+            required=False,
+            type=float,
+            default=8192,
+            help=(
+                "Memory budget in MB for the datasets loaded with --datasets,"
+                " least recently used datasets are unloaded when it is"
+                " exceeded. A dataset counts with its data, --figure_cache"
+                " and its spatial indexes, default: 8192"
+            ),
+        )
+        parser.add_argument(
+            "--umap_mode",
+            required=False,
+            choices=["exact", "fast"],
+            default="exact",
+            help=(
+                "exact: reproducible single-threaded UMAP, fast: multithreaded"
+                " UMAP whose layout differs between runs, default: exact"
+            ),
+        )
+        parser.add_argument(
+            "--umap_threads",
+            required=False,
+            type=int,
+            default=0,
+            help=(
+                "Number of threads of the fast UMAP mode, 0 uses all cores,"
+                " default: 0"
+            ),
+        )
+        parser.add_argument(
+            "--tsne_backend",
+            required=False,
+            choices=["auto", "opentsne", "sklearn"],
+            default="auto",
+            help=(
+                "Implementation of t-SNE, auto uses the multithreaded openTSNE"
+                " if it is installed and sklearn otherwise, default: auto"
+            ),
+        )
+        parser.add_argument(
+            "--pre_reduction",
+            required=False,
+            type=int,
+            default=0,
+            help=(
+                "Number of PCA dimensions the embeddings are reduced to before"
+                " UMAP and t-SNE, e.g. 50, 0 uses the full embeddings,"
+                " default: 0"
+            ),
+        )
+        parser.add_argument(
+            "--dtype",
+            required=False,
+            choices=["float32", "float16", "float64"],
+            default="float32",
+            help=(
+                "Data type the embeddings are held in, float16 halves the"
+                " memory again and computes in float32, float64 keeps the"
+                " full precision, default: float32"
+            ),
+        )
+        parser.add_argument(
+            "--lod_points",
+            required=False,
+            type=int,
+            default=0,
+            help=(
+                "Approximate number of points sent to the browser, zoomed out"
+                " a subsample is shown and zoomed regions are filled in, 0"
+                " sends all points, default: 0"
+            ),
+        )
+        parser.add_argument(
+            "--figure_cache",
+            required=False,
+            type=float,
+            default=256,
+            help=(
+                "Memory in MB of the rendered figures kept for all sessions,"
+                " 0 renders every figure again, default: 256"
+            ),
+        )
+        parser.add_argument(
+            "--clientside",
+            required=False,
+            action="store_true",
+            help=(
+                "Recolor the graph and switch between 3D and 2D in the"
+                " browser, the coordinates of a projection are sent once."
+                " Not used with --lod_points."
+            ),
+        )
 
-        args = parser.parse_args()
+        args = parser.parse_args(arguments)
         output_d = Path(args.output) if args.output is not None else None
         hdf_path = Path(args.hdf) if args.hdf is not None else None
         csv_path = Path(args.csv) if args.csv is not None else None
@@ -387,6 +608,25 @@ class Parser:
         metric = args.metric
         port = args.port
         verbose = args.verbose
+        profile = args.profile
+        cprofile = args.cprofile
+        production = args.production
+        workers = args.workers
+        threads = args.threads
+        datasets = (
+            [Path(conf) for conf in args.datasets]
+            if args.datasets is not None
+            else None
+        )
+        memory_budget = args.memory_budget
+        umap_mode = args.umap_mode
+        umap_threads = args.umap_threads
+        tsne_backend = args.tsne_backend
+        pre_reduction = args.pre_reduction
+        dtype = args.dtype
+        lod_points = args.lod_points
+        figure_cache = args.figure_cache
+        clientside = args.clientside
 
         return (
             output_d,
@@ -411,6 +651,21 @@ class Parser:
             metric,
             port,
             verbose,
+            profile,
+            cprofile,
+            production,
+            workers,
+            threads,
+            datasets,
+            memory_budget,
+            umap_mode,
+            umap_threads,
+            tsne_backend,
+            pre_reduction,
+            dtype,
+            lod_points,
+            figure_cache,
+            clientside,
         )
 
 
@@ -438,14 +693,12 @@ def required_arguments_check(hdf_path: Path, output_d: Path):
             )
 
 
-def setup():
+def get_data_preprocessor(parser: Parser):
     """
-    Handles the process of the application
-    :return: app & html_flag
+    Creates the data preprocessor of a dataset from its parsed arguments
+    :param parser: parsed arguments
+    :return: data preprocessor, dimensionality reduction, UMAP and t-SNE parameters
     """
-    # Create Application object
-    parser = Parser()
-
     # Parse arguments
     (
         output_d,
@@ -470,10 +723,29 @@ def setup():
         metric,
         port,
         verbose,
+        profile,
+        cprofile,
+        production,
+        workers,
+        threads,
+        _,
+        _,
+        umap_mode,
+        umap_threads,
+        tsne_backend,
+        pre_reduction,
+        dtype,
+        lod_points,
+        figure_cache,
+        clientside,
     ) = parser.get_params()
 
     required_arguments_check(hdf_path, output_d)
 
+    from src.reducers import resolve_tsne_backend
+
+    from src.preprocessing import DataPreprocessor
+
     dim_red = "UMAP"
     if pca_flag:
         dim_red = "PCA"
@@ -485,6 +757,9 @@ def setup():
     umap_paras["n_neighbours"] = n_neighbours
     umap_paras["min_dist"] = min_dist
     umap_paras["metric"] = metric
+    umap_paras["mode"] = umap_mode
+    umap_paras["threads"] = umap_threads
+    umap_paras["pre_reduction"] = pre_reduction
 
     # Put TSNE parameters in dictionary
     tsne_paras = dict()
@@ -492,6 +767,8 @@ def setup():
     tsne_paras["perplexity"] = perplexity
     tsne_paras["learning_rate"] = learning_rate
     tsne_paras["tsne_metric"] = tsne_metric
+    tsne_paras["backend"] = resolve_tsne_backend(tsne_backend)
+    tsne_paras["pre_reduction"] = pre_reduction
 
     # Create data preprocessor object
     data_preprocessor = DataPreprocessor(
@@ -507,8 +784,39 @@ def setup():
         umap_paras,
         tsne_paras,
         verbose,
+        profile,
+        cprofile,
+        dtype,
+        lod_points,
     )
 
+    return data_preprocessor, dim_red, umap_paras, tsne_paras
+
+
+def setup(parser: Parser = None, requests_pathname_prefix: str = None):
+    """
+    Handles the process of the application
+    :param parser: parsed arguments, parsed from the command line if None
+    :param requests_pathname_prefix: URL prefix if the app is not served at the root
+    :return: app & html_flag
+    """
+    # Create Application object
+    if parser is None:
+        parser = Parser()
+
+    data_preprocessor, dim_red, umap_paras, tsne_paras = get_data_preprocessor(
+        parser
+    )
+    output_d = parser.output_d
+    hdf_path = parser.hdf_path
+    html_cols = parser.html_cols
+    pdb_d = parser.pdb_d
+    json_d = parser.json_d
+    port = parser.port
+
+    from src.structurecontainer import StructureContainer
+    from src.visualization.visualizator import Visualizator
+
     # Preprocessing
     (
         df,
@@ -536,11 +844,20 @@ def setup():
     umap_paras_dict = data_preprocessor.get_umap_paras_dict(df)
     tsne_paras_dict = data_preprocessor.get_tsne_paras_dict(df)
 
+    # input of UMAP and t-SNE recalculations
+    reducer_embeddings = data_preprocessor.reduce_embeddings(
+        embeddings, embedding_uids
+    )
+
     # --- APP creation ---
     if structure_container.pdb_flag:
-        application = visualizator.get_pdb_app(ids, umap_paras, tsne_paras)
+        application = visualizator.get_pdb_app(
+            ids, umap_paras, tsne_paras, requests_pathname_prefix
+        )
     else:
-        application = visualizator.get_base_app(umap_paras, tsne_paras, ids)
+        application = visualizator.get_base_app(
+            umap_paras, tsne_paras, ids, requests_pathname_prefix
+        )
 
     return (
         application,
@@ -560,13 +877,28 @@ def setup():
         embedding_uids,
         distance_dic,
         fasta_dict,
+        hdf_path,
+        reducer_embeddings,
+        parser.production,
+        parser.workers,
+        parser.threads,
+        parser.lod_points,
+        parser.figure_cache,
+        parser.clientside,
+        data_preprocessor,
     )
 
 
-def main():
+def get_application(
+    parser: Parser = None, requests_pathname_prefix: str = None
+):
     """
-    Most general processing of the script
-    :return: None
+    Sets up the application and registers its callbacks
+    :param parser: parsed arguments, parsed from the command line if None
+    :param requests_pathname_prefix: URL prefix if the app is not served at
+    the root
+    :return: app, html flag, serving parameters and the memory footprint of
+    the data in bytes
     """
     (
         app,
@@ -586,48 +918,129 @@ def main():
         embedding_uids,
         distance_dic,
         fasta_dict,
-    ) = setup()
+        hdf_path,
+        reducer_embeddings,
+        production,
+        workers,
+        threads,
+        lod_points,
+        figure_cache,
+        clientside,
+        data_preprocessor,
+    ) = setup(parser, requests_pathname_prefix)
 
-    # don't start server if html is needed
+    from src.callbacks import get_callbacks, get_callbacks_pdb
+    from src.server import memory_footprint
+
+    # don't register callbacks if html is needed
     if not html:
+        # progressive jobs are held by the worker which started them, the
+        # polls of the browser can reach another worker
+        if production and workers > 1:
+            print(
+                "Progressive recalculations are switched off, they need a"
+                " single worker process"
+            )
+            switch = app.layout["progressive_switch"]
+            switch.disabled = True
+            switch.label += " (needs a single worker)"
+
+        # workers map one copy of the arrays instead of holding their own
+        if production:
+            from src.server import share_arrays
+
+            embeddings, distance_dic = share_arrays(
+                output_d, hdf_path.stem, embeddings, distance_dic
+            )
+
         # different callbacks for different layout
+        get_callbacks(
+            app,
+            df,
+            orig_id_col,
+            umap_paras,
+            tsne_paras,
+            output_d,
+            csv_header,
+            embeddings,
+            embedding_uids,
+            distance_dic,
+            umap_paras_dict,
+            tsne_paras_dict,
+            fasta_dict,
+            struct_container,
+            reducer_embeddings,
+            lod_points,
+            data_preprocessor,
+            figure_cache,
+            prewarm=True,
+            production=production,
+            clientside=clientside,
+        )
         if struct_container.pdb_flag:
-            get_callbacks(
-                app,
-                df,
-                orig_id_col,
-                umap_paras,
-                tsne_paras,
-                output_d,
-                csv_header,
-                embeddings,
-                embedding_uids,
-                distance_dic,
-                umap_paras_dict,
-                tsne_paras_dict,
-                fasta_dict,
-                struct_container,
-            )
             get_callbacks_pdb(app, df, struct_container, orig_id_col)
-        else:
-            get_callbacks(
-                app,
-                df,
-                orig_id_col,
-                umap_paras,
-                tsne_paras,
-                output_d,
-                csv_header,
-                embeddings,
-                embedding_uids,
-                distance_dic,
-                umap_paras_dict,
-                tsne_paras_dict,
-                fasta_dict,
-                struct_container,
-            )
 
-        app.run_server(debug=True, port=port)
+        # compile the UMAP kernels before the first recalculation. gunicorn
+        # workers are forked from this process and inherit the compiled code,
+        # so the warm-up has to finish before.
+        from src.reducers import start_umap_warm_up
+
+        start_umap_warm_up(
+            umap_paras, reducer_embeddings, background=not production
+        )
+
+    nbytes = memory_footprint(
+        df, embeddings, distance_dic, None if html else figure_cache
+    )
+
+    return app, html, port, production, workers, threads, nbytes
+
+
+def main():
+    """
+    Most general processing of the script
+    :return: None
+    """
+    # build the caches of datasets without starting the server
+    if len(sys.argv) > 1 and sys.argv[1] == "precompute":
+        from src.precompute import main as precompute_main
+
+        precompute_main(sys.argv[2:])
+        return
+
+    parser = Parser()
+
+    # before numba is imported, the reducer processes inherit the variable
+    if parser.output_d is not None:
+        from src.reducers import set_numba_cache_dir
+
+        set_numba_cache_dir(parser.output_d)
+
+    # several datasets served by one process
+    if parser.datasets is not None:
+        from src.multiserver import run_multi_dataset_server
+
+        run_multi_dataset_server(
+            parser.datasets,
+            parser.memory_budget,
+            parser.port,
+            parser.production,
+            parser.workers,
+            parser.threads,
+            parser.verbose,
+        )
+        return
+
+    app, html, port, production, workers, threads, _ = get_application(parser)
+
+    # don't start server if html is needed
+    if not html:
+        if production:
+            from src.server import run_production_server
+
+            run_production_server(app.server, port, workers, threads)
+        else:
+            app.run_server(debug=True, port=port)
 
 
 if __name__ == "__main__":
@@ -2,29 +2,43 @@
 # -*- coding: utf-8 -*-
 
 import json
+import threading
 from pathlib import Path
 from statistics import mean
 
 import dash
-import dash_bio.utils.ngl_parser as ngl_parser
 import dash_bootstrap_components as dbc
 import numpy
 import numpy as np
 import plotly.graph_objects as go
-from dash import Input, Output, State, html
+from dash import ClientsideFunction, Input, Output, State, html
 from dash.exceptions import PreventUpdate
-from pandas import DataFrame
+from pandas import DataFrame, Index
 
 from scipy.spatial.distance import cdist, squareform
-from scipy.stats import spearmanr
 from itertools import groupby
-from sklearn.metrics import silhouette_score
-from sklearn.manifold import trustworthiness
 
-from src.preprocessing import DataPreprocessor
+# sklearn, scipy.stats, dash_bio and the preprocessing module (umap) are
+# imported on first use, so that starting the server stays fast
+from src.dataset import (
+    MULTIPLICITY_COLUMN,
+    DatasetSnapshot,
+    MetadataReloader,
+    get_axis_names,
+    string_to_tsne_paras,
+    string_to_umap_paras,
+    tsne_paras_to_string,
+    umap_paras_to_string,
+)
+from src.figurecache import FIGURE_CACHE_MB, PREWARM_COLUMNS, FigureCache
+from src.search import SearchIndex
+from src.spatial import SpatialIndexCache, view_region
 from src.structurecontainer import StructureContainer
 from src.visualization.visualizator import Visualizator
 
+# distance of the default camera of a 3D graph to its center
+DEFAULT_EYE_DISTANCE = float(np.linalg.norm([1.25, 1.25, 1.25]))
+
 
 def to_mapped_id(
     sel_original_seq_ids: list, original_id_col: list, df: DataFrame
@@ -32,18 +46,20 @@ def to_mapped_id(
     """
     Converts IDs from original to mapped
     :param sel_original_seq_ids: selected original sequence IDs
-    :param original_id_col: list of original IDs
+    :param original_id_col: list of original IDs, pass an Index to look up
+    many selections without rebuilding it
     :param df: Dataframe with all data
     :return: sequence IDs in mapped
     """
-    seq_ids = list()
+    if not isinstance(original_id_col, Index):
+        original_id_col = Index(original_id_col)
 
-    for seq_id in sel_original_seq_ids:
-        index_num = original_id_col.index(seq_id)
-        mapped_id = df.index[index_num]
-        seq_ids.append(mapped_id)
+    index_nums = original_id_col.get_indexer(sel_original_seq_ids)
+    if (index_nums < 0).any():
+        missing = sel_original_seq_ids[int(np.argmin(index_nums))]
+        raise Exception(f"{missing} is not an original ID")
 
-    return seq_ids
+    return df.index[index_nums].to_list()
 
 
 def to_original_id(
@@ -52,18 +68,17 @@ def to_original_id(
     """
     Converts IDs from mapped to original
     :param sel_mapped_seq_ids: selected mapped sequence IDs
-    :param original_id_col: list of original IDs
+    :param original_id_col: list of original IDs, pass an Index to look up
+    many selections without rebuilding it
     :param df: Dataframe with all data
     :return: sequence IDs in mapped
     """
-    seq_ids = list()
+    if not isinstance(original_id_col, Index):
+        original_id_col = Index(original_id_col)
 
-    for seq_id in sel_mapped_seq_ids:
-        index_num = df.index.get_indexer_for([seq_id])[0]
-        original_id = original_id_col[index_num]
-        seq_ids.append(original_id)
+    index_nums = df.index.get_indexer_for(sel_mapped_seq_ids)
 
-    return seq_ids
+    return original_id_col[index_nums].to_list()
 
 
 def handle_highlighting(
@@ -215,6 +230,10 @@ def get_callbacks_pdb(
     :param original_id_col: list with original IDs
     :return: None
     """
+    # looked up for every selection
+    original_ids = None
+    if original_id_col is not None:
+        original_ids = Index(original_id_col)
 
     @app.callback(
         Output("ngl_molecule_viewer", "data"),
@@ -274,7 +293,7 @@ def get_callbacks_pdb(
         saved_seq_ids = list()
         if dd_molecules is not None:
             if original_id_col is not None:
-                seq_ids = to_mapped_id(dd_molecules, original_id_col, df)
+                seq_ids = to_mapped_id(dd_molecules, original_ids, df)
             else:
                 seq_ids = dd_molecules
 
@@ -317,6 +336,8 @@ def get_callbacks_pdb(
             seq_ids, struct_container, range_start, range_end, selected_atoms
         )
 
+        import dash_bio.utils.ngl_parser as ngl_parser
+
         # data format for molecule viewer
         data_list = [
             ngl_parser.get_data(
@@ -336,7 +357,7 @@ def get_callbacks_pdb(
         mapped_seq_ids = seq_ids
         if original_id_col is not None:
             # back to original IDs
-            seq_ids = to_original_id(seq_ids, original_id_col, df)
+            seq_ids = to_original_id(seq_ids, original_ids, df)
 
         # enable download button at first protein selection
         download_disabled = False
@@ -567,6 +588,13 @@ def get_callbacks(
     tsne_paras_dict: dict,
     fasta_dict: dict,
     struct_container: StructureContainer,
+    reducer_embeddings: np.ndarray = None,
+    lod_points: int = 0,
+    data_preprocessor=None,
+    figure_cache_mb: float = FIGURE_CACHE_MB,
+    prewarm: bool = False,
+    production: bool = False,
+    clientside: bool = False,
 ):
     """
     General callbacks needed for application
@@ -583,11 +611,441 @@ def get_callbacks(
     :param umap_paras_dict: already calculated UMAP parameters and their coordinates
     :param fasta_dict: fasta file in dictionary format
     :param struct_container: the structure container handling files
+    :param reducer_embeddings: input of UMAP and t-SNE recalculations, e.g.
+    the embeddings reduced with PCA, the embeddings if None
+    :param lod_points: approximate number of points sent to the browser, 0
+    sends all points
+    :param data_preprocessor: reads the metadata again when its file has
+    changed and stores new projections, neither is done if None
+    :param figure_cache_mb: memory of the rendered figures kept for all
+    sessions in MB, 0 renders every figure
+    :param prewarm: render the figures of the first columns after the start
+    :param production: render them before the workers are forked instead of
+    in a background thread
+    :param clientside: recolor the graph and switch between 3D and 2D in the
+    browser, not used with a level of detail
     :return:
     """
+    if reducer_embeddings is None:
+        reducer_embeddings = embeddings
+
+    # looked up for every selection, e.g. box and lasso selections
+    original_ids = None
+    if original_id_col is not None:
+        original_ids = Index(original_id_col)
+
+    # read-only data shared by all sessions, see DatasetSnapshot
+    if data_preprocessor is None:
+        dataset = DatasetSnapshot(df, umap_paras_dict, tsne_paras_dict)
+    else:
+        # projections of other workers are read from the projection file
+        dataset = DatasetSnapshot(
+            df,
+            umap_paras_dict,
+            tsne_paras_dict,
+            data_preprocessor.save_projection,
+            lambda kind, paras_string: data_preprocessor.load_projection(
+                kind, paras_string, embedding_uids
+            ),
+        )
+
+    # level-of-detail views are sampled by the server for every column
+    clientside = clientside and lod_points <= 0
+
+    # rendered figures shared by all sessions, see render_figure
+    figure_cache = FigureCache(figure_cache_mb)
+
+    # the molecules dropdown menu gets its options from searches
+    search_index = SearchIndex(
+        df.index.to_list() if original_id_col is None else original_id_col
+    )
+
+    metadata_reloader = None
+    if data_preprocessor is not None:
+        metadata_reloader = MetadataReloader(
+            dataset,
+            csv_header,
+            data_preprocessor.csv_path,
+            data_preprocessor.read_metadata,
+            on_change=figure_cache.invalidate,
+        )
+
+    def warm_start_coords(coords_df: DataFrame):
+        """
+        Brings the coordinates of a layout into the order of the embeddings
+        :param coords_df: coordinates indexed by UID
+        :return: reordered coordinates, None if not all embeddings are covered
+        """
+        init_df = coords_df.reindex(embedding_uids)
+        if init_df.isna().any(axis=None):
+            return None
+
+        return init_df
+
+    def umap_recalculation_paras(
+        n_neighbours: int,
+        min_dist: float,
+        metric: str,
+        umap_mode: str,
+        warm_start: bool,
+        umap_paras_dd_value: str,
+    ):
+        """
+        Parameters of a UMAP recalculation requested in the graph settings
+        :param n_neighbours: UMAP value n_neighbours
+        :param min_dist: UMAP value min_dist
+        :param metric: UMAP value metric
+        :param umap_mode: exact or fast UMAP calculation
+        :param warm_start: start from the displayed layout
+        :param umap_paras_dd_value: key of the displayed UMAP projection
+        :return: UMAP parameters and the coordinates to start from or None
+        """
+        # coordinates of the displayed layout in the order of the embeddings
+        init_df = None
+        if warm_start:
+            init_df = warm_start_coords(umap_paras_dict[umap_paras_dd_value])
+
+        session_umap_paras = dict(
+            n_neighbours=n_neighbours,
+            min_dist=min_dist,
+            metric=metric,
+            mode=umap_mode,
+            threads=umap_paras.get("threads", 0),
+            warm_start=init_df is not None,
+            pre_reduction=umap_paras.get("pre_reduction", 0),
+        )
+
+        return session_umap_paras, init_df
+
+    def tsne_recalculation_paras(
+        iterations: int,
+        perplexity: int,
+        learning_rate: str,
+        tsne_metric: str,
+        warm_start: bool,
+        tsne_paras_dd_value: str,
+    ):
+        """
+        Parameters of a t-SNE recalculation requested in the graph settings
+        :param iterations: t-SNE value iterations
+        :param perplexity: t-SNE value perplexity
+        :param learning_rate: t-SNE value learning rate, a number or auto
+        :param tsne_metric: t-SNE value metric
+        :param warm_start: start from the displayed layout
+        :param tsne_paras_dd_value: key of the displayed t-SNE projection
+        :return: t-SNE parameters and the coordinates to start from or None
+        """
+        # check whether learning rate is auto or a number
+        learning_rate = learning_rate.replace(",", ".")
+        try:
+            learning_rate = float(learning_rate)
+        except ValueError:
+            if learning_rate != "auto":
+                raise PreventUpdate
+
+        init_df = None
+        if warm_start:
+            init_df = warm_start_coords(tsne_paras_dict[tsne_paras_dd_value])
+
+        session_tsne_paras = dict(
+            iterations=iterations,
+            perplexity=perplexity,
+            learning_rate=learning_rate,
+            tsne_metric=tsne_metric,
+            backend=tsne_paras.get("backend", "sklearn"),
+            warm_start=init_df is not None,
+            pre_reduction=tsne_paras.get("pre_reduction", 0),
+        )
+
+        return session_tsne_paras, init_df
+
+    # spatial indexes over the displayed layouts for level-of-detail views,
+    # selections and clicks
+    spatial_indexes = SpatialIndexCache()
+
+    def spatial_index(
+        session_df: DataFrame,
+        dim_red: str,
+        two_d: bool,
+        umap_paras_string: str,
+        tsne_paras_string: str,
+    ):
+        """
+        Spatial index over the displayed coordinates, built once per layout
+        and rebuilt if the coordinates of the projection are replaced
+        :param session_df: dataframe with the coordinates of the session
+        :param dim_red: displayed dimensionality reduction
+        :param two_d: whether the 2D coordinates are displayed
+        :param umap_paras_string: key of the displayed UMAP projection
+        :param tsne_paras_string: key of the displayed t-SNE projection
+        :return: spatial index, its rows are the rows of session_df
+        """
+        key, source = projection_source(
+            dim_red, two_d, umap_paras_string, tsne_paras_string
+        )
+
+        return spatial_indexes.get(
+            key, source, session_df[get_axis_names(dim_red, two_d)].to_numpy()
+        )
+
+    def projection_source(
+        dim_red: str,
+        two_d: bool,
+        umap_paras_string: str,
+        tsne_paras_string: str,
+    ):
+        """
+        Identifies the displayed projection
+        :param dim_red: displayed dimensionality reduction
+        :param two_d: whether the 2D coordinates are displayed
+        :param umap_paras_string: key of the displayed UMAP projection
+        :param tsne_paras_string: key of the displayed t-SNE projection
+        :return: key of the projection and the object holding its
+        coordinates, which is replaced when they are recalculated
+        """
+        if dim_red == "UMAP":
+            key = (dim_red, two_d, umap_paras_string)
+            source = umap_paras_dict[umap_paras_string]
+        elif dim_red == "TSNE":
+            key = (dim_red, two_d, tsne_paras_string)
+            source = tsne_paras_dict[tsne_paras_string]
+        else:
+            key = (dim_red, two_d, None)
+            source = dataset.pca_coords
+
+        return key, source
+
+    def render_figure(
+        selected_value: str,
+        dim_red: str,
+        two_d: bool,
+        umap_paras_string: str,
+        tsne_paras_string: str,
+        download: bool = False,
+        quantile_symbols: bool = False,
+        session_df: DataFrame = None,
+    ):
+        """
+        Renders the graph of a column and projection, or copies it from the
+        figures rendered before by any session
+        :param selected_value: column the graph is colored by
+        :param dim_red: displayed dimensionality reduction
+        :param two_d: whether the 2D coordinates are displayed
+        :param umap_paras_string: key of the displayed UMAP projection
+        :param tsne_paras_string: key of the displayed t-SNE projection
+        :param download: rendered for downloading, with all points
+        :param quantile_symbols: mark the quartiles of a numeric column with
+        symbols
+        :param session_df: dataframe with the column and the coordinates of
+        the projections, built if None
+        :return: plotly graphical object, the caller may modify it
+        """
+        projection_key, source = projection_source(
+            dim_red, two_d, umap_paras_string, tsne_paras_string
+        )
+        key = (selected_value,) + projection_key
+        key += (download, quantile_symbols)
+        fig = figure_cache.get(key, source)
+        if fig is not None:
+            return fig
+
+        # a metadata reload replaces the dataframe while rendering
+        df_rendered = dataset.df
+        if session_df is None:
+            session_df = dataset.frame(
+                [selected_value], umap_paras_string, tsne_paras_string
+            )
+
+        max_points = 0 if download else lod_points
+        index = None
+        if 0 < max_points < len(session_df):
+            index = spatial_index(
+                session_df,
+                dim_red,
+                two_d,
+                umap_paras_string,
+                tsne_paras_string,
+            )
+
+        fig = Visualizator.render(
+            session_df,
+            selected_column=selected_value,
+            original_id_col=original_id_col,
+            dim_red=dim_red,
+            umap_paras=string_to_umap_paras(umap_paras_string),
+            tsne_paras=string_to_tsne_paras(tsne_paras_string),
+            two_d=two_d,
+            download=download,
+            max_points=max_points,
+            index=index,
+            quantile_symbols=quantile_symbols,
+        )
+
+        if dataset.df is df_rendered:
+            figure_cache.put(key, source, fig)
+
+        return fig
+
+    def prewarm_figures():
+        """
+        Renders the 3D and 2D graphs of the first columns of the dropdown
+        menu with the initial projections, until half of the memory budget is
+        used
+        """
+        if data_preprocessor is not None:
+            initial_dim_red = data_preprocessor.dim_red
+        else:
+            initial_dim_red = "UMAP"
+        umap_paras_string = umap_paras_to_string(umap_paras)
+        tsne_paras_string = tsne_paras_to_string(tsne_paras)
+
+        for header in list(csv_header[:PREWARM_COLUMNS]):
+            for two_d in [False, True]:
+                if figure_cache.nbytes > figure_cache.max_bytes / 2:
+                    return
+                render_figure(
+                    header,
+                    initial_dim_red,
+                    two_d,
+                    umap_paras_string,
+                    tsne_paras_string,
+                )
+
+    if prewarm and figure_cache.max_bytes > 0:
+        if production:
+            # the workers are forked from this process afterwards
+            prewarm_figures()
+        else:
+            threading.Thread(target=prewarm_figures, daemon=True).start()
+
+    def selected_rows(selected_data: dict, index):
+        """
+        Rows of a box or lasso selection in the 2D graph. All points of the
+        layout are selected, also the ones a level-of-detail view leaves out.
+        :param selected_data: selection of the graph
+        :param index: spatial index of the displayed layout
+        :return: rows of the selected points
+        """
+        if "range" in selected_data:
+            x_range = sorted(selected_data["range"]["x"])
+            y_range = sorted(selected_data["range"]["y"])
+            return index.region(
+                [x_range[0], y_range[0]], [x_range[1], y_range[1]]
+            )
+        if "lassoPoints" in selected_data:
+            lasso = selected_data["lassoPoints"]
+            return index.polygon(np.column_stack([lasso["x"], lasso["y"]]))
+
+        return np.empty(0, dtype=int)
+
+    @app.callback(
+        Output("dd_menu", "options"),
+        Output("dd_menu", "value"),
+        Output("metadata_version", "data"),
+        Input("metadata_interval", "n_intervals"),
+        Input("metadata_reload_button", "n_clicks"),
+        State("metadata_version", "data"),
+        State("dd_menu", "value"),
+    )
+    def reload_metadata(
+        n_intervals: int,
+        n_clicks: int,
+        metadata_version: dict,
+        selected_value: str,
+    ):
+        """
+        Checks the metadata file for changes and reads it again, the
+        coordinates and embeddings are kept. The columns of the dropdown menu
+        are updated and the graph is rendered again if its column changed.
+        :param n_intervals: number of checks
+        :param n_clicks: reload button, reads the file even if it seems
+        unchanged
+        :param metadata_version: metadata version of the session and the
+        columns changed by the last reload
+        :param selected_value: selected group in dropdown menu
+        :return: columns of the dropdown menu, its value and the new version
+        """
+        if metadata_reloader is None:
+            raise PreventUpdate
+
+        ctx = dash.callback_context
+        force = ctx.triggered_id == "metadata_reload_button"
+        version = metadata_reloader.reload(force)
+        if version == metadata_version["version"]:
+            raise PreventUpdate
+
+        changed = metadata_reloader.changed_since(metadata_version["version"])
+        options = list(csv_header)
+        value = selected_value
+        if value not in options:
+            value = options[0]
+
+        return options, value, dict(version=version, changed=changed)
 
     @app.callback(
-        Output("graph", "figure"),
+        Output("lod_region", "data"),
+        Input("graph", "relayoutData"),
+        State("lod_region", "data"),
+    )
+    def update_lod_region(relayout_data: dict, lod_region: dict):
+        """
+        Stores the zoom of the graph for level-of-detail views. Rotating a 3D
+        graph or changing the dragmode doesn't change the stored zoom, so the
+        graph isn't rendered again.
+        :param relayout_data: changes of the graph layout
+        :param lod_region: stored zoom
+        :return: x and y ranges (2D) or center and zoom of the camera (3D),
+        None if zoomed out
+        """
+        if lod_points <= 0 or not relayout_data:
+            raise PreventUpdate
+
+        if "scene.camera" in relayout_data:
+            camera = relayout_data["scene.camera"]
+            center = camera.get("center", dict(x=0, y=0, z=0))
+            center = [center[axis] for axis in ["x", "y", "z"]]
+            eye = [camera["eye"][axis] for axis in ["x", "y", "z"]]
+            zoom = np.linalg.norm(np.subtract(eye, center))
+            region = dict(
+                center=[round(value, 2) for value in center],
+                zoom=round(float(zoom) / DEFAULT_EYE_DISTANCE, 2),
+            )
+        elif "xaxis.autorange" in relayout_data or "autosize" in relayout_data:
+            region = None
+        else:
+            # zooming along one axis keeps the range of the other
+            region = dict()
+            if lod_region is not None and "zoom" not in lod_region:
+                region = dict(lod_region)
+            for axis in ["x", "y"]:
+                if f"{axis}axis.range[0]" in relayout_data:
+                    region[axis] = [
+                        relayout_data[f"{axis}axis.range[0]"],
+                        relayout_data[f"{axis}axis.range[1]"],
+                    ]
+                elif f"{axis}axis.range" in relayout_data:
+                    region[axis] = relayout_data[f"{axis}axis.range"]
+            if not region:
+                raise PreventUpdate
+
+        if region == lod_region:
+            raise PreventUpdate
+
+        return region
+
+    # with clientside, the browser recolors the graph and switches its
+    # dimension, see display_figure. The figures of the server are passed on.
+    if clientside:
+        figure_output = Output("rendered_figure", "data")
+        column_dependency = State("dd_menu", "value")
+        dim_dependency = State("dim_radio", "value")
+    else:
+        figure_output = Output("graph", "figure")
+        column_dependency = Input("dd_menu", "value")
+        dim_dependency = Input("dim_radio", "value")
+
+    @app.callback(
+        figure_output,
         Output("n_neighbours_input", "disabled"),
         Output("min_dist_input", "disabled"),
         Output("metric_input", "disabled"),
@@ -610,7 +1068,7 @@ def get_callbacks(
         Output("load_graph_spinner", "children"),
         Output("molecules_dropdown", "value"),
         Output("clicked_mol_storage", "data"),
-        Input("dd_menu", "value"),
+        column_dependency,
         Input("dim_red_tabs", "active_tab"),
         Input("n_neighbours_input", "value"),
         Input("min_dist_input", "value"),
@@ -624,13 +1082,21 @@ def get_callbacks(
         Input("tsne_recalculation_button", "n_clicks"),
         Input("last_tsne_paras_dd", "value"),
         Input("graph", "clickData"),
+        Input("graph", "selectedData"),
         Input("highlighting_bool", "data"),
         Input("relayoutData_save", "data"),
-        Input("dim_radio", "value"),
+        dim_dependency,
         Input("molecules_dropdown", "value"),
         Input("clicked_mol_storage", "data"),
+        Input("progressive_result", "data"),
+        Input("lod_region", "data"),
+        Input("metadata_version", "data"),
+        Input("quantile_symbols_switch", "value"),
         State("graph", "figure"),
         State("graph", "relayoutData"),
+        State("umap_mode_radio", "value"),
+        State("warm_start_switch", "value"),
+        State("progressive_switch", "value"),
     )
     def update_graph(
         selected_value: str,
@@ -647,13 +1113,21 @@ def get_callbacks(
         tsne_recal_button_clicks: int,
         tsne_paras_dd_value: str,
         click_data: dict,
+        selected_data: dict,
         highlighting_bool: bool,
         relayout_data_save: dict,
         dim: str,
         dd_molecules: list,
         last_clicked_mol: str,
+        progressive_result: dict,
+        lod_region: dict,
+        metadata_version: dict,
+        quantile_symbols: bool,
         fig: go.Figure,
         relayout_data: dict,
+        umap_mode: str,
+        warm_start: bool,
+        progressive: bool,
     ):
         """
         Handles updating the graph when another group is selected, dimensionality reduction has changed,
@@ -666,25 +1140,47 @@ def get_callbacks(
         :param recal_button_clicks: Button for recalculating UMAP with new values and applying these.
         :param umap_paras_dd_value: selected UMAP parameters of already calculated ones
         :param click_data: data received from clicking the graph
+        :param selected_data: box or lasso selection of the 2D graph
         :param highlighting_bool: boolean indicating whether highlighting circle is already displayed or not
         :param relayout_data_save: relayout dict of the last click, needed for buggy plotly
         :param fig: graph Figure
         :param relayout_data: scene data of the graph
         :param dim: chosen dimension, 2D or 3D
+        :param umap_mode: exact or fast UMAP calculation
+        :param warm_start: start recalculations from the displayed layout
+        :param progressive_result: kind and key of a finished progressive
+        recalculation, the key is None if it was cancelled
+        :param progressive: recalculations run in the background and show
+        their intermediate layouts
+        :param lod_region: zoom of the graph for level-of-detail views, see
+        update_lod_region
+        :param metadata_version: version of the metadata and the columns
+        changed by the last reload, see reload_metadata
+        :param quantile_symbols: mark the quartiles of numeric columns with
+        symbols
         :return: Output variables
         """
 
-        def is_number(s):
-            try:
-                float(s)
-                return True
-            except ValueError:
-                return False
-
         # Check whether an input is triggered
         ctx = dash.callback_context
         if not ctx.triggered:
             raise PreventUpdate
+        # the graph triggers with clicks and selections
+        triggered_prop = ctx.triggered[0]["prop_id"]
+        clicked = triggered_prop == "graph.clickData"
+        selected = triggered_prop == "graph.selectedData"
+
+        # a cleared selection keeps the selected molecules
+        if selected and not selected_data:
+            raise PreventUpdate
+
+        # progressive recalculations are started by start_progressive_job and
+        # displayed once they are finished
+        if progressive and ctx.triggered_id in [
+            "umap_recalculation_button",
+            "tsne_recalculation_button",
+        ]:
+            raise PreventUpdate
 
         disable_recal_umap_button_return = (
             dash.no_update,
@@ -768,8 +1264,14 @@ def get_callbacks(
         if selected_value is None:
             raise PreventUpdate
 
-        # load df into inner scope so that it can be modified
-        nonlocal df
+        # the metadata was reloaded, the graph is outdated if its column changed
+        # or was removed, which changes the value of the dropdown menu as well
+        if (
+            ctx.triggered_id == "metadata_version"
+            and len(ctx.triggered) == 1
+            and selected_value not in metadata_version["changed"]
+        ):
+            raise PreventUpdate
 
         # If plotly relayoutData is bugged and dict is empty for a reason, use last saved relayoutData
         if not relayout_data or "scene.camera" not in relayout_data:
@@ -779,18 +1281,18 @@ def get_callbacks(
         seq_ids = list()
         if dd_molecules is not None:
             if original_id_col is not None:
-                seq_ids = to_mapped_id(dd_molecules, original_id_col, df)
+                seq_ids = to_mapped_id(dd_molecules, original_ids, df)
             else:
                 seq_ids = dd_molecules
 
         # triggered by click on graph
         clicked_seq_id = last_clicked_mol
-        if ctx.triggered_id == "graph":
+        if clicked:
             clicked_seq_id = clickdata_to_seqid(click_data)
 
             if original_id_col is not None:
                 clicked_seq_id = to_mapped_id(
-                    [clicked_seq_id], original_id_col, df
+                    [clicked_seq_id], original_ids, df
                 )[0]
 
             # Add to seq ids or replace last clicked molecule
@@ -801,6 +1303,26 @@ def get_callbacks(
                     if value == last_clicked_mol:
                         seq_ids[idx] = clicked_seq_id
 
+        # triggered by a box or lasso selection, resolved with the spatial index
+        if selected:
+            select_df = dataset.frame(
+                [], umap_paras_dd_value, tsne_paras_dd_value
+            )
+            index = spatial_index(
+                select_df,
+                dim_red,
+                dim == "2D",
+                umap_paras_dd_value,
+                tsne_paras_dd_value,
+            )
+            rows = selected_rows(selected_data, index)
+            known_ids = set(seq_ids)
+            seq_ids = seq_ids + [
+                seq_id
+                for seq_id in select_df.index[rows]
+                if seq_id not in known_ids
+            ]
+
         # triggered by the molecule dropdown menu
         if ctx.triggered_id == "molecules_dropdown":
             # set clicked sequence id to None if the selection was deleted in the dropdown menu
@@ -810,115 +1332,81 @@ def get_callbacks(
         mapped_seq_ids = seq_ids
         if original_id_col is not None:
             # back to original IDs
-            seq_ids = to_original_id(seq_ids, original_id_col, df)
+            seq_ids = to_original_id(seq_ids, original_ids, df)
 
         # convert dictionary state of graph figure into go object
         fig = go.Figure(fig)
 
-        umap_axis_names = ["x_umap_3D", "y_umap_3D", "z_umap_3D", "x_umap_2D", "y_umap_2D"]
-
-        # If umap parameters are selected in the dropdown menu
-        if ctx.triggered_id == "last_umap_paras_dd":
-            splits = umap_paras_dd_value.split(" ; ")
-            umap_paras["n_neighbours"] = int(splits[0])
-            umap_paras["min_dist"] = float(splits[1])
-            umap_paras["metric"] = splits[2]
-
-            df.drop(labels=umap_axis_names, axis="columns", inplace=True)
-            coords_df = umap_paras_dict[umap_paras_dd_value]
-            df = df.join(coords_df, how="left")
+        # The projection shown in this session is identified by the values of the
+        # parameter dropdown menus, which live in the browser. The shared
+        # dataframe and parameter dictionaries are never modified.
+        umap_paras_string = umap_paras_dd_value
+        tsne_paras_string = tsne_paras_dd_value
 
         # If UMAP parameters are changed and accepted
         if ctx.triggered_id == "umap_recalculation_button":
-            umap_paras["n_neighbours"] = n_neighbours
-            umap_paras["min_dist"] = min_dist
-            umap_paras["metric"] = metric
-
-            # String representation of the current UMAP parameters
-            umap_paras_string = (
-                str(n_neighbours) + " ; " + str(min_dist) + " ; " + metric
+            session_umap_paras, init_df = umap_recalculation_paras(
+                n_neighbours,
+                min_dist,
+                metric,
+                umap_mode,
+                warm_start,
+                umap_paras_dd_value,
             )
 
-            df.drop(labels=umap_axis_names, axis="columns", inplace=True)
-
-            df_umap = DataPreprocessor.generate_umap(embeddings, umap_paras)
-            df_umap.index = embedding_uids
-
-            df = df.join(df_umap, how="left")
-
-            coords_df = df[umap_axis_names]
-
-            umap_paras_dict[umap_paras_string] = coords_df
-        # String representation of UMAP parameters still to be created if not button used
-        else:
-            umap_paras_string = (
-                str(umap_paras["n_neighbours"])
-                + " ; "
-                + str(umap_paras["min_dist"])
-                + " ; "
-                + umap_paras["metric"]
-            )
+            # String representation of the current UMAP parameters
+            umap_paras_string = umap_paras_to_string(session_umap_paras)
 
-        tsne_axis_names = ["x_tsne_3D", "y_tsne_3D", "z_tsne_3D", "x_tsne_2D", "y_tsne_2D"]
+            # another session might have calculated these parameters already
+            if umap_paras_string not in umap_paras_dict:
+                from src.preprocessing import DataPreprocessor
 
-        # If umap parameters are selected in the dropdown menu
-        if ctx.triggered_id == "last_tsne_paras_dd":
-            splits = tsne_paras_dd_value.split(" ; ")
-            tsne_paras["iterations"] = int(splits[0])
-            tsne_paras["perplexity"] = float(splits[1])
-            tsne_paras["learning_rate"] = splits[2]
-            tsne_paras["tsne_metric"] = splits[3]
+                df_umap = DataPreprocessor.generate_umap(
+                    reducer_embeddings, session_umap_paras, init_df
+                )
+                df_umap.index = embedding_uids
 
-            df.drop(labels=tsne_axis_names, axis="columns", inplace=True)
-            coords_df = tsne_paras_dict[tsne_paras_dd_value]
-            df = df.join(coords_df, how="left")
+                dataset.add_umap(umap_paras_string, df_umap)
 
         if ctx.triggered_id == "tsne_recalculation_button":
-            # check whether learning rate is auto or a number
-            learning_rate = learning_rate.replace(",", ".")
-            if is_number(learning_rate):
-                learning_rate = float(learning_rate)
-            elif learning_rate != "auto":
-                raise PreventUpdate
-
-            tsne_paras["iterations"] = iterations
-            tsne_paras["perplexity"] = perplexity
-            tsne_paras["learning_rate"] = learning_rate
-            tsne_paras["tsne_metric"] = tsne_metric
+            session_tsne_paras, init_df = tsne_recalculation_paras(
+                iterations,
+                perplexity,
+                learning_rate,
+                tsne_metric,
+                warm_start,
+                tsne_paras_dd_value,
+            )
 
             # String representation of the current TSNE parameters
-            tsne_paras_string = (
-                str(iterations)
-                + " ; "
-                + str(perplexity)
-                + " ; "
-                + str(learning_rate)
-                + " ; "
-                + str(tsne_metric)
-            )
+            tsne_paras_string = tsne_paras_to_string(session_tsne_paras)
 
-            df.drop(labels=tsne_axis_names, axis="columns", inplace=True)
+            if tsne_paras_string not in tsne_paras_dict:
+                from src.preprocessing import DataPreprocessor
 
-            df_tsne = DataPreprocessor.generate_tsne(embeddings, tsne_paras)
-            df_tsne.index = embedding_uids
+                df_tsne = DataPreprocessor.generate_tsne(
+                    reducer_embeddings, session_tsne_paras, init_df
+                )
+                df_tsne.index = embedding_uids
 
-            df = df.join(df_tsne, how="left")
+                dataset.add_tsne(tsne_paras_string, df_tsne)
 
-            coords_df = df[tsne_axis_names]
+        if (
+            ctx.triggered_id == "progressive_result"
+            and progressive_result["key"] is not None
+        ):
+            if progressive_result["kind"] == "umap":
+                umap_paras_string = progressive_result["key"]
+            else:
+                tsne_paras_string = progressive_result["key"]
 
-            tsne_paras_dict[tsne_paras_string] = coords_df
+        session_umap_paras = string_to_umap_paras(umap_paras_string)
+        session_tsne_paras = string_to_tsne_paras(tsne_paras_string)
 
-        # String representation still needed if not button used
-        else:
-            tsne_paras_string = (
-                str(tsne_paras["iterations"])
-                + " ; "
-                + str(tsne_paras["perplexity"])
-                + " ; "
-                + str(tsne_paras["learning_rate"])
-                + " ; "
-                + str(tsne_paras["tsne_metric"])
-            )
+        # coordinates of this session's projections together with the selected group
+        session_df = dataset.frame(
+            [selected_value], umap_paras_string, tsne_paras_string
+        )
 
         if dim == "2D":
             two_d = True
@@ -933,18 +1421,65 @@ def get_callbacks(
             or ctx.triggered_id == "last_umap_paras_dd"
             or ctx.triggered_id == "last_tsne_paras_dd"
             or ctx.triggered_id == "dim_radio"
+            or ctx.triggered_id == "progressive_result"
+            or ctx.triggered_id == "lod_region"
+            or ctx.triggered_id == "metadata_version"
+            or ctx.triggered_id == "quantile_symbols_switch"
         ):
-            fig = Visualizator.render(
-                df,
-                selected_column=selected_value,
-                original_id_col=original_id_col,
-                dim_red=dim_red,
-                umap_paras=umap_paras,
-                tsne_paras=tsne_paras,
-                two_d=two_d,
-            )
-            # Set highlighting_bool to False since new graph is displayed and highlighting circle is removed
-            highlighting_bool = False
+            # zoomed regions are filled in, other changes reset the zoom
+            if ctx.triggered_id == "lod_region":
+                if not 0 < lod_points < len(session_df):
+                    raise PreventUpdate
+                index = spatial_index(
+                    session_df,
+                    dim_red,
+                    two_d,
+                    umap_paras_string,
+                    tsne_paras_string,
+                )
+                region = view_region(lod_region, index.lower, index.upper)
+                highlight_traces = [
+                    trace for trace in fig.data if trace.hoverinfo == "skip"
+                ]
+
+                fig = Visualizator.render(
+                    session_df,
+                    selected_column=selected_value,
+                    original_id_col=original_id_col,
+                    dim_red=dim_red,
+                    umap_paras=session_umap_paras,
+                    tsne_paras=session_tsne_paras,
+                    two_d=two_d,
+                    max_points=lod_points,
+                    region=region,
+                    index=index,
+                    quantile_symbols=quantile_symbols,
+                )
+            else:
+                fig = render_figure(
+                    selected_value,
+                    dim_red,
+                    two_d,
+                    umap_paras_string,
+                    tsne_paras_string,
+                    quantile_symbols=quantile_symbols,
+                    session_df=session_df,
+                )
+
+            if ctx.triggered_id == "lod_region":
+                # keep the view of the user
+                if two_d and lod_region is not None:
+                    if "x" in lod_region:
+                        fig.update_xaxes(range=lod_region["x"])
+                    if "y" in lod_region:
+                        fig.update_yaxes(range=lod_region["y"])
+                elif relayout_data and "scene.camera" in relayout_data:
+                    fig.update_layout(
+                        scene_camera=relayout_data["scene.camera"]
+                    )
+            else:
+                # Set highlighting_bool to False since new graph is displayed and highlighting circle is removed
+                highlighting_bool = False
 
         # Add traces with open circles that have no values, but will be filled if something has to be highlighted
         if dim == "3D":
@@ -1010,26 +1545,33 @@ def get_callbacks(
                 )
             )
 
+        # highlighted molecules of the previous level of detail
+        if ctx.triggered_id == "lod_region":
+            for trace, highlight_trace in zip(fig.data[-2:], highlight_traces):
+                trace.update(x=highlight_trace.x, y=highlight_trace.y)
+                if dim == "3D":
+                    trace.update(z=highlight_trace.z)
+
         # Molecule is selected in graph and highlighting trace is now filled with x, y and/or z
-        if ctx.triggered_id == "graph":
+        if clicked:
             seq_id = clickdata_to_seqid(click_data)
 
             if original_id_col is not None:
-                seq_id = to_mapped_id([seq_id], original_id_col, df)[0]
+                seq_id = to_mapped_id([seq_id], original_ids, df)[0]
 
             if dim == "3D":
                 if dim_red == "UMAP":
-                    x = df.at[seq_id, "x_umap_3D"]
-                    y = df.at[seq_id, "y_umap_3D"]
-                    z = df.at[seq_id, "z_umap_3D"]
+                    x = session_df.at[seq_id, "x_umap_3D"]
+                    y = session_df.at[seq_id, "y_umap_3D"]
+                    z = session_df.at[seq_id, "z_umap_3D"]
                 elif dim_red == "PCA":
-                    x = df.at[seq_id, "x_pca_3D"]
-                    y = df.at[seq_id, "y_pca_3D"]
-                    z = df.at[seq_id, "z_pca_3D"]
+                    x = session_df.at[seq_id, "x_pca_3D"]
+                    y = session_df.at[seq_id, "y_pca_3D"]
+                    z = session_df.at[seq_id, "z_pca_3D"]
                 else:
-                    x = df.at[seq_id, "x_tsne_3D"]
-                    y = df.at[seq_id, "y_tsne_3D"]
-                    z = df.at[seq_id, "z_tsne_3D"]
+                    x = session_df.at[seq_id, "x_tsne_3D"]
+                    y = session_df.at[seq_id, "y_tsne_3D"]
+                    z = session_df.at[seq_id, "z_tsne_3D"]
 
                 fig.update_traces(
                     x=[x],
@@ -1042,14 +1584,14 @@ def get_callbacks(
                 )
             else:
                 if dim_red == "UMAP":
-                    x = df.at[seq_id, "x_umap_2D"]
-                    y = df.at[seq_id, "y_umap_2D"]
+                    x = session_df.at[seq_id, "x_umap_2D"]
+                    y = session_df.at[seq_id, "y_umap_2D"]
                 elif dim_red == "PCA":
-                    x = df.at[seq_id, "x_pca_3D"]
-                    y = df.at[seq_id, "y_pca_3D"]
+                    x = session_df.at[seq_id, "x_pca_3D"]
+                    y = session_df.at[seq_id, "y_pca_3D"]
                 else:
-                    x = df.at[seq_id, "x_tsne_2D"]
-                    y = df.at[seq_id, "y_tsne_2D"]
+                    x = session_df.at[seq_id, "x_tsne_2D"]
+                    y = session_df.at[seq_id, "y_tsne_2D"]
 
                 fig.update_traces(
                     x=[x],
@@ -1071,7 +1613,7 @@ def get_callbacks(
             relayout_data_save = relayout_data
 
         # Process dropdown menu selection
-        if ctx.triggered_id == "molecules_dropdown":
+        if ctx.triggered_id == "molecules_dropdown" or selected:
             # Remove highlighting of clicked molecule if deselected in the dropdown menu
             if last_clicked_mol not in seq_ids and last_clicked_mol is not None:
                 if dim == "3D":
@@ -1094,62 +1636,25 @@ def get_callbacks(
                         overwrite=True,
                     )
 
-            x_coords = list()
-            y_coords = list()
-            if dim == "3D":
-                z_coords = list()
-
-                for seq_id in seq_ids:
-                    if seq_id != last_clicked_mol:
-                        if original_id_col is not None:
-                            seq_id = to_mapped_id([seq_id], original_id_col, df)[0]
-
-                            if dim_red == "UMAP":
-                                x_coords.append(df.at[seq_id, "x_umap_3D"])
-                                y_coords.append(df.at[seq_id, "y_umap_3D"])
-                                z_coords.append(df.at[seq_id, "z_umap_3D"])
-                            elif dim_red == "PCA":
-                                x_coords.append(df.at[seq_id, "x_pca_3D"])
-                                y_coords.append(df.at[seq_id, "y_pca_3D"])
-                                z_coords.append(df.at[seq_id, "z_pca_3D"])
-                            else:
-                                x_coords.append(df.at[seq_id, "x_tsne_3D"])
-                                y_coords.append(df.at[seq_id, "y_tsne_3D"])
-                                z_coords.append(df.at[seq_id, "z_tsne_3D"])
-
-                fig.update_traces(
-                    x=x_coords,
-                    y=y_coords,
-                    z=z_coords,
-                    selector=dict(
-                        marker_symbol="circle-open", marker_color="white"
-                    ),
-                    overwrite=True,
-                )
-            else:
-                for seq_id in seq_ids:
-                    if seq_id != last_clicked_mol:
-                        if original_id_col is not None:
-                            seq_id = to_mapped_id([seq_id], original_id_col, df)[0]
-
-                            if dim_red == "UMAP":
-                                x_coords.append(df.at[seq_id, "x_umap_2D"])
-                                y_coords.append(df.at[seq_id, "y_umap_2D"])
-                            elif dim_red == "PCA":
-                                x_coords.append(df.at[seq_id, "x_pca_3D"])
-                                y_coords.append(df.at[seq_id, "y_pca_3D"])
-                            else:
-                                x_coords.append(df.at[seq_id, "x_tsne_2D"])
-                                y_coords.append(df.at[seq_id, "y_tsne_2D"])
-
-                fig.update_traces(
-                    x=x_coords,
-                    y=y_coords,
-                    selector=dict(
-                        marker_symbol="circle-open", marker_color="white"
-                    ),
-                    overwrite=True,
+            # selected molecules except the clicked one, looked up at once
+            highlight_ids = [
+                seq_id for seq_id in seq_ids if seq_id != last_clicked_mol
+            ]
+            if original_id_col is not None:
+                highlight_ids = to_mapped_id(
+                    highlight_ids, original_ids, df
                 )
+            coords = session_df.loc[
+                highlight_ids, get_axis_names(dim_red, dim == "2D")
+            ].to_numpy()
+
+            fig.update_traces(
+                dict(zip(["x", "y", "z"], coords.T.tolist())),
+                selector=dict(
+                    marker_symbol="circle-open", marker_color="white"
+                ),
+                overwrite=True,
+            )
 
         # Disable UMAP parameter input or not?
         disabled = False
@@ -1164,14 +1669,14 @@ def get_callbacks(
             list(umap_paras_dict.keys()),
             disabled,
             disabled,
-            umap_paras["n_neighbours"],
-            umap_paras["min_dist"],
-            umap_paras["metric"],
+            session_umap_paras["n_neighbours"],
+            session_umap_paras["min_dist"],
+            session_umap_paras["metric"],
             umap_paras_string,
-            tsne_paras["iterations"],
-            tsne_paras["perplexity"],
-            tsne_paras["learning_rate"],
-            tsne_paras["tsne_metric"],
+            session_tsne_paras["iterations"],
+            session_tsne_paras["perplexity"],
+            session_tsne_paras["learning_rate"],
+            session_tsne_paras["tsne_metric"],
             tsne_paras_string,
             list(tsne_paras_dict.keys()),
             highlighting_bool,
@@ -1182,6 +1687,449 @@ def get_callbacks(
             clicked_seq_id,
         )
 
+    # progressive recalculations of this process and the rows of the traces
+    # they update, keyed by the job ID stored in the browser
+    progressive_jobs = dict()
+
+    # positions of the hover IDs of the graph in the embeddings
+    hover_ids = Index(df.index if original_id_col is None else original_id_col)
+    embedding_rows = Index(embedding_uids).get_indexer(df.index)
+
+    def trace_rows(fig: dict) -> list:
+        """
+        Rows of the embeddings shown by the traces of the displayed graph
+        :param fig: graph figure
+        :return: trace indices and the embedding rows of their points
+        """
+        rows = list()
+        for trace_idx, trace in enumerate(fig["data"]):
+            # the colorbar and highlighting traces have no IDs
+            text = trace.get("text")
+            if not text:
+                continue
+            rows.append(
+                (trace_idx, embedding_rows[hover_ids.get_indexer(text)])
+            )
+
+        return rows
+
+    def start_progressive_job(kind: str, paras: dict, init_df: DataFrame, fig):
+        """
+        Starts a recalculation in the background, parameters that are already
+        calculated are displayed right away
+        :param kind: umap or tsne
+        :param paras: parameters of the recalculation
+        :param init_df: coordinates to start from or None
+        :param fig: graph figure, its traces are updated while calculating
+        :return: Output variables of handle_progressive_job
+        """
+        if kind == "umap":
+            paras_string = umap_paras_to_string(paras)
+            calculated = paras_string in umap_paras_dict
+        else:
+            paras_string = tsne_paras_to_string(paras)
+            calculated = paras_string in tsne_paras_dict
+
+        if calculated:
+            return (
+                None,
+                True,
+                False,
+                0,
+                True,
+                dict(kind=kind, key=paras_string),
+                dash.no_update,
+            )
+
+        from src.progressive import ProgressiveJob
+
+        job = ProgressiveJob(
+            kind, paras, paras_string, reducer_embeddings, init_df
+        )
+        progressive_jobs[job.job_id] = (job, trace_rows(fig))
+        job.start()
+
+        return (
+            job.job_id,
+            False,
+            True,
+            0,
+            False,
+            dash.no_update,
+            dash.no_update,
+        )
+
+    def poll_progressive_job(job_id: str, dim_red: str, dim: str):
+        """
+        Sends the latest intermediate layout of the running recalculation to
+        the browser, only the coordinates of the displayed traces are sent.
+        A finished recalculation is added to the projections.
+        :param job_id: ID of the running recalculation
+        :param dim_red: displayed dimensionality reduction
+        :param dim: displayed dimension, 2D or 3D
+        :return: Output variables of handle_progressive_job
+        """
+        job, rows = progressive_jobs[job_id]
+
+        if job.finished:
+            del progressive_jobs[job_id]
+
+            key = None
+            if job.result is not None:
+                job.result.index = embedding_uids
+                if job.kind == "umap":
+                    dataset.add_umap(job.paras_string, job.result)
+                else:
+                    dataset.add_tsne(job.paras_string, job.result)
+                key = job.paras_string
+            elif job.error is not None:
+                print(f"Recalculation failed: {job.error}")
+
+            return (
+                None,
+                True,
+                False,
+                100,
+                True,
+                dict(kind=job.kind, key=key),
+                dash.no_update,
+            )
+
+        progress = round(job.progress * 100)
+        layout = job.layouts[1 if dim == "2D" else 0]
+        if layout is None or dim_red.lower() != job.kind:
+            return (
+                dash.no_update,
+                False,
+                True,
+                progress,
+                dash.no_update,
+                dash.no_update,
+                dash.no_update,
+            )
+
+        coords = dict(traces=list(), x=list(), y=list(), z=list())
+        for trace_idx, rows_idx in rows:
+            coords["traces"].append(trace_idx)
+            coords["x"].append(layout[rows_idx, 0].tolist())
+            coords["y"].append(layout[rows_idx, 1].tolist())
+            if dim == "3D":
+                coords["z"].append(layout[rows_idx, 2].tolist())
+
+        return (
+            dash.no_update,
+            False,
+            True,
+            progress,
+            dash.no_update,
+            dash.no_update,
+            coords,
+        )
+
+    @app.callback(
+        Output("progressive_job", "data"),
+        Output("progressive_interval", "disabled"),
+        Output("progressive_collapse", "is_open"),
+        Output("progressive_progress", "value"),
+        Output("progressive_cancel_button", "disabled"),
+        Output("progressive_result", "data"),
+        Output("progressive_coords", "data"),
+        Input("umap_recalculation_button", "n_clicks"),
+        Input("tsne_recalculation_button", "n_clicks"),
+        Input("progressive_interval", "n_intervals"),
+        Input("progressive_cancel_button", "n_clicks"),
+        State("progressive_switch", "value"),
+        State("progressive_job", "data"),
+        State("n_neighbours_input", "value"),
+        State("min_dist_input", "value"),
+        State("metric_input", "value"),
+        State("umap_mode_radio", "value"),
+        State("last_umap_paras_dd", "value"),
+        State("iterations_input", "value"),
+        State("perplexity_input", "value"),
+        State("learning_rate_input", "value"),
+        State("tsne_metric_input", "value"),
+        State("last_tsne_paras_dd", "value"),
+        State("warm_start_switch", "value"),
+        State("dim_red_tabs", "active_tab"),
+        State("dim_radio", "value"),
+        State("graph", "figure"),
+        prevent_initial_call=True,
+    )
+    def handle_progressive_job(
+        umap_button: int,
+        tsne_button: int,
+        n_intervals: int,
+        cancel_button: int,
+        progressive: bool,
+        job_id: str,
+        n_neighbours: int,
+        min_dist: float,
+        metric: str,
+        umap_mode: str,
+        umap_paras_dd_value: str,
+        iterations: int,
+        perplexity: int,
+        learning_rate: str,
+        tsne_metric: str,
+        tsne_paras_dd_value: str,
+        warm_start: bool,
+        dim_red: str,
+        dim: str,
+        fig: dict,
+    ):
+        """
+        Runs recalculations in the background if the progressive mode is
+        switched on. The interval polls the intermediate layouts, the cancel
+        button stops the recalculation after its current step. Starting
+        another recalculation cancels the running one of the session.
+        :param umap_button: UMAP recalculation button
+        :param tsne_button: t-SNE recalculation button
+        :param n_intervals: ticks of the interval
+        :param cancel_button: cancel button below the graph
+        :param progressive: progressive mode switched on
+        :param job_id: ID of the running recalculation of the session
+        :param dim_red: displayed dimensionality reduction
+        :param dim: displayed dimension, 2D or 3D
+        :param fig: graph figure
+        :return: job ID, interval and progress bar settings, the result once
+        the recalculation is finished and the intermediate coordinates
+        """
+        ctx = dash.callback_context
+
+        if ctx.triggered_id == "progressive_interval":
+            if job_id not in progressive_jobs:
+                raise PreventUpdate
+            return poll_progressive_job(job_id, dim_red, dim)
+
+        if ctx.triggered_id == "progressive_cancel_button":
+            if job_id not in progressive_jobs:
+                raise PreventUpdate
+            progressive_jobs[job_id][0].cancel()
+            return (
+                dash.no_update,
+                dash.no_update,
+                dash.no_update,
+                dash.no_update,
+                True,
+                dash.no_update,
+                dash.no_update,
+            )
+
+        if not progressive:
+            raise PreventUpdate
+
+        if ctx.triggered_id == "umap_recalculation_button":
+            kind = "umap"
+            paras, init_df = umap_recalculation_paras(
+                n_neighbours,
+                min_dist,
+                metric,
+                umap_mode,
+                warm_start,
+                umap_paras_dd_value,
+            )
+            # optimized in steps, which gives a different layout
+            paras["progressive"] = True
+        else:
+            kind = "tsne"
+            paras, init_df = tsne_recalculation_paras(
+                iterations,
+                perplexity,
+                learning_rate,
+                tsne_metric,
+                warm_start,
+                tsne_paras_dd_value,
+            )
+
+        if job_id in progressive_jobs:
+            progressive_jobs.pop(job_id)[0].cancel()
+
+        return start_progressive_job(kind, paras, init_df, fig)
+
+    # moves the points of the displayed traces, the rest of the figure stays
+    app.clientside_callback(
+        """
+        function(coords) {
+            if (!coords || coords.traces.length === 0) {
+                return window.dash_clientside.no_update;
+            }
+            var graph = document.getElementById("graph");
+            var plot = graph.getElementsByClassName("js-plotly-plot")[0];
+            var update = {x: coords.x, y: coords.y};
+            if (coords.z.length > 0) {
+                update.z = coords.z;
+            }
+            Plotly.restyle(plot, update, coords.traces);
+            return "";
+        }
+        """,
+        Output("progressive_dummy", "children"),
+        Input("progressive_coords", "data"),
+    )
+
+    if clientside:
+        # columns are requested once, see assets/clientside.js
+        app.clientside_callback(
+            ClientsideFunction(
+                namespace="rostspace", function_name="request_column"
+            ),
+            Output("column_request", "data"),
+            Input("dd_menu", "value"),
+            Input("metadata_version", "data"),
+            Input("quantile_symbols_switch", "value"),
+        )
+
+        app.clientside_callback(
+            ClientsideFunction(
+                namespace="rostspace", function_name="display_figure"
+            ),
+            Output("graph", "figure"),
+            Input("rendered_figure", "data"),
+            Input("dd_menu", "value"),
+            Input("dim_radio", "value"),
+            Input("column_groups", "data"),
+            State("projection_points", "data"),
+            State("graph", "figure"),
+            prevent_initial_call=True,
+        )
+
+        @app.callback(
+            Output("column_groups", "data"),
+            Input("column_request", "data"),
+            State("quantile_symbols_switch", "value"),
+        )
+        def send_column_groups(column_request: dict, quantile_symbols: bool):
+            """
+            Sends the groups of a column to the browser, which recolors the
+            graph with them
+            :param column_request: requested column
+            :param quantile_symbols: mark the quartiles of numeric columns with
+            symbols
+            :return: group of every protein, in the order of the projection
+            points, and the style of the groups
+            """
+            if not column_request:
+                raise PreventUpdate
+            column = column_request["column"]
+            df_metadata = dataset.df
+            if column not in df_metadata.columns:
+                raise PreventUpdate
+
+            values = df_metadata[column]
+            codes, groups, coloraxis = Visualizator.group_points(
+                values, quantile_symbols
+            )
+            show_multiplicity = (
+                MULTIPLICITY_COLUMN in df_metadata.columns
+                and df_metadata[MULTIPLICITY_COLUMN].max() > 1
+            )
+
+            column_values = None
+            if coloraxis is not None:
+                # as it is serialized in the figures of the server
+                coloraxis = go.layout.Coloraxis(coloraxis).to_plotly_json()
+                column_values = (
+                    values.astype(object).where(values.notna(), None).tolist()
+                )
+
+            return dict(
+                column=column,
+                codes=codes.tolist(),
+                groups=groups,
+                coloraxis=coloraxis,
+                values=column_values,
+                hovertemplate=Visualizator.hovertemplate(
+                    column, show_multiplicity, False
+                ),
+                colored_hovertemplate=Visualizator.hovertemplate(
+                    column, show_multiplicity, True
+                ),
+            )
+
+        @app.callback(
+            Output("projection_points", "data"),
+            Input("dim_red_tabs", "active_tab"),
+            Input("last_umap_paras_dd", "value"),
+            Input("last_tsne_paras_dd", "value"),
+        )
+        def send_projection_points(
+            dim_red: str, umap_paras_string: str, tsne_paras_string: str
+        ):
+            """
+            Sends the 3D and 2D coordinates of the displayed projection to the
+            browser, once per projection
+            :param dim_red: displayed dimensionality reduction
+            :param umap_paras_string: key of the displayed UMAP projection
+            :param tsne_paras_string: key of the displayed t-SNE projection
+            :return: IDs, coordinates, multiplicity and the 3D and 2D layouts
+            """
+            session_df = dataset.frame([], umap_paras_string, tsne_paras_string)
+
+            ids = session_df.index.to_list()
+            if original_id_col is not None:
+                ids = list(original_id_col)
+
+            axes = dict()
+            layouts = dict()
+            for dim in ["3D", "2D"]:
+                axes[dim] = get_axis_names(dim_red, dim == "2D")
+                layout_fig = go.Figure()
+                Visualizator.style_layout(
+                    layout_fig,
+                    session_df,
+                    dim_red,
+                    string_to_umap_paras(umap_paras_string),
+                    string_to_tsne_paras(tsne_paras_string),
+                    dim == "2D",
+                )
+                layouts[dim] = layout_fig.layout.to_plotly_json()
+
+            coords = {
+                axis: np.round(session_df[axis].to_numpy(), 5).tolist()
+                for axis in set(axes["3D"] + axes["2D"])
+            }
+
+            multiplicity = None
+            if (
+                MULTIPLICITY_COLUMN in session_df.columns
+                and session_df[MULTIPLICITY_COLUMN].max() > 1
+            ):
+                multiplicity = session_df[MULTIPLICITY_COLUMN].tolist()
+
+            return dict(
+                ids=ids,
+                coords=coords,
+                axes=axes,
+                multiplicity=multiplicity,
+                layouts=layouts,
+            )
+
+    @app.callback(
+        Output("molecules_dropdown", "options"),
+        Input("molecules_dropdown", "search_value"),
+        Input("molecules_dropdown", "value"),
+    )
+    def search_molecules(search_value: str, dd_molecules: list):
+        """
+        Fills the molecules dropdown menu with the proteins matching the typed
+        text, instead of holding all IDs in the layout
+        :param search_value: text typed into the dropdown menu
+        :param dd_molecules: selected proteins
+        :return: selected proteins and the best matches of the search
+        """
+        selected = dd_molecules or []
+        # the dropdown menu removes selected values missing in its options
+        options = [dict(label=seq_id, value=seq_id) for seq_id in selected]
+        if not search_value:
+            return options
+
+        for option in search_index.search(search_value, dataset.df):
+            if option["value"] not in selected:
+                options.append(option)
+
+        return options
+
     @app.callback(
         Output("disclaimer_modal", "is_open"),
         Input("disclaimer_modal_button", "n_clicks"),
@@ -1227,14 +2175,24 @@ def get_callbacks(
 
     @app.callback(
         Output("graph_download_toast", "is_open"),
-        Input("dd_menu", "value"),
+        column_dependency,
         Input("graph_download_button", "n_clicks"),
         Input("button_graph_all", "n_clicks"),
         Input("dim_red_tabs", "active_tab"),
-        Input("dim_radio", "value"),
+        dim_dependency,
+        State("last_umap_paras_dd", "value"),
+        State("last_tsne_paras_dd", "value"),
+        State("quantile_symbols_switch", "value"),
     )
     def download_graph(
-        dd_value: str, button: int, all_button: int, dim_red: str, dim: str
+        dd_value: str,
+        button: int,
+        all_button: int,
+        dim_red: str,
+        dim: str,
+        umap_paras_string: str = None,
+        tsne_paras_string: str = None,
+        quantile_symbols: bool = False,
     ):
         """
         Creates file(s) of the graph with the selected group on button click and indicates this with an download toast
@@ -1242,6 +2200,10 @@ def get_callbacks(
         :param button: graph download button
         :param all_button: button indicating all groups should be downloaded
         :param dim_red: selected dimensionality reduction
+        :param umap_paras_string: UMAP projection displayed in this session
+        :param tsne_paras_string: t-SNE projection displayed in this session
+        :param quantile_symbols: mark the quartiles of numeric columns with
+        symbols
         :return: open download toast
         """
         # Check whether an input is triggered
@@ -1259,16 +2221,21 @@ def get_callbacks(
         else:
             two_d = False
 
+        # projections of this session, default to the initial ones
+        if umap_paras_string is None:
+            umap_paras_string = umap_paras_to_string(umap_paras)
+        if tsne_paras_string is None:
+            tsne_paras_string = tsne_paras_to_string(tsne_paras)
+
         if ctx.triggered_id == "graph_download_button":
-            fig = Visualizator.render(
-                df,
+            fig = render_figure(
                 dd_value,
-                original_id_col,
-                umap_paras,
-                tsne_paras,
                 dim_red,
                 two_d,
-                True,
+                umap_paras_string,
+                tsne_paras_string,
+                download=True,
+                quantile_symbols=quantile_symbols,
             )
 
             if not two_d:
@@ -1279,16 +2246,19 @@ def get_callbacks(
             return True
 
         if ctx.triggered_id == "button_graph_all":
+            session_df = dataset.frame(
+                csv_header, umap_paras_string, tsne_paras_string
+            )
             for header in csv_header:
-                fig = Visualizator.render(
-                    df,
+                fig = render_figure(
                     header,
-                    original_id_col,
-                    umap_paras,
-                    tsne_paras,
                     dim_red,
                     two_d,
-                    True,
+                    umap_paras_string,
+                    tsne_paras_string,
+                    download=True,
+                    quantile_symbols=quantile_symbols,
+                    session_df=session_df,
                 )
                 if not two_d:
                     fig.write_html(
@@ -1450,7 +2420,9 @@ def get_callbacks(
         ]
         for header in csv_header:
             group_info_children.append(html.B(f"{header}:"))
-            group_info_children.append(html.P(f"{df.at[seq_id, header]}"))
+            group_info_children.append(
+                html.P(f"{dataset.df.at[seq_id, header]}")
+            )
 
         info_text.append(
             dbc.ListGroupItem(
@@ -1508,7 +2480,7 @@ def get_callbacks(
 
         seq_id = actual_seq_id
         if original_id_col is not None:
-            seq_id = to_mapped_id([seq_id], original_id_col, df)[0]
+            seq_id = to_mapped_id([seq_id], original_ids, df)[0]
 
         info_header = actual_seq_id
 
@@ -1750,9 +2722,17 @@ def get_callbacks(
         Output("load_correlation_scores_spinner", "children"),
         Input("correlation_collapse_switch", "value"),
         Input("dd_menu", "value"),
-        Input("dim_red_tabs", "active_tab")
+        Input("dim_red_tabs", "active_tab"),
+        State("last_umap_paras_dd", "value"),
+        State("last_tsne_paras_dd", "value"),
     )
-    def open_and_fill_correlation_collapse(switch: bool, selected_group: str, dim_red: str):
+    def open_and_fill_correlation_collapse(
+        switch: bool,
+        selected_group: str,
+        dim_red: str,
+        umap_paras_string: str,
+        tsne_paras_string: str,
+    ):
         # Check whether an input is triggered
         ctx = dash.callback_context
         if not ctx.triggered:
@@ -1763,18 +2743,10 @@ def get_callbacks(
             raise PreventUpdate
 
         # get coordinates of current selected dimensionality reduction to transform them into nd-array
-        if dim_red == "UMAP":
-            x = "x_umap_3D"
-            y = "y_umap_3D"
-            z = "z_umap_3D"
-        elif dim_red == "PCA":
-            x = "x_pca_3D"
-            y = "y_pca_3D"
-            z = "z_pca_3D"
-        else:
-            x = "x_tsne_3D"
-            y = "y_tsne_3D"
-            z = "z_tsne_3D"
+        x, y, z = get_axis_names(dim_red, two_d=False)
+        session_df = dataset.frame(
+            [selected_group], umap_paras_string, tsne_paras_string
+        )
 
         # fit = df[[x, y, z]].to_numpy()
 
@@ -1784,25 +2756,31 @@ def get_callbacks(
         ord_embeddings = list()
         labels = list()
         fit = list()
-        for idx in df.index.to_list():
+        for idx in session_df.index.to_list():
             if idx not in embeddings_dict:
                 continue
             ord_embeddings.append(embeddings_dict[idx])
-            labels.append(df.loc[idx, selected_group])
-            fit.append(df.loc[idx, [x, y, z]].tolist())
-        ord_embeddings = numpy.asarray(ord_embeddings)
+            labels.append(session_df.loc[idx, selected_group])
+            fit.append(session_df.loc[idx, [x, y, z]].tolist())
+        # float16 embeddings are computed in float32
+        ord_embeddings = numpy.asarray(
+            ord_embeddings, dtype=np.promote_types(embeddings.dtype, np.float32)
+        )
         labels = np.array(labels)
-        fit = np.array(fit)
+        fit = np.array(fit, dtype=ord_embeddings.dtype)
 
         # create the distance matrix (for embeddings and reduced space)
         distmat_embs = ts_ss(ord_embeddings, ord_embeddings)
-        distmat_fit = cdist(fit, fit, metric='euclidean')  # ts_ss(fit, fit)
+        distmat_fit = cdist(fit, fit, metric='euclidean').astype(fit.dtype)  # ts_ss(fit, fit)
 
         # calculate the silhouette score
         silhouette_score_emb = silhouette(distmat_embs, labels)
         silhouette_score_current = silhouette(distmat_fit, labels)
 
         # trustworthiness + spearman score
+        from scipy.stats import spearmanr
+        from sklearn.manifold import trustworthiness
+
         trustworthiness_score = trustworthiness(distmat_embs, distmat_fit, n_neighbors=10, metric="precomputed")
         spearman_score = spearmanr(squareform(distmat_embs, checks=False), squareform(distmat_fit, checks=False))[0]
 
@@ -1838,13 +2816,13 @@ def get_callbacks(
         x2_norm = np.linalg.norm(x2, axis=-1)[:, np.newaxis]
         x_dot = x1_norm @ x2_norm.T
 
-        # cosine similarity
-        cosine_sim = 1 - cdist(x1, x2, metric='cosine')
+        # cosine similarity, cdist returns float64
+        cosine_sim = 1 - cdist(x1, x2, metric='cosine').astype(x1.dtype)
         cosine_sim[cosine_sim != cosine_sim] = 0
         cosine_sim = np.clip(cosine_sim, -1, 1, out=cosine_sim)
 
         # euclidean_distance
-        euclidean_dist = cdist(x1, x2, metric='euclidean')
+        euclidean_dist = cdist(x1, x2, metric='euclidean').astype(x1.dtype)
 
         # triangle_area_similarity
         theta = np.arccos(cosine_sim) + np.radians(10)
@@ -1862,6 +2840,8 @@ def get_callbacks(
     def silhouette(distmat, labels, ignore=[np.NaN]):
         """Calculates the silhouette score of a distance matrix.
         """
+        from sklearn.metrics import silhouette_score
+
         # exclude groups that have less than 2 grgroupsoups
         exclude = set(k for k, g in groupby(sorted(labels)) if sum(1 for _ in g) < 2)
         exclude.update(set(ignore))
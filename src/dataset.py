@@ -0,0 +1,429 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import threading
+from pathlib import Path
+
+from pandas import DataFrame
+
+UMAP_AXIS_NAMES = [
+    "x_umap_3D",
+    "y_umap_3D",
+    "z_umap_3D",
+    "x_umap_2D",
+    "y_umap_2D",
+]
+PCA_AXIS_NAMES = ["x_pca_3D", "y_pca_3D", "z_pca_3D"]
+TSNE_AXIS_NAMES = [
+    "x_tsne_3D",
+    "y_tsne_3D",
+    "z_tsne_3D",
+    "x_tsne_2D",
+    "y_tsne_2D",
+]
+# number of proteins with the same embedding, shown on hover and colorable
+MULTIPLICITY_COLUMN = "multiplicity"
+# columns of the dataframe derived from the embeddings instead of the csv file
+EMBEDDING_COLUMNS = (
+    UMAP_AXIS_NAMES
+    + PCA_AXIS_NAMES
+    + TSNE_AXIS_NAMES
+    + ["variance", MULTIPLICITY_COLUMN]
+)
+
+
+def umap_paras_to_string(umap_paras: dict) -> str:
+    """
+    String representation of UMAP parameters, used as key of the projection
+    cache. The thread count doesn't change the layout and is left out, layouts
+    started from another one are marked as warm, layouts optimized in steps
+    as progressive and the dimension of a PCA pre-reduction is added.
+    :param umap_paras: UMAP parameters in dictionary
+    :return: UMAP parameters in string format
+    """
+    umap_paras_string = (
+        str(umap_paras["n_neighbours"])
+        + " ; "
+        + str(umap_paras["min_dist"])
+        + " ; "
+        + umap_paras["metric"]
+        + " ; "
+        + umap_paras.get("mode", "exact")
+    )
+    if umap_paras.get("warm_start", False):
+        umap_paras_string += " ; warm"
+    if umap_paras.get("progressive", False):
+        umap_paras_string += " ; progressive"
+    if umap_paras.get("pre_reduction", 0) > 0:
+        umap_paras_string += f" ; pca{umap_paras['pre_reduction']}"
+
+    return umap_paras_string
+
+
+def tsne_paras_to_string(tsne_paras: dict) -> str:
+    """
+    String representation of t-SNE parameters, used as key of the projection
+    cache. Layouts started from another one are marked as warm and the
+    dimension of a PCA pre-reduction is added.
+    :param tsne_paras: t-SNE parameters in dictionary
+    :return: t-SNE parameters in string format
+    """
+    tsne_paras_string = (
+        str(tsne_paras["iterations"])
+        + " ; "
+        + str(tsne_paras["perplexity"])
+        + " ; "
+        + str(tsne_paras["learning_rate"])
+        + " ; "
+        + str(tsne_paras["tsne_metric"])
+        + " ; "
+        + tsne_paras.get("backend", "sklearn")
+    )
+    if tsne_paras.get("warm_start", False):
+        tsne_paras_string += " ; warm"
+    if tsne_paras.get("pre_reduction", 0) > 0:
+        tsne_paras_string += f" ; pca{tsne_paras['pre_reduction']}"
+
+    return tsne_paras_string
+
+
+def _pre_reduction(flags: list) -> int:
+    """
+    :param flags: optional parts of a parameter string
+    :return: dimension of the PCA pre-reduction, 0 if there is none
+    """
+    for flag in flags:
+        if flag.startswith("pca"):
+            return int(flag[3:])
+
+    return 0
+
+
+def string_to_umap_paras(umap_paras_string: str) -> dict:
+    """
+    Parses the string representation of UMAP parameters
+    :param umap_paras_string: UMAP parameters in string format
+    :return: UMAP parameters in dictionary
+    """
+    splits = umap_paras_string.split(" ; ")
+    umap_paras = dict()
+    umap_paras["n_neighbours"] = int(splits[0])
+    umap_paras["min_dist"] = float(splits[1])
+    umap_paras["metric"] = splits[2]
+    # keys stored before the mode was introduced are exact
+    umap_paras["mode"] = splits[3] if len(splits) > 3 else "exact"
+    umap_paras["warm_start"] = "warm" in splits[4:]
+    umap_paras["progressive"] = "progressive" in splits[4:]
+    umap_paras["pre_reduction"] = _pre_reduction(splits[4:])
+
+    return umap_paras
+
+
+def string_to_tsne_paras(tsne_paras_string: str) -> dict:
+    """
+    Parses the string representation of t-SNE parameters
+    :param tsne_paras_string: t-SNE parameters in string format
+    :return: t-SNE parameters in dictionary
+    """
+    splits = tsne_paras_string.split(" ; ")
+    tsne_paras = dict()
+    tsne_paras["iterations"] = int(splits[0])
+    tsne_paras["perplexity"] = float(splits[1])
+    learning_rate = splits[2]
+    tsne_paras["learning_rate"] = (
+        learning_rate if learning_rate == "auto" else float(learning_rate)
+    )
+    tsne_paras["tsne_metric"] = splits[3]
+    # keys stored before the backend was introduced are from sklearn
+    tsne_paras["backend"] = splits[4] if len(splits) > 4 else "sklearn"
+    tsne_paras["warm_start"] = "warm" in splits[5:]
+    tsne_paras["pre_reduction"] = _pre_reduction(splits[5:])
+
+    return tsne_paras
+
+
+def get_axis_names(dim_red: str, two_d: bool) -> list[str]:
+    """
+    Names of the coordinate columns of a dimensionality reduction
+    :param dim_red: dimensionality reduction, UMAP, PCA or TSNE
+    :param two_d: whether the 2D or 3D coordinates are needed
+    :return: column names of x, y (and z)
+    """
+    if dim_red == "UMAP":
+        axis_names = UMAP_AXIS_NAMES
+    elif dim_red == "PCA":
+        axis_names = PCA_AXIS_NAMES
+    else:
+        axis_names = TSNE_AXIS_NAMES
+
+    if not two_d:
+        return axis_names[:3]
+    # PCA 2D is displayed with the first two components of the 3D fit
+    if dim_red == "PCA":
+        return axis_names[:2]
+    return axis_names[3:]
+
+
+class DatasetSnapshot:
+    """
+    Read-only view of the preprocessed data shared by all sessions.
+
+    The dataframe holding the metadata and PCA coordinates is never modified.
+    UMAP and t-SNE coordinates live in the projection caches, keyed by their
+    parameter string. Every session only keeps the keys of its chosen
+    projections (and its selection) in the browser, so concurrent users don't
+    see each other's projections and callbacks can run in threads without locks.
+
+    With several worker processes, a projection calculated by one worker is
+    only in its own caches. New projections are therefore stored in the
+    projection file, and other workers read them from there when a session
+    asks for a key they don't know.
+    """
+
+    def __init__(
+        self,
+        df: DataFrame,
+        umap_paras_dict: dict,
+        tsne_paras_dict: dict,
+        save_projection=None,
+        load_projection=None,
+    ):
+        """
+        :param df: dataframe with the metadata and the PCA coordinates
+        :param umap_paras_dict: UMAP parameter strings and their coordinates
+        :param tsne_paras_dict: t-SNE parameter strings and their coordinates
+        :param save_projection: called with kind (umap or tsne), parameter
+        string and coordinates of every new projection
+        :param load_projection: called with kind and parameter string of an
+        unknown projection, returns the stored coordinates or None
+        """
+        self.df = df
+        self.umap_paras_dict = umap_paras_dict
+        self.tsne_paras_dict = tsne_paras_dict
+        self.save_projection = save_projection
+        self.load_projection = load_projection
+        self._load_lock = threading.Lock()
+        # kept when the metadata is replaced, spatial indexes depend on it
+        self.pca_coords = df[PCA_AXIS_NAMES]
+
+    def replace_metadata(self, metadata: DataFrame) -> list:
+        """
+        Replaces the metadata columns, e.g. after the csv file was edited.
+        The rows and the coordinates are kept, metadata of proteins that
+        aren't in the dataframe is left out. The new dataframe replaces the
+        old one at once, callbacks still using the old one aren't affected.
+        :param metadata: metadata indexed by UID
+        :return: metadata columns that were added, removed or changed
+        """
+        coordinate_cols = [
+            col for col in self.df.columns if col in EMBEDDING_COLUMNS
+        ]
+        metadata = metadata.drop(
+            columns=[col for col in metadata.columns if col in coordinate_cols]
+        ).reindex(self.df.index)
+
+        old_cols = [
+            col for col in self.df.columns if col not in coordinate_cols
+        ]
+        changed = [col for col in old_cols if col not in metadata.columns]
+        for col in metadata.columns:
+            if col not in old_cols or not self.df[col].astype(object).equals(
+                metadata[col].astype(object)
+            ):
+                changed.append(col)
+
+        if changed:
+            self.df = metadata.join(self.df[coordinate_cols])
+
+        return changed
+
+    def add_umap(self, umap_paras_string: str, coords_df: DataFrame):
+        """
+        Adds UMAP coordinates to the projection cache and stores them. Keys are
+        only ever added, a single dictionary assignment is atomic.
+        :param umap_paras_string: UMAP parameters in string format
+        :param coords_df: UMAP coordinates indexed by UID
+        """
+        self.umap_paras_dict[umap_paras_string] = coords_df[UMAP_AXIS_NAMES]
+        if self.save_projection is not None:
+            self.save_projection(
+                "umap", umap_paras_string, coords_df[UMAP_AXIS_NAMES]
+            )
+
+    def add_tsne(self, tsne_paras_string: str, coords_df: DataFrame):
+        """
+        Adds t-SNE coordinates to the projection cache and stores them
+        :param tsne_paras_string: t-SNE parameters in string format
+        :param coords_df: t-SNE coordinates indexed by UID
+        """
+        self.tsne_paras_dict[tsne_paras_string] = coords_df[TSNE_AXIS_NAMES]
+        if self.save_projection is not None:
+            self.save_projection(
+                "tsne", tsne_paras_string, coords_df[TSNE_AXIS_NAMES]
+            )
+
+    def _projection(
+        self, kind: str, paras_dict: dict, paras_string: str
+    ) -> DataFrame:
+        """
+        Coordinates of a projection, read from the projection file if it is
+        missing in the cache, e.g. if another worker calculated it
+        :param kind: umap or tsne
+        :param paras_dict: projection cache of the kind
+        :param paras_string: parameters in string format
+        :return: coordinates indexed by UID
+        """
+        if paras_string in paras_dict or self.load_projection is None:
+            return paras_dict[paras_string]
+
+        with self._load_lock:
+            if paras_string not in paras_dict:
+                coords_df = self.load_projection(kind, paras_string)
+                if coords_df is None:
+                    raise KeyError(paras_string)
+                paras_dict[paras_string] = coords_df
+
+        return paras_dict[paras_string]
+
+    def frame(
+        self,
+        columns: list,
+        umap_paras_string: str,
+        tsne_paras_string: str,
+    ) -> DataFrame:
+        """
+        Builds a new dataframe with the requested metadata columns and the
+        coordinates of the chosen projections. Only these columns are copied.
+        :param columns: metadata columns to be included
+        :param umap_paras_string: key of the chosen UMAP projection
+        :param tsne_paras_string: key of the chosen t-SNE projection
+        :return: dataframe in the order of the dataset
+        """
+        base_cols = [col for col in columns if col in self.df.columns]
+        base_cols += [col for col in PCA_AXIS_NAMES if col not in base_cols]
+        if "variance" in self.df.columns:
+            base_cols.append("variance")
+        if (
+            MULTIPLICITY_COLUMN in self.df.columns
+            and MULTIPLICITY_COLUMN not in base_cols
+        ):
+            base_cols.append(MULTIPLICITY_COLUMN)
+
+        return self.df[base_cols].join(
+            [
+                self._projection(
+                    "umap", self.umap_paras_dict, umap_paras_string
+                ),
+                self._projection(
+                    "tsne", self.tsne_paras_dict, tsne_paras_string
+                ),
+            ],
+            how="left",
+        )
+
+
+class MetadataReloader:
+    """
+    Reloads the metadata of a dataset when its file has changed, shared by
+    all sessions of the process. Embeddings, coordinates and spatial indexes
+    stay in memory. Every reload that changes columns increases the version,
+    so sessions can tell which of their columns are outdated.
+    """
+
+    def __init__(
+        self,
+        dataset: DatasetSnapshot,
+        csv_header: list,
+        path: Path,
+        read_metadata,
+        on_change=None,
+    ):
+        """
+        :param dataset: the dataset whose metadata is replaced
+        :param csv_header: column headers of the dropdown menu, updated in
+        place
+        :param path: Path to the metadata file
+        :param read_metadata: reads the file and returns the metadata indexed
+        by UID and the original IDs
+        :param on_change: called with the changed columns after a reload,
+        e.g. to drop their rendered figures
+        """
+        self.dataset = dataset
+        self.csv_header = csv_header
+        self.path = path
+        self.read_metadata = read_metadata
+        self.on_change = on_change
+        self.version = 0
+        # changed columns of every version
+        self.changes = list()
+        self._stamp = self._file_stamp()
+        self._lock = threading.Lock()
+
+    def _file_stamp(self):
+        """
+        :return: modification time and size of the file, None if it is
+        missing
+        """
+        if self.path is None:
+            return None
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> int:
+        """
+        Reads the metadata again if the file has changed
+        :param force: read the file even if it seems unchanged
+        :return: version of the metadata
+        """
+        if not force and self._file_stamp() == self._stamp:
+            return self.version
+
+        with self._lock:
+            stamp = self._file_stamp()
+            # another session reloaded it in the meantime
+            if not force and stamp == self._stamp:
+                return self.version
+            self._stamp = stamp
+
+            try:
+                metadata, _ = self.read_metadata()
+            except Exception as e:
+                # e.g. the file is still being written, kept until it changes
+                print(f"Metadata of {self.path} couldn't be reloaded: {e}")
+                return self.version
+
+            changed = self.dataset.replace_metadata(metadata)
+            if not changed:
+                return self.version
+
+            csv_header = [
+                header
+                for header in self.dataset.df.columns
+                if header not in EMBEDDING_COLUMNS
+                or header == MULTIPLICITY_COLUMN
+            ]
+            csv_header.sort(key=str.lower)
+            self.csv_header[:] = csv_header
+
+            self.changes.append(changed)
+            self.version += 1
+            if self.on_change is not None:
+                self.on_change(changed)
+
+        return self.version
+
+    def changed_since(self, version: int) -> list:
+        """
+        :param version: version of the metadata a session has seen
+        :return: columns changed by the later versions
+        """
+        changed = list()
+        for changes in self.changes[version:]:
+            changed += [col for col in changes if col not in changed]
+
+        return changed
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import pickle
+import threading
+
+# memory of the rendered figures kept by a process in MB
+FIGURE_CACHE_MB = 256
+# columns of the dropdown menu rendered after the start
+PREWARM_COLUMNS = 5
+
+
+class FigureCache:
+    """
+    Rendered figures keyed by column, dimensionality reduction, dimension,
+    projection and download flag. The figures are stored serialized, so every
+    session gets its own copy to add highlighting traces to. A figure is
+    rendered again when the coordinates of its projection are replaced, the
+    least recently used figures are dropped when the serialized figures
+    exceed the memory budget.
+    """
+
+    def __init__(self, max_mb: float = FIGURE_CACHE_MB):
+        """
+        :param max_mb: memory budget in MB, 0 disables the cache
+        """
+        self.max_bytes = max_mb * 2**20
+        self.nbytes = 0
+        # key: coordinates the figure was rendered from and the figure
+        self._figures = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, source):
+        """
+        :param key: column, dimensionality reduction, dimension, projection
+        and download flag
+        :param source: object holding the coordinates of the projection
+        :return: copy of the figure, None if it has to be rendered
+        """
+        with self._lock:
+            entry = self._figures.pop(key, None)
+            if entry is None:
+                return None
+            if entry[0] is not source:
+                self.nbytes -= len(entry[1])
+                return None
+            # most recently used
+            self._figures[key] = entry
+
+        return pickle.loads(entry[1])
+
+    def put(self, key: tuple, source, fig) -> bool:
+        """
+        Stores a rendered figure
+        :param key: column, dimensionality reduction, dimension, projection
+        and download flag
+        :param source: object holding the coordinates of the projection
+        :param fig: rendered figure, it may be modified afterwards
+        :return: False if the figure doesn't fit into the budget
+        """
+        if self.max_bytes <= 0:
+            return False
+
+        data = pickle.dumps(fig, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return False
+
+        with self._lock:
+            entry = self._figures.pop(key, None)
+            if entry is not None:
+                self.nbytes -= len(entry[1])
+            self._figures[key] = (source, data)
+            self.nbytes += len(data)
+            while self.nbytes > self.max_bytes:
+                _, data = self._figures.pop(next(iter(self._figures)))
+                self.nbytes -= len(data)
+
+        return True
+
+    def invalidate(self, columns: list):
+        """
+        Drops the figures of columns whose values changed
+        :param columns: changed columns
+        """
+        with self._lock:
+            for key in [key for key in self._figures if key[0] in columns]:
+                _, data = self._figures.pop(key)
+                self.nbytes -= len(data)
+
+    def __len__(self) -> int:
+        return len(self._figures)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from pathlib import Path
+
+import pandas as pd
+from pandas import DataFrame
+
+# columns of a csv file written by fasta_mapper.py
+MAPPED_HEADERS = ["mapped_id", "original_id"]
+PARQUET_SUFFIXES = [".parquet", ".pq"]
+
+
+def csv_engine() -> str:
+    """
+    Parser of pandas for csv files. The multithreaded pyarrow parser is
+    optional, the C parser is used if it isn't installed.
+    :return: pyarrow or c
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "c"
+
+    return "pyarrow"
+
+
+def read_table(path: Path, separator: str) -> DataFrame:
+    """
+    Reads a metadata file in one pass, Parquet files are recognized by their
+    suffix. The index isn't set, so the headers can be checked first.
+    :param path: Path to the csv or Parquet file
+    :param separator: Separator of the csv file
+    :return: all columns of the file
+    """
+    if path.suffix.lower() in PARQUET_SUFFIXES:
+        df = pd.read_parquet(path)
+        # an index written by pandas is a column like the others here
+        if not isinstance(df.index, pd.RangeIndex):
+            df = df.reset_index()
+        return df
+
+    return pd.read_csv(path, sep=separator, engine=csv_engine())
+
+
+def categorize(df: DataFrame) -> DataFrame:
+    """
+    Stores the text columns as categoricals: every value is kept once and the
+    rows hold integer codes, which makes comparing the groups fast. Numeric
+    columns are kept numeric.
+    :param df: dataframe of the metadata
+    :return: dataframe with categorical text columns
+    """
+    text_cols = df.select_dtypes(include=["object", "string"]).columns
+    if len(text_cols) == 0:
+        return df
+
+    return df.astype({col: "category" for col in text_cols})
+
+
+def read_metadata(csv_path: Path, separator: str, uid_col: int):
+    """
+    Reads the metadata and detects from its headers whether the file was
+    mapped by fasta_mapper.py and whether it only maps the IDs
+    :param csv_path: Path to the csv or Parquet file, may be None
+    :param separator: Separator of the csv file
+    :param uid_col: index of the column holding the UIDs
+    :return: metadata indexed by UID (None without a file), whether the file
+    is mapped and whether it has no groups or features
+    """
+    if csv_path is None or not csv_path.is_file():
+        return None, False, True
+
+    df = read_table(csv_path, separator)
+    headers = [str(header).strip() for header in df.columns]
+
+    mapped_flag = all(header in headers for header in MAPPED_HEADERS)
+    csv_less_flag = sorted(headers) == sorted(MAPPED_HEADERS)
+
+    # fasta_mapper.py always writes commas, the separator only detects it
+    csv_flag = csv_path.suffix.lower() not in PARQUET_SUFFIXES
+    if mapped_flag and csv_flag and separator != ",":
+        df = read_table(csv_path, ",")
+        headers = [str(header).strip() for header in df.columns]
+    df.columns = headers
+
+    # UID col from fasta_mapper.py is always 0
+    uid_header = headers[0] if mapped_flag else headers[uid_col]
+    df.set_index(uid_header, inplace=True)
+
+    return df, mapped_flag, csv_less_flag
@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+from collections import OrderedDict
+from html import escape
+from pathlib import Path
+
+import yaml
+
+
+class DatasetRegistry:
+    """
+    Holds the applications of several datasets, keyed by the name of their
+    configuration file. A dataset is loaded on first access from its
+    precomputed files; the least recently used datasets are unloaded when the
+    memory budget is exceeded. In production mode the embeddings and distance
+    matrices are memory-mapped from the output directory, so the workers
+    share one copy of them.
+    """
+
+    def __init__(
+        self,
+        conf_files: list,
+        memory_budget: float,
+        verbose: bool,
+        production: bool = False,
+        workers: int = 1,
+    ):
+        """
+        :param conf_files: paths to the YAML configuration files
+        :param memory_budget: memory budget in MB
+        :param verbose: print loading and unloading of datasets
+        :param production: served by several worker processes
+        :param workers: number of worker processes in production mode
+        """
+        self.conf_files = OrderedDict()
+        for conf_file in conf_files:
+            if conf_file.stem in self.conf_files:
+                raise Exception(
+                    f"Dataset name <{conf_file.stem}> is given twice!\nThe"
+                    " names of the configuration files must be unique."
+                )
+            self.conf_files[conf_file.stem] = conf_file
+
+        self.memory_budget = memory_budget * 2**20
+        self.verbose = verbose
+        self.production = production
+        self.workers = workers
+
+        # name -> (wsgi application, size in bytes), in order of last access
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks = dict()
+
+    @property
+    def names(self) -> list[str]:
+        return list(self.conf_files.keys())
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._loaded
+
+    def get(self, name: str):
+        """
+        Returns the WSGI application of a dataset, loads it if needed
+        :param name: name of the dataset
+        :return: WSGI application
+        """
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name][0]
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # other datasets stay available while this one is loading
+        with load_lock:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name][0]
+
+            wsgi_app, nbytes = self._load(name)
+
+            with self._lock:
+                self._loaded[name] = (wsgi_app, nbytes)
+                self._evict()
+
+        return wsgi_app
+
+    def preload(self):
+        """
+        Loads the datasets in the order of their configuration files until
+        the memory budget is used, e.g. before the production workers are
+        forked, so they share the loaded datasets
+        :return: None
+        """
+        for count, name in enumerate(self.names, start=1):
+            self.get(name)
+            with self._lock:
+                total = sum(nbytes for _, nbytes in self._loaded.values())
+                # a dataset loaded before was unloaded for this one
+                if len(self._loaded) < count or total >= self.memory_budget:
+                    break
+
+    def parser(self, name: str):
+        """
+        Reads the configuration file of a dataset
+        :param name: name of the dataset
+        :return: the parser with the arguments of the configuration
+        """
+        from src.app import LoadConfFile, Parser
+
+        with open(self.conf_files[name], "r") as f:
+            dictionary = yaml.full_load(f)
+
+        return Parser(LoadConfFile.yaml_to_parser(dictionary))
+
+    def _load(self, name: str):
+        """
+        Preprocesses a dataset, which reads the cached coordinates if present
+        :param name: name of the dataset
+        :return: WSGI application and memory footprint in bytes
+        """
+        from src.app import get_application
+
+        if self.verbose:
+            print(f"Loading dataset {name}")
+
+        parser = self.parser(name)
+        # html files are not written when serving
+        parser.html_cols = None
+        # arrays of the workers are mapped from the same files
+        if self.production:
+            parser.production = True
+            parser.workers = self.workers
+
+        app, _, _, _, _, _, nbytes = get_application(
+            parser, requests_pathname_prefix=f"/{name}/"
+        )
+
+        if self.verbose:
+            print(f"Dataset {name} loaded ({nbytes / 2**20:.1f} MB)")
+
+        return app.server, nbytes
+
+    def _evict(self):
+        """
+        Unloads least recently used datasets until the budget is kept. The most
+        recently used dataset is never unloaded. Must be called with the lock held.
+        """
+        total = sum(nbytes for _, nbytes in self._loaded.values())
+        while total > self.memory_budget and len(self._loaded) > 1:
+            name, (_, nbytes) = self._loaded.popitem(last=False)
+            total -= nbytes
+            if self.verbose:
+                print(f"Dataset {name} unloaded ({nbytes / 2**20:.1f} MB)")
+
+
+class DatasetDispatcher:
+    """
+    WSGI application forwarding /<dataset>/... to the application of the
+    dataset and serving the dataset selector at /
+    """
+
+    def __init__(self, registry: DatasetRegistry):
+        self.registry = registry
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        name, _, rest = path.lstrip("/").partition("/")
+
+        if name in self.registry.names:
+            # the dash app expects its prefix in the URL
+            if not path.startswith(f"/{name}/"):
+                start_response(
+                    "301 Moved Permanently", [("Location", f"/{name}/")]
+                )
+                return [b""]
+
+            wsgi_app = self.registry.get(name)
+            environ = dict(environ)
+            environ["SCRIPT_NAME"] = (
+                environ.get("SCRIPT_NAME", "") + f"/{name}"
+            )
+            environ["PATH_INFO"] = "/" + rest
+            return wsgi_app(environ, start_response)
+
+        if path not in ["", "/"]:
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Unknown dataset"]
+
+        start_response(
+            "200 OK", [("Content-Type", "text/html; charset=utf-8")]
+        )
+        return [self.selector_page().encode("utf-8")]
+
+    def selector_page(self) -> str:
+        """
+        Minimal start page listing the datasets
+        :return: html page
+        """
+        items = list()
+        for name in self.registry.names:
+            state = "loaded" if self.registry.is_loaded(name) else "not loaded"
+            items.append(
+                f'<li><a href="/{escape(name)}/">{escape(name)}</a>'
+                f" <small>({state})</small></li>"
+            )
+
+        return (
+            "<!DOCTYPE html><html><head><title>RostSpace</title></head>"
+            '<body style="font-family: sans-serif; margin: 40px">'
+            "<h2>RostSpace datasets</h2>"
+            f"<ul>{''.join(items)}</ul>"
+            "<p>Datasets are loaded on first access, which can take a"
+            " while.</p></body></html>"
+        )
+
+
+def run_multi_dataset_server(
+    conf_files: list[Path],
+    memory_budget: float,
+    port: int,
+    production: bool,
+    workers: int,
+    threads: int,
+    verbose: bool,
+):
+    """
+    Serves several datasets from one process behind a dataset selector
+    :param conf_files: paths to the YAML configuration files
+    :param memory_budget: memory budget in MB
+    :param port: port on which the website is locally hosted
+    :param production: use a production server instead of the werkzeug server
+    :param workers: number of worker processes in production mode
+    :param threads: number of threads per worker in production mode
+    :param verbose: print loading and unloading of datasets
+    :return: None
+    """
+    registry = DatasetRegistry(
+        conf_files, memory_budget, verbose, production, workers
+    )
+    dispatcher = DatasetDispatcher(registry)
+
+    # numba reads the cache directory once, all datasets share the one of the
+    # first dataset
+    output_d = registry.parser(registry.names[0]).output_d
+    if output_d is not None:
+        from src.reducers import set_numba_cache_dir
+
+        set_numba_cache_dir(output_d)
+
+    print(f"Serving datasets {', '.join(registry.names)} on port {port}")
+
+    if production:
+        from src.server import run_production_server
+
+        # loaded once before the workers are forked instead of by every one
+        registry.preload()
+
+        run_production_server(dispatcher, port, workers, threads)
+    else:
+        from werkzeug.serving import run_simple
+
+        run_simple("127.0.0.1", port, dispatcher, threaded=True)
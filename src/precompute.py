@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import argparse
+import itertools
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+from pathlib import Path
+
+import yaml
+
+from src.reducers import available_threads, limit_threads
+
+
+def _read_conf(conf_file: Path) -> dict:
+    with open(conf_file, "r") as f:
+        return yaml.full_load(f)
+
+
+def parameter_grid(grid: dict, defaults: dict) -> list[dict]:
+    """
+    Expands a parameter grid of the configuration file. Parameters missing in
+    the grid take the value of the configuration, numbers are converted to the
+    type of the configured value, so the keys match the ones of the app.
+    :param grid: parameter names and a value or a list of values
+    :param defaults: parameters of the configuration
+    :return: all combinations of the parameters
+    """
+    unknown = set(grid) - set(defaults)
+    if unknown:
+        raise Exception(
+            f"Unknown parameter(s) {', '.join(sorted(unknown))} in grid!\nValid"
+            f" parameters are {', '.join(defaults)}."
+        )
+
+    values = list()
+    for name, default in defaults.items():
+        value = grid.get(name, default)
+        value = value if isinstance(value, list) else [value]
+        if isinstance(default, (int, float)):
+            value = [type(default)(v) for v in value]
+        values.append(value)
+
+    return [
+        dict(zip(defaults, combination))
+        for combination in itertools.product(*values)
+    ]
+
+
+def estimate_memory(conf_file: Path) -> int:
+    """
+    Rough peak memory of preprocessing a dataset, dominated by the three
+    n x n distance matrices and the copies of the embeddings
+    :param conf_file: path to the YAML configuration file
+    :return: size in bytes
+    """
+    import h5py
+    import numpy as np
+
+    dictionary = _read_conf(conf_file)
+    hdf_path = Path(dictionary["hdf"])
+    with h5py.File(hdf_path, "r") as hdf:
+        n = len(hdf)
+        dim = next(iter(hdf.values())).shape[-1] if n > 0 else 0
+
+    # float16 embeddings are computed in float32
+    itemsize = max(4, np.dtype(dictionary.get("dtype", "float32")).itemsize)
+
+    return 3 * n * n * itemsize + 4 * n * dim * itemsize
+
+
+def precompute_dataset(conf_file: Path) -> str:
+    """
+    Builds all caches of a dataset: the dataframe with the initial projections,
+    html exports, distance matrices and the projections of the parameter grids
+    :param conf_file: path to the YAML configuration file
+    :return: summary of the computed files
+    """
+    from src.app import LoadConfFile, Parser, get_data_preprocessor
+    from src.dataset import tsne_paras_to_string, umap_paras_to_string
+    from src.server import share_arrays
+
+    start = time.perf_counter()
+
+    dictionary = _read_conf(conf_file)
+    for grid in ["umap_grid", "tsne_grid"]:
+        if "pre_reduction" in dictionary.get(grid, dict()):
+            raise Exception(
+                f"pre_reduction can't be part of {grid}, it applies to all"
+                " projections of a dataset!"
+            )
+    parser = Parser(LoadConfFile.yaml_to_parser(dictionary))
+    data_preprocessor, _, umap_paras, tsne_paras = get_data_preprocessor(
+        parser
+    )
+
+    (
+        df,
+        _,
+        _,
+        _,
+        embeddings,
+        embedding_uids,
+        distance_dic,
+        _,
+    ) = data_preprocessor.data_preprocessing()
+
+    # the server maps these files instead of computing the matrices
+    share_arrays(
+        parser.output_d, parser.hdf_path.stem, embeddings, distance_dic
+    )
+    reducer_embeddings = data_preprocessor.reduce_embeddings(
+        embeddings, embedding_uids
+    )
+
+    computed = 0
+    umap_paras_dict = data_preprocessor.get_umap_paras_dict(df)
+    umap_grid = parameter_grid(dictionary.get("umap_grid", dict()), umap_paras)
+    for paras in umap_grid:
+        paras_string = umap_paras_to_string(paras)
+        if paras_string in umap_paras_dict:
+            continue
+        df_umap = data_preprocessor.generate_umap(reducer_embeddings, paras)
+        df_umap.index = embedding_uids
+        data_preprocessor.save_projection("umap", paras_string, df_umap)
+        computed += 1
+
+    tsne_paras_dict = data_preprocessor.get_tsne_paras_dict(df)
+    tsne_grid = parameter_grid(dictionary.get("tsne_grid", dict()), tsne_paras)
+    for paras in tsne_grid:
+        paras_string = tsne_paras_to_string(paras)
+        if paras_string in tsne_paras_dict:
+            continue
+        df_tsne = data_preprocessor.generate_tsne(reducer_embeddings, paras)
+        df_tsne.index = embedding_uids
+        data_preprocessor.save_projection("tsne", paras_string, df_tsne)
+        computed += 1
+
+    return (
+        f"{len(embedding_uids)} proteins, {computed} new projection(s) in"
+        f" {time.perf_counter() - start:.1f} s"
+    )
+
+
+def run_precompute(
+    conf_files: list[Path], jobs: int, memory_budget: float, verbose: bool
+):
+    """
+    Precomputes several datasets in parallel processes. Datasets are started
+    largest first as long as their estimated memory fits into the budget, a
+    single dataset always runs even if it exceeds the budget.
+    :param conf_files: paths to the YAML configuration files
+    :param jobs: maximum number of datasets processed at the same time
+    :param memory_budget: memory budget in MB
+    :param verbose: print the scheduling
+    :return: None
+    """
+    budget = memory_budget * 2**20
+    estimates = {
+        conf_file: estimate_memory(conf_file) for conf_file in conf_files
+    }
+    pending = sorted(conf_files, key=lambda conf_file: -estimates[conf_file])
+    n_threads = max(1, available_threads() // jobs)
+
+    running = dict()
+    failed = list()
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        # fresh interpreters, so the thread limits apply before numpy is loaded
+        mp_context=get_context("spawn"),
+        initializer=limit_threads,
+        initargs=(n_threads,),
+    ) as executor:
+        while pending or running:
+            used = sum(estimates[conf_file] for conf_file in running.values())
+            for conf_file in list(pending):
+                if len(running) >= jobs:
+                    break
+                if running and used + estimates[conf_file] > budget:
+                    continue
+
+                if verbose:
+                    print(
+                        f"Start {conf_file.stem} (~"
+                        f"{estimates[conf_file] / 2**20:.0f} MB,"
+                        f" {n_threads} threads)"
+                    )
+                future = executor.submit(precompute_dataset, conf_file)
+                running[future] = conf_file
+                pending.remove(conf_file)
+                used += estimates[conf_file]
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                conf_file = running.pop(future)
+                try:
+                    print(f"{conf_file.stem}: {future.result()}")
+                except Exception as e:
+                    print(f"{conf_file.stem} failed: {e}")
+                    failed.append(conf_file.stem)
+
+    if failed:
+        raise Exception(f"Precomputing failed for {', '.join(failed)}!")
+
+
+def main(arguments: list = None):
+    """
+    Entry point of rostspace precompute
+    :param arguments: command line arguments after the subcommand
+    :return: None
+    """
+    parser = argparse.ArgumentParser(
+        prog="rostspace precompute",
+        description=(
+            "Builds the caches of one or many datasets without starting the"
+            " server."
+        ),
+    )
+    parser.add_argument(
+        "conf_files",
+        nargs="+",
+        type=Path,
+        help="YAML configuration files of the datasets",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of datasets processed in parallel",
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=8192,
+        help="Memory budget for the parallel datasets in MB",
+    )
+    parser.add_argument(
+        "-v",
+        "--verbose",
+        action="store_true",
+        help="Print the scheduling of the datasets",
+    )
+    args = parser.parse_args(arguments)
+
+    for conf_file in args.conf_files:
+        if not conf_file.is_file():
+            raise Exception(f"Configuration file {conf_file} doesn't exist!")
+
+    # the spawned processes inherit the numba cache of the first dataset
+    from src.app import LoadConfFile, Parser
+    from src.reducers import set_numba_cache_dir
+
+    dictionary = _read_conf(args.conf_files[0])
+    output_d = Parser(LoadConfFile.yaml_to_parser(dictionary)).output_d
+    if output_d is not None:
+        set_numba_cache_dir(output_d)
+
+    run_precompute(
+        args.conf_files, max(1, args.jobs), args.memory_budget, args.verbose
+    )
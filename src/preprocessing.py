@@ -2,18 +2,60 @@
 # -*- coding: utf-8 -*-
 
 import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from multiprocessing import get_context
 from pathlib import Path
 
 import h5py
 import numpy as np
 import pandas
 import pandas as pd
-from Bio import SeqIO
 from pandas import DataFrame
-from scipy.spatial.distance import cdist, pdist, squareform
-
+from scipy.spatial.distance import cdist, pdist
+
+from src.dataset import (
+    MULTIPLICITY_COLUMN,
+    get_axis_names,
+    tsne_paras_to_string,
+    umap_paras_to_string,
+)
+from src.metadata import categorize, read_metadata
+from src.profiler import StageProfiler
+from src.reducers import (
+    STREAMING_PCA_BYTES,
+    available_threads,
+    compute_array,
+    limit_threads,
+    pca_fit,
+    pca_fit_streaming,
+    run_reducer,
+    tsne_fit_both,
+    umap_fit,
+    umap_fit_progressive,
+    unique_rows,
+)
 from src.visualization.visualizator import Visualizator
 
+# group of the projection file holding the coordinates of the first start
+INITIAL_PROJECTIONS = "initial"
+# rows of a distance matrix computed at once
+DISTANCE_BLOCK_SIZE = 1024
+# proteins and neighbours of the precision report of the embedding type
+PRECISION_SAMPLE = 1000
+PRECISION_NEIGHBOURS = 10
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, served by a single process
+    fcntl = None
+
+# serializes the threads of this process, fcntl the worker processes
+_projection_lock = threading.Lock()
+
 
 class DataPreprocessor:
     UMAP_AXIS_NAMES = ["x_umap_3D", "y_umap_3D", "z_umap_3D", "x_umap_2D", "y_umap_2D"]
@@ -49,6 +91,10 @@ class DataPreprocessor:
         umap_paras: dict,
         tsne_paras: dict,
         verbose: bool,
+        profile: bool = False,
+        cprofile: bool = False,
+        dtype: str = "float32",
+        lod_points: int = 0,
     ):
         self.output_d = output_d
         self.hdf_path = hdf_path
@@ -62,6 +108,11 @@ class DataPreprocessor:
         self.umap_paras = umap_paras
         self.tsne_paras = tsne_paras
         self.verbose = verbose
+        self.profiler = StageProfiler(enabled=profile, cprofile=cprofile)
+        # storage type of the embeddings, float16 is computed in float32
+        self.dtype = np.dtype(dtype)
+        # approximate number of points of the graph, 0 for all
+        self.lod_points = lod_points
 
     def data_preprocessing(self):
         """
@@ -70,95 +121,85 @@ class DataPreprocessor:
         """
         # root directory that holds, proteins.fasta, embeddings.h5, labels.csv and some output_file.html
         emb_h5file = self.hdf_path
-        label_csv_p = self.csv_path
 
-        # delete df.csv
+        # delete the dataframe of earlier versions and the stored projections
         if self.reset:
             df_csv_path = self.output_d / f"df_{self.hdf_path.stem}.csv"
             if df_csv_path.is_file():
                 os.remove(df_csv_path)
+            if self.projection_path.is_file():
+                os.remove(self.projection_path)
 
-        csv_less_flag = self._check_files(
-            emb_h5file, label_csv_p, self.csv_separator
-        )
-
-        mapped_flag = self._check_mapped(label_csv_p, self.csv_separator)
-
-        # processed by fasta_mapper.py?
-        original_id_col = None
-        if mapped_flag and csv_less_flag is False:
-            # UID col from fasta_mapper.py is always 0
-            df_csv = pd.read_csv(label_csv_p, index_col=0)
-
-            # Extract original ID column
-            original_id_col = df_csv["original_id"].to_list()
-            df_csv.drop(columns=["original_id"], inplace=True)
-        # no csv given or csv only exists for mapping
-        elif csv_less_flag:
-            df_csv, original_id_col = self._create_csv_less_df(
-                emb_h5file, mapped_flag, label_csv_p
-            )
-        # not mapped and csv given
-        else:
-            df_csv = pd.read_csv(
-                label_csv_p, sep=self.csv_separator, index_col=self.uid_col
+        # Check whether the h5 files is present (mandatory)
+        if not emb_h5file.is_file():
+            raise FileNotFoundError(
+                f"The {emb_h5file} file is missing! Check data directory and"
+                " basename."
             )
 
+        with self.profiler.stage("read_csv"):
+            df_csv, original_id_col = self.read_metadata()
+
         # replace empty values with NA
         # df_csv.fillna("NA", inplace=True)
 
         # replace "None" values with NA
         # df_csv.replace(to_replace="None", value="NA", inplace=True)
 
-        # save index name for df.csv
-        index_name = df_csv.index.name
-
         # get UIDs
         csv_uids = df_csv.index.to_list()
 
         # get sequences if fasta path is given
         fasta_dict = None
         if self.fasta_path is not None:
-            fasta_dict = self._read_fasta()
+            with self.profiler.stage("read_fasta"):
+                fasta_dict = self._read_fasta()
 
         (
             df_embeddings,
             csv_header,
             embeddings,
             embedding_uids,
-        ) = self._read_df_csv(
-            self.output_d,
-            df_csv,
-            emb_h5file,
-            csv_uids,
-            index_name,
-        )
+        ) = self._join_coordinates(df_csv, csv_uids)
 
         # handle html saving
-        DataPreprocessor._handle_html(
-            self,
-            self.html_cols,
-            csv_header,
-            self.output_d,
-            original_id_col=original_id_col,
-            df=df_embeddings,
-        )
+        with self.profiler.stage("html_export"):
+            DataPreprocessor._handle_html(
+                self,
+                self.html_cols,
+                csv_header,
+                self.output_d,
+                original_id_col=original_id_col,
+                df=df_embeddings,
+            )
 
         # sort csv header alphabetically
         csv_header.sort(key=str.lower)
 
         # generate initial figure
-        fig = Visualizator.render(
-            df_embeddings,
-            selected_column=csv_header[0],
-            original_id_col=original_id_col,
-            umap_paras=self.umap_paras,
-            tsne_paras=self.tsne_paras,
-            dim_red=self.dim_red,
-        )
+        with self.profiler.stage("initial_render"):
+            fig = Visualizator.render(
+                df_embeddings,
+                selected_column=csv_header[0],
+                original_id_col=original_id_col,
+                umap_paras=self.umap_paras,
+                tsne_paras=self.tsne_paras,
+                dim_red=self.dim_red,
+                max_points=self.lod_points,
+            )
 
         # get distance matrices for displaying nearest neighbour
-        distance_dic = self._get_distance_matrices(embeddings)
+        with self.profiler.stage("distance_matrices"):
+            distance_dic = self._get_distance_matrices(embeddings)
+
+        if self.verbose and self.dtype != np.float64:
+            self._report_precision(embeddings, embedding_uids, distance_dic)
+
+        # save stage timings of the cold start
+        trace_path = self.profiler.write(self.output_d, self.hdf_path.stem)
+        if trace_path is not None:
+            print(self.profiler.report())
+            print(f"Profiling timeline saved to {trace_path}")
 
         return (
             df_embeddings,
@@ -171,151 +212,380 @@ class DataPreprocessor:
             fasta_dict,
         )
 
-    @staticmethod
-    def _get_distance_matrices(embeddings):
+    def read_metadata(self):
         """
-        Create the distance matrices for displaying nearest neighbours of a selected point
-        :param embeddings: The embedding values
-        :return: The distance matrices in a dictionary
+        Reads the metadata file, at the start and whenever it is reloaded
+        :return: metadata indexed by UID and the original IDs of a file
+        mapped by fasta_mapper.py, None if it isn't mapped
         """
+        # the file is read once, its headers tell how it was created
+        df_csv, mapped_flag, csv_less_flag = read_metadata(
+            self.csv_path, self.csv_separator, self.uid_col
+        )
+
+        # processed by fasta_mapper.py?
+        original_id_col = None
+        if mapped_flag:
+            # Extract original ID column
+            original_id_col = df_csv["original_id"].to_list()
+            df_csv.drop(columns=["original_id"], inplace=True)
+
+        # no csv given or csv only exists for mapping
+        if csv_less_flag:
+            if self.verbose:
+                if df_csv is None:
+                    print(
+                        "No csv file found!\nActivate csv less mode, no"
+                        " groups or features are visualized."
+                    )
+                else:
+                    print("No groups/features in csv file!")
+            df_csv = self._create_csv_less_df(self.hdf_path, df_csv)
 
-        euclidean_dis_mat = cdist(embeddings, embeddings, "euclidean")
-        cosine_dis_mat = cdist(embeddings, embeddings, "cosine")
-        manhattan_dis_mat = cdist(embeddings, embeddings, "cityblock")
+        return categorize(df_csv), original_id_col
 
-        distance_dic = dict(
-            euclidean=euclidean_dis_mat,
-            cosine=cosine_dis_mat,
-            manhattan=manhattan_dis_mat,
+    def _get_distance_matrices(self, embeddings):
+        """
+        Create the distance matrices for displaying nearest neighbours of a selected point.
+        Matrices saved by the precompute command are mapped instead if they
+        belong to the same embeddings.
+        :param embeddings: The embedding values
+        :return: The distance matrices in a dictionary
+        """
+        metrics = dict(
+            euclidean="euclidean", cosine="cosine", manhattan="cityblock"
         )
+        dtype = compute_array(embeddings[:1]).dtype
+
+        shared_d = self.output_d / "shared"
+        stem = self.hdf_path.stem
+        shared_embs_path = shared_d / f"{stem}_embeddings.npy"
+        paths = [shared_d / f"{stem}_{metric}.npy" for metric in metrics]
+        if (
+            not self.reset
+            and shared_embs_path.is_file()
+            and all(path.is_file() for path in paths)
+            and np.load(shared_embs_path, mmap_mode="r").dtype
+            == embeddings.dtype
+            and all(
+                np.load(path, mmap_mode="r").dtype == dtype for path in paths
+            )
+            and np.array_equal(
+                np.load(shared_embs_path, mmap_mode="r"), embeddings
+            )
+        ):
+            if self.verbose:
+                print("Pre computed distance matrices are loaded.")
+            return {
+                metric: np.load(path, mmap_mode="r")
+                for metric, path in zip(metrics, paths)
+            }
+
+        data = compute_array(embeddings)
+        distance_dic = dict()
+        for metric, scipy_metric in metrics.items():
+            distance_dic[metric] = self._distance_matrix(
+                data, scipy_metric, dtype
+            )
 
         return distance_dic
 
-    def _check_files(
-        self,
-        hdf_path: Path,
-        csv_path: Path,
-        separator: str,
+    @staticmethod
+    def _distance_matrix(data: np.ndarray, metric: str, dtype) -> np.ndarray:
+        """
+        Pairwise distances in the given type. cdist always returns float64, so
+        the matrix is filled in blocks of rows instead of converting a full
+        float64 copy.
+        :param data: embeddings data
+        :param metric: scipy name of the metric
+        :param dtype: type of the matrix
+        :return: n x n distance matrix
+        """
+        dis_mat = np.empty((len(data), len(data)), dtype=dtype)
+        for start in range(0, len(data), DISTANCE_BLOCK_SIZE):
+            stop = start + DISTANCE_BLOCK_SIZE
+            dis_mat[start:stop] = cdist(data[start:stop], data, metric)
+
+        return dis_mat
+
+    def _report_precision(
+        self, embeddings: np.ndarray, embedding_uids: list, distance_dic: dict
     ):
         """
-        Checks whether all files are present
-        :param hdf_path: h5 file Path
-        :param csv_path: csv file Path
-        :return boolean flag whether csv less mode is activated or not
+        Prints how well the euclidean distance matrix of the configured type
+        keeps the nearest neighbours, compared with distances computed in
+        float64 from the embeddings as stored in the HDF5 file, on a sample
+        of the proteins. It covers the rounding of the embeddings and of the
+        distance matrix.
+        :param embeddings: the embeddings in a numpy stack
+        :param embedding_uids: the unique IDs of the embeddings
+        :param distance_dic: distance matrices of the nearest neighbours
+        :return: None
         """
-        # Check whether the h5 files is present (mandatory)
-        if not hdf_path.is_file():
-            raise FileNotFoundError(
-                f"The {hdf_path} file is missing! Check data directory and"
-                " basename."
+        rng = np.random.default_rng(42)
+        rows = np.sort(
+            rng.choice(
+                len(embeddings),
+                min(len(embeddings), PRECISION_SAMPLE),
+                replace=False,
             )
+        )
+        if len(rows) <= 2 * PRECISION_NEIGHBOURS:
+            return
+
+        with h5py.File(self.hdf_path, "r") as hdf:
+            stored = [hdf[embedding_uids[row]][:] for row in rows]
+        file_dtype = stored[0].dtype
+        full = cdist(*[np.vstack(stored).astype(np.float64)] * 2)
+        reduced = np.asarray(
+            distance_dic["euclidean"][np.ix_(rows, rows)], dtype=np.float64
+        )
+
+        # neighbours within the distance of the k-th nearest one, so
+        # identical embeddings don't count as mismatches
+        np.fill_diagonal(full, np.inf)
+        np.fill_diagonal(reduced, np.inf)
+        k = PRECISION_NEIGHBOURS - 1
+        neighbours = full <= np.partition(full, k, axis=1)[:, k, None]
+        kept = reduced <= np.partition(reduced, k, axis=1)[:, k, None]
+        share = (neighbours & kept).sum() / neighbours.sum()
+
+        finite = np.isfinite(full) & (full > 0)
+        error = np.abs(reduced[finite] - full[finite]) / full[finite]
+        print(
+            f"Precision on {len(rows)} proteins: {share:.2%} of the"
+            f" {PRECISION_NEIGHBOURS} nearest neighbours and a relative"
+            f" distance error of at most {error.max():.1e} with"
+            f" {self.dtype.name} embeddings and"
+            f" {distance_dic['euclidean'].dtype.name} distances, compared with"
+            f" float64 distances of the {file_dtype.name} embeddings in the"
+            " HDF5 file."
+        )
+
+    @property
+    def projection_path(self) -> Path:
+        """
+        File holding the UMAP and t-SNE projections of further parameters
+        """
+        return self.output_d / f"projections_{self.hdf_path.stem}.h5"
+
+    @contextmanager
+    def _projection_file_lock(self):
+        """
+        Serializes the access to the projection file. The HDF5 library
+        refuses to open a file another process is writing, e.g. another
+        worker in production mode.
+        """
+        with _projection_lock:
+            if fcntl is None:
+                yield
+                return
+
+            with open(self.projection_path.with_suffix(".lock"), "a") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def save_projection(
+        self, kind: str, paras_string: str, coords_df: DataFrame
+    ):
+        """
+        Stores the coordinates of a projection, an existing one of the same
+        parameters is replaced
+        :param kind: umap or tsne
+        :param paras_string: parameters in string format
+        :param coords_df: coordinates indexed by UID
+        """
+        name = self._projection_name(paras_string)
+
+        with self._projection_file_lock(), h5py.File(
+            self.projection_path, "a"
+        ) as hdf:
+            kind_group = hdf.require_group(kind)
+            if name in kind_group:
+                del kind_group[name]
+            group = kind_group.create_group(name)
+            group.attrs["paras"] = paras_string
+            group.attrs["columns"] = list(coords_df.columns)
+            group.create_dataset("coords", data=coords_df.to_numpy(dtype=float))
+            uids = np.array(coords_df.index, dtype=h5py.string_dtype())
+            group.create_dataset("uids", data=uids)
+
+    @staticmethod
+    def _projection_name(paras_string: str) -> str:
+        """
+        :param paras_string: parameters in string format
+        :return: name of the group of the projection
+        """
+        return paras_string.replace(" ; ", "__").replace("/", "_")
 
-        # Check whether csv file is present (csv less mode activated if not)
-        csv_less_flag = False
-        if not csv_path.is_file():
-            csv_less_flag = True
+    def _read_projection(self, kind: str, group, uids) -> DataFrame:
+        """
+        :param kind: umap, tsne or initial
+        :param group: group of the stored projection
+        :param uids: UIDs of the proteins with embeddings
+        :return: coordinates of the UIDs, None if some of them are missing
+        """
+        coords_df = DataFrame(
+            group["coords"][:],
+            index=group["uids"].asstr()[:],
+            columns=list(group.attrs["columns"]),
+        )
+        if not set(uids) <= set(coords_df.index):
             if self.verbose:
                 print(
-                    "No csv file found!\nActivate csv less mode, no groups or"
-                    " features are visualized."
+                    f"Stored {kind} projection {group.attrs['paras']}"
+                    " doesn't match the data and is skipped."
                 )
-        # get csv headers to check whether csv only exists for mapping
-        else:
-            headers = self._get_headers(csv_path, separator)
-            mapped_headers = ["mapped_id", "original_id"]
+            return None
+        if len(coords_df) != len(uids):
+            coords_df = coords_df.loc[list(uids)]
 
-            mapped_headers.sort()
-            headers.sort()
+        return coords_df
 
-            if headers == mapped_headers:
-                csv_less_flag = True
+    def load_projections(self, kind: str, uids) -> dict:
+        """
+        Reads the stored projections of one kind. Projections are keyed by
+        UID, proteins removed from the csv file are left out. Projections
+        missing any of the given UIDs are outdated and skipped.
+        :param kind: umap, tsne or initial
+        :param uids: UIDs of the proteins with embeddings
+        :return: parameter strings and their coordinates
+        """
+        projections = dict()
+        if not self.projection_path.is_file():
+            return projections
 
-                if self.verbose:
-                    print("No groups/features in csv file!")
+        with self._projection_file_lock(), h5py.File(
+            self.projection_path, "r"
+        ) as hdf:
+            if kind not in hdf:
+                return projections
 
-        return csv_less_flag
+            for group in hdf[kind].values():
+                coords_df = self._read_projection(kind, group, uids)
+                if coords_df is not None:
+                    projections[group.attrs["paras"]] = coords_df
 
-    def _check_mapped(self, csv_path: Path, separator: str):
+        return projections
+
+    def load_projection(self, kind: str, paras_string: str, uids) -> DataFrame:
         """
-        Checks whether the given files were mapped beforehand or not
-        :param csv_path: Path to the csv file
-        :param separator: Separator of the csv file
-        :return: bool value whether things are mapped or not
+        Reads one stored projection, e.g. one calculated by another worker
+        :param kind: umap or tsne
+        :param paras_string: parameters in string format
+        :param uids: UIDs of the proteins with embeddings
+        :return: coordinates indexed by UID, None if not stored
         """
-        mapped_flag = False
-        if csv_path.is_file():
-            # get headers of csv file and create headers to be expected by a mapped file
-            headers = self._get_headers(csv_path, separator)
-            mapped_headers = ["mapped_id", "original_id"]
+        if not self.projection_path.is_file():
+            return None
 
-            # sort the headers that comparison is possible
-            headers.sort()
-            mapped_headers.sort()
+        path = f"{kind}/{self._projection_name(paras_string)}"
+        with self._projection_file_lock(), h5py.File(
+            self.projection_path, "r"
+        ) as hdf:
+            if path not in hdf:
+                return None
 
-            check = all(item in headers for item in mapped_headers)
-            if check or headers == mapped_headers:
-                mapped_flag = True
+            return self._read_projection(kind, hdf[path], uids)
 
-        return mapped_flag
+    def reduce_embeddings(self, embs: np.ndarray, embs_uids: list):
+        """
+        Input of UMAP and t-SNE: the embeddings reduced with PCA to the
+        configured number of dimensions. The reduction is computed once and
+        stored with the projections.
+        :param embs: embeddings data
+        :param embs_uids: IDs of the embeddings in the order of the rows
+        :return: reduced embeddings, the embeddings if there is no reduction
+        """
+        n_components = self.umap_paras.get("pre_reduction", 0)
+        if n_components <= 0:
+            return embs
+        if n_components >= min(embs.shape):
+            print(
+                f"The embeddings can't be reduced to {n_components}"
+                " dimensions, UMAP and t-SNE use the full embeddings."
+            )
+            return embs
+
+        name = f"pca{n_components}"
+        if self.projection_path.is_file():
+            with h5py.File(self.projection_path, "r") as hdf:
+                group = hdf.get(f"pre_reduction/{name}")
+                if group is not None and list(
+                    group["uids"].asstr()[:]
+                ) == list(embs_uids):
+                    if self.verbose:
+                        print(
+                            f"Stored PCA pre-reduction to {n_components}"
+                            " dimensions is loaded, it retains"
+                            f" {group.attrs['variance'] * 100:.1f}% of the"
+                            " variance."
+                        )
+                    return group["coords"][:]
+
+        with self.profiler.stage("pre_reduction"):
+            pca_paras = self._get_pca_paras(embs, embs_uids)
+            if pca_paras is None:
+                reduced, variance_ratio = pca_fit(embs, n_components)
+            else:
+                reduced, variance_ratio = pca_fit_streaming(
+                    pca_paras["hdf_path"], pca_paras["uids"], n_components
+                )
+        reduced = reduced.astype(np.float32)
+        variance = float(np.sum(variance_ratio))
+
+        with h5py.File(self.projection_path, "a") as hdf:
+            pre_reduction_group = hdf.require_group("pre_reduction")
+            if name in pre_reduction_group:
+                del pre_reduction_group[name]
+            group = pre_reduction_group.create_group(name)
+            group.attrs["variance"] = variance
+            group.create_dataset("coords", data=reduced)
+            uids = np.array(embs_uids, dtype=h5py.string_dtype())
+            group.create_dataset("uids", data=uids)
+
+        print(
+            f"PCA pre-reduction to {n_components} dimensions retains"
+            f" {variance * 100:.1f}% of the variance."
+        )
+
+        return reduced
 
     def _read_fasta(self):
         """
         Reads in fasta file to a dictionary
         :return: fasta dictionary
         """
+        from Bio import SeqIO
+
         fasta_sequences = SeqIO.parse(open(self.fasta_path), "fasta")
         fasta_dict = SeqIO.to_dict(fasta_sequences)
         return fasta_dict
 
     @staticmethod
-    def _get_headers(csv_path: Path, separator: str):
-        """
-        Reads in csv file and extracts its headers
-        :param csv_path: Path to csv file
-        :param separator: Separator of the csv file
-        :return: Headers of the csv file in lost format
-        """
-        with open(csv_path, "r", encoding="utf-8-sig") as f:
-            first_line = f.readline()
-            headers = first_line.split(separator)
-
-        last_item = headers.pop()
-        headers.append(last_item.strip())
-
-        return headers
-
-    @staticmethod
-    def _create_csv_less_df(hdf_path: Path, mapped_flag: bool, csv_path: Path):
+    def _create_csv_less_df(hdf_path: Path, df: DataFrame = None):
         """
         df with "no group" column is created
         :param hdf_path: Path to hdf file
-        :param mapped_flag: Bool whether things are mapped or not
-        :param csv_path: Path to csv file
-        :return: created df and the original id column
+        :param df: IDs of a mapped csv file, None if there is no csv file
+        :return: created df
         """
-        original_id_col = None
-        if mapped_flag:
-            # read csv file
-            df = pd.read_csv(csv_path, sep=",", index_col=0)
-
-            # extract original ID column
-            original_id_col = df["original_id"].to_list()
-            df.drop(columns=["original_id"], inplace=True)
-
+        if df is not None:
             # create empty column no_group
             df["no_group"] = ""
         else:
             # get all ids of the h5 file
-            h5_uids = list()
             with h5py.File(hdf_path, "r") as hdf:
-                for identifier, embd in hdf.items():
-                    h5_uids.append(identifier)
+                h5_uids = list(hdf.keys())
 
             # create new dataframe with collected identifiers
             df = pd.DataFrame(index=h5_uids, columns=["no group"])
             df.index.name = "ID"
 
-        return df, original_id_col
+        return df
 
     def _handle_html(
         self,
@@ -405,130 +675,200 @@ class DataPreprocessor:
                         " index is a valid input!"
                     )
 
-    def _read_df_csv(
-        self,
-        output_d: Path,
-        df_csv: DataFrame,
-        hdf_path: Path,
-        csv_uids: list[str],
-        index_name: str,
-    ):
+    def _join_coordinates(self, df_csv: DataFrame, csv_uids: list[str]):
         """
-        If present, read df.csv and check for completion
-        :param output_d: Path to data directory
+        Joins the metadata with the coordinates of the initial projections.
+        The coordinates are stored apart from the metadata, keyed by UID, so
+        editing the csv file never invalidates them.
         :param df_csv: dataframe of given csv file
-        :param hdf_path: Path to h5 file
         :param csv_uids: unique IDs of the csv file
-        :param index_name: header of index row
-        :return: final dataframe and its column headers
+        :return: final dataframe, its column headers, the embeddings and
+        their UIDs
         """
         # Create embeddings
-        embs = self._get_embeddings(hdf_path, csv_uids)
-        embedding_uids, embs = zip(*embs.items())
-        embeddings = np.vstack(embs)
+        with self.profiler.stage("load_hdf5"):
+            embedding_uids, embeddings = self._get_embeddings(
+                self.hdf_path, csv_uids
+            )
 
-        # load & read df.csv if present
-        pres_df = output_d / f"df_{hdf_path.stem}.csv"
-        if pres_df.is_file():
-            if self.verbose:
-                print(
-                    f"Pre computed dataframe file df_{hdf_path.stem}.csv is"
-                    " loaded."
-                )
+        with self.profiler.stage("read_coordinates"):
+            coords_df = self._load_coordinates(embedding_uids)
+
+        if coords_df is None:
+            coords_df = self._create_coordinates(
+                csv_uids, embeddings, embedding_uids
+            )
+            with self.profiler.stage("write_coordinates"):
+                self._save_coordinates(coords_df)
+
+        # counted among the loaded embeddings, not all stored ones
+        multiplicity = self._multiplicity(embeddings, embedding_uids)
+        if multiplicity is not None:
+            coords_df = coords_df.join(multiplicity)
+
+        df_embeddings = df_csv.join(coords_df, how="outer")
+        csv_header = [
+            header
+            for header in df_embeddings.columns
+            if header not in self.AXIS_NAMES and header != "variance"
+        ]
+
+        return df_embeddings, csv_header, embeddings, embedding_uids
+
+    def _load_coordinates(self, embs_uids: list[str]):
+        """
+        Reads the stored coordinates of the initial projections. A dataframe
+        cached by earlier versions with the metadata is converted once.
+        :param embs_uids: IDs of the embeddings
+        :return: coordinates indexed by UID, None if they have to be computed
+        """
+        coords_df = self.load_projections(INITIAL_PROJECTIONS, embs_uids).get(
+            INITIAL_PROJECTIONS
+        )
 
-            pres_df_csv = pd.read_csv(pres_df, index_col=0)
-            # pres_df_csv.fillna("NA", inplace=True)
-
-            # Check whether no. of rows equals data
-            if len(pres_df_csv) != len(df_csv):
-                print("# of rows doesn't match data!\nStart recalculation!")
-                df_embeddings, csv_header, embeddings = self._create_df(
-                    output_d,
-                    hdf_path,
-                    csv_uids,
-                    df_csv,
-                    index_name,
-                    embeddings,
-                    embedding_uids,
+        legacy_path = self.output_d / f"df_{self.hdf_path.stem}.csv"
+        if coords_df is None and legacy_path.is_file():
+            legacy_df = pd.read_csv(legacy_path, index_col=0)
+            columns = [
+                col
+                for col in self.AXIS_NAMES + ["variance"]
+                if col in legacy_df.columns
+            ]
+            coords_df = legacy_df.loc[
+                legacy_df.index.isin(embs_uids), columns
+            ]
+            complete = len(coords_df) == len(embs_uids)
+            if not complete or not self._check_coordinates(coords_df):
+                return None
+
+            # earlier versions computed them with the reproducible UMAP and
+            # sklearn t-SNE on the full embeddings
+            self._save_coordinates(
+                coords_df,
+                umap_paras_to_string(
+                    dict(self.umap_paras, mode="exact", pre_reduction=0)
+                ),
+                tsne_paras_to_string(
+                    dict(self.tsne_paras, backend="sklearn", pre_reduction=0)
+                ),
+            )
+            # the only copy is removed once the converted one can be read
+            converted = self.load_projections(INITIAL_PROJECTIONS, embs_uids)
+            if INITIAL_PROJECTIONS in converted:
+                os.remove(legacy_path)
+
+        if coords_df is None or not self._check_coordinates(coords_df):
+            return None
+
+        if not self._initial_paras_match(coords_df):
+            return None
+
+        # the explained variance of PCA is kept apart from the rows
+        if "variance" not in coords_df.columns:
+            with h5py.File(self.projection_path, "r") as hdf:
+                group = hdf[f"{INITIAL_PROJECTIONS}/{INITIAL_PROJECTIONS}"]
+                variance = list(group.attrs.get("variance", []))
+            coords_df = coords_df.assign(
+                variance=pd.Series(
+                    variance, index=coords_df.index[: len(variance)]
                 )
-            else:
-                # Check each column x, y & z for incompleteness
-                if not self._check_coordinates(pres_df_csv):
-                    if self.verbose:
-                        print("Start recalculation!")
-
-                    df_embeddings, csv_header, embeddings = self._create_df(
-                        output_d,
-                        hdf_path,
-                        csv_uids,
-                        df_csv,
-                        index_name,
-                        embeddings,
-                        embedding_uids,
-                    )
-                # columns x, y & z are fine
-                else:
-                    # Update df in case new columns were added to the csv
-                    if (
-                        len(df_csv.columns)
-                        - (len(pres_df_csv.columns) - len(self.AXIS_NAMES))
-                        > 0
-                    ):
-                        if self.verbose:
-                            print("New column(s) were found and will be added.")
-
-                        pres_df_csv = self._update_df(df_csv, pres_df_csv)
-
-                        # save the new obtained df
-                        pres_df_csv.to_csv(
-                            output_d / f"df_{hdf_path.stem}.csv",
-                            index_label=index_name,
-                        )
+            )
 
-                    # save final column names
-                    csv_header = [
-                        header
-                        for header in pres_df_csv.columns
-                        if header not in self.AXIS_NAMES
-                        and header != index_name
-                        and header != "variance"
-                    ]
+        if self.verbose:
+            print(
+                "Pre computed coordinates are loaded from"
+                f" {self.projection_path.name}."
+            )
 
-                    # Unify df name
-                    df_embeddings = pres_df_csv
+        return coords_df
 
-        # create dataframe from files
-        else:
-            df_embeddings, csv_header, embeddings = self._create_df(
-                output_d,
-                hdf_path,
-                csv_uids,
-                df_csv,
-                index_name,
-                embeddings,
-                embedding_uids,
+    def _initial_paras_match(self, coords_df: DataFrame) -> bool:
+        """
+        Checks that the stored initial projections were computed with the
+        configured UMAP and t-SNE parameters, including the UMAP mode, t-SNE
+        backend and pre-reduction. Outdated UMAP and t-SNE layouts are kept
+        under the parameters they were computed with.
+        :param coords_df: stored coordinates indexed by UID
+        :return: False if the initial projections have to be computed again
+        """
+        with h5py.File(self.projection_path, "r") as hdf:
+            group = hdf[f"{INITIAL_PROJECTIONS}/{INITIAL_PROJECTIONS}"]
+            stored = dict(
+                umap=group.attrs.get("umap_paras"),
+                tsne=group.attrs.get("tsne_paras"),
             )
+        current = dict(
+            umap=umap_paras_to_string(self.umap_paras),
+            tsne=tsne_paras_to_string(self.tsne_paras),
+        )
+        if stored == current:
+            return True
+
+        axis_names = dict(umap=self.UMAP_AXIS_NAMES, tsne=self.TSNE_AXIS_NAMES)
+        for kind, paras_string in stored.items():
+            # unknown parameters can't be filed
+            if paras_string is None or paras_string == current[kind]:
+                continue
+            if paras_string not in self.load_projections(kind, []):
+                self.save_projection(
+                    kind, paras_string, coords_df[axis_names[kind]]
+                )
 
-        return df_embeddings, csv_header, embeddings, embedding_uids
+        if self.verbose:
+            print(
+                "The initial projections were computed with other parameters"
+                f" ({stored['umap']}, {stored['tsne']}) and are computed"
+                " again."
+            )
+
+        return False
 
-    def _create_df(
+    def _save_coordinates(
+        self,
+        coords_df: DataFrame,
+        umap_paras_string: str = None,
+        tsne_paras_string: str = None,
+    ):
+        """
+        Stores the coordinates of the initial projections by UID. The
+        explained variance of PCA and the parameters of UMAP and t-SNE are
+        stored as attributes, so the variance isn't lost with the rows of
+        removed proteins and the projections aren't shown under other
+        parameters.
+        :param coords_df: coordinates indexed by UID
+        :param umap_paras_string: UMAP parameters, the configured ones if None
+        :param tsne_paras_string: t-SNE parameters, the configured ones if None
+        :return: None
+        """
+        if umap_paras_string is None:
+            umap_paras_string = umap_paras_to_string(self.umap_paras)
+        if tsne_paras_string is None:
+            tsne_paras_string = tsne_paras_to_string(self.tsne_paras)
+
+        self.save_projection(
+            INITIAL_PROJECTIONS,
+            INITIAL_PROJECTIONS,
+            coords_df.drop(columns="variance", errors="ignore"),
+        )
+
+        with h5py.File(self.projection_path, "a") as hdf:
+            group = hdf[f"{INITIAL_PROJECTIONS}/{INITIAL_PROJECTIONS}"]
+            group.attrs["variance"] = coords_df["variance"].dropna().to_numpy()
+            group.attrs["umap_paras"] = umap_paras_string
+            group.attrs["tsne_paras"] = tsne_paras_string
+
+    def _create_coordinates(
         self,
-        output_d: Path,
-        hdf_path: Path,
         csv_uids: list[str],
-        df_csv: DataFrame,
-        index_name: str,
         embs: np.ndarray,
         embs_uids: list[str],
     ):
         """
-        Use data and create corresponding dataframe
-        :param output_d: Path to data directory
-        :param hdf_path: Path to h5 file
+        Computes the initial projections of the embeddings
         :param csv_uids: unique IDs of csv file
-        :param df_csv: dataframe of csv file
-        :param index_name: header of index column
-        :return: complete dataframe and list of its headers
+        :param embs: embeddings data
+        :param embs_uids: IDs of the embeddings in the order of the rows
+        :return: coordinates indexed by UID
         """
 
         if self.verbose:
@@ -543,80 +883,83 @@ class DataPreprocessor:
             )
 
         if self.verbose:
-            # get pairwise distances; should be n_proteins x n_proteins
-            pairwise_dist = squareform(self._pairwise_distances(embs))
+            # the matrices are computed with the nearest neighbours
             print(
                 "Shape of pairwise distance matrix (num_proteins x"
-                f" num_proteins): {pairwise_dist.shape}"
+                f" num_proteins): {(len(embs), len(embs))}"
             )
 
-        # generate dimensionality reduction components and merge it to CSV DataFrame
-        df_dim_red_umap = self.generate_umap(embs, self.umap_paras)
+        # generate dimensionality reduction components
+        with self.profiler.stage("reducers"):
+            (
+                df_dim_red_umap,
+                df_dim_red_pca,
+                df_dim_red_tsne,
+            ) = self._run_reducers(embs, embs_uids)
         df_dim_red_umap.index = embs_uids
-        df_dim_red_pca = self._generate_pca(embs)
         df_dim_red_pca.index = embs_uids
-        df_dim_red_tsne = self.generate_tsne(embs, self.tsne_paras)
         df_dim_red_tsne.index = embs_uids
 
-        df_embeddings = df_csv.join(
-            [df_dim_red_umap, df_dim_red_pca, df_dim_red_tsne], how="outer"
-        )
-        csv_header = [
-            header
-            for header in df_embeddings.columns
-            if header not in self.AXIS_NAMES and header != "variance"
-        ]
-
-        # save dataframe
-        df_embeddings.to_csv(
-            output_d / f"df_{hdf_path.stem}.csv", index_label=index_name
-        )
-
-        return df_embeddings, csv_header, embs
+        return df_dim_red_umap.join([df_dim_red_pca, df_dim_red_tsne])
 
     def _get_embeddings(
         self, emb_h5file: Path, csv_uids: list[str]
-    ) -> dict[str, np.ndarray]:
+    ) -> tuple[tuple, np.ndarray]:
         """load pre-computed embeddings in .h5 file format
 
+        The rows are read straight into one matrix of the configured type,
+        without holding every embedding a second time before stacking them.
+
         Args:
             emb_h5file (str): path to hdf5 file containing embeddings
             csv_uids (list[str]): list of identifiers extracted from CSV file
 
         Returns:
-            dict[str, np.ndarray]: dictionary with fasta headers as keys and a
-                single vector (embeddings) per protein as value. Values have
-                1024-dimensions for ProtT5 and 128-dimensions for ProtTucker
+            tuple[tuple, np.ndarray]: fasta headers and the matrix with a
+                single vector (embedding) per protein in their order. Vectors
+                have 1024-dimensions for ProtT5 and 128-dimensions for
+                ProtTucker
         """
 
-        embeddings = dict()
-        missing = list()
+        csv_uid_set = set(csv_uids)
         if self.verbose:
             print(f"Loading pre-computed embeddings from: {emb_h5file}")
 
         with h5py.File(emb_h5file, "r") as hdf:
-            for identifier, embd in hdf.items():
-                if identifier in csv_uids:
-                    embeddings[identifier] = embd[:]
-                else:
-                    missing.append(identifier)
-
-        # Check whether any UIDs matched with the embedding.keys
-        if len(embeddings.keys()) == 0:
-            raise Exception(
-                "None of the Unique IDs of the h5 and the csv file matched."
+            identifiers = list(hdf.keys())
+            embedding_uids = tuple(
+                identifier
+                for identifier in identifiers
+                if identifier in csv_uid_set
             )
 
+            # Check whether any UIDs matched with the embedding.keys
+            if len(embedding_uids) == 0:
+                raise Exception(
+                    "None of the Unique IDs of the h5 and the csv file"
+                    " matched."
+                )
+
+            dim = hdf[embedding_uids[0]].shape[-1]
+            embeddings = np.empty((len(embedding_uids), dim), dtype=self.dtype)
+            for row, identifier in enumerate(embedding_uids):
+                embeddings[row] = hdf[identifier][:]
+
         if self.verbose:
-            print(f"Example: {next(iter(embeddings.keys()))}")
-            print(f"Number of embeddings: {len(embeddings)}")
+            missing = [
+                identifier
+                for identifier in identifiers
+                if identifier not in csv_uid_set
+            ]
+            print(f"Example: {embedding_uids[0]}")
+            print(f"Number of embeddings: {len(embedding_uids)}")
             if (nr_missed := len(missing)) > 0:
                 print(f"{nr_missed} protein(s) in h5 but not in csv file:")
                 print(", ".join(missing[:10]))
                 if nr_missed > 10:
                     print("...")
 
-        return embeddings
+        return embedding_uids, embeddings
 
     @staticmethod
     def _pairwise_distances(data: np.ndarray, metric: str = "euclidean"):
@@ -630,64 +973,169 @@ class DataPreprocessor:
         return pdist(data, metric=metric)
 
     @staticmethod
-    def generate_umap(data: np.ndarray, umap_paras: dict) -> pd.DataFrame:
+    def generate_umap(
+        data: np.ndarray,
+        umap_paras: dict,
+        init_df: DataFrame = None,
+        callback=None,
+    ) -> pd.DataFrame:
         """
         generated umap for given data
         :param data: embeddings data
         :param umap_paras: parameters of the UMAP calculation
+        :param init_df: UMAP coordinates in the order of the data to start
+        from, e.g. the displayed layout
+        :param callback: receives the intermediate layouts of a progressive
+        calculation, see umap_fit_progressive
         :return: dataframe of the umap coordinates
         """
-        # visualize high-dimensional embeddings with dimensionality reduction (here: umap)
-        # Tutorial: https://umap-learn.readthedocs.io/en/latest/basic_usage.html
-        # Parameters: https://umap-learn.readthedocs.io/en/latest/parameters.html
-        import umap
-
-        # 3D
-        fit = umap.UMAP(
-            n_neighbors=umap_paras["n_neighbours"],
-            min_dist=umap_paras["min_dist"],
-            random_state=42,
-            n_components=3,
-            metric=umap_paras["metric"],
-        )  # initialize umap; use random_state=42 for reproducibility
-        umap_fit = fit.fit_transform(data)  # fit umap to our embeddings
-        df_umap_3D = DataFrame(
-            data=umap_fit, columns=["x_umap_3D", "y_umap_3D", "z_umap_3D"]
+        (
+            data,
+            init_df,
+            callback,
+            inverse,
+        ) = DataPreprocessor._collapse_duplicates(data, init_df, callback)
+
+        init_3D, init_2D = None, None
+        if init_df is not None:
+            init_3D = init_df[get_axis_names("UMAP", False)].to_numpy(float)
+            init_2D = init_df[get_axis_names("UMAP", True)].to_numpy(float)
+
+        if callback is not None:
+            umap_fit_3D, umap_fit_2D = umap_fit_progressive(
+                data, umap_paras, (init_3D, init_2D), callback
+            )
+        else:
+            # visualize high-dimensional embeddings with dimensionality reduction (here: umap)
+            umap_fit_3D = umap_fit(data, umap_paras, 3, init_3D)
+            umap_fit_2D = umap_fit(data, umap_paras, 2, init_2D)
+
+        if inverse is not None:
+            umap_fit_3D = umap_fit_3D[inverse]
+            umap_fit_2D = umap_fit_2D[inverse]
+
+        return DataPreprocessor._umap_df(umap_fit_3D, umap_fit_2D)
+
+    def _multiplicity(self, embs: np.ndarray, embs_uids: list):
+        """
+        Counts how often the embedding of every protein occurs in the dataset
+        :param embs: embeddings data
+        :param embs_uids: IDs of the embeddings in the order of the rows
+        :return: number of identical embeddings per ID, None without duplicates
+        """
+        first, inverse = unique_rows(embs)
+        if len(first) == len(embs):
+            return None
+
+        if self.verbose:
+            print(
+                f"{len(embs) - len(first)} embeddings are duplicates,"
+                f" {len(first)} are unique."
+            )
+
+        return pd.Series(
+            np.bincount(inverse)[inverse],
+            index=embs_uids,
+            name=MULTIPLICITY_COLUMN,
         )
 
-        # 2D
-        fit = umap.UMAP(
-            n_neighbors=umap_paras["n_neighbours"],
-            min_dist=umap_paras["min_dist"],
-            random_state=42,
-            n_components=2,
-            metric=umap_paras["metric"],
-        )  # initialize umap; use random_state=42 for reproducibility
-        umap_fit = fit.fit_transform(data)  # fit umap to our embeddings
+    @staticmethod
+    def _collapse_duplicates(
+        data: np.ndarray, init_df: DataFrame = None, callback=None
+    ):
+        """
+        Identical embeddings are projected once by UMAP and t-SNE, their
+        coordinates are copied to all duplicates afterwards
+        :param data: embeddings data
+        :param init_df: coordinates to start from in the order of the data
+        :param callback: receives the intermediate layouts of a progressive
+        calculation
+        :return: unique embeddings, their coordinates to start from, the
+        callback receiving the layouts of all embeddings and the index of the
+        unique embedding of every embedding, None without duplicates
+        """
+        first, inverse = unique_rows(data)
+        if len(first) == len(data):
+            return data, init_df, callback, None
+
+        if init_df is not None:
+            init_df = init_df.iloc[first]
+
+        expanded_callback = None
+        if callback is not None:
+
+            def expanded_callback(progress: float, layouts: list) -> bool:
+                return callback(
+                    progress,
+                    [None if lay is None else lay[inverse] for lay in layouts],
+                )
+
+        return np.asarray(data)[first], init_df, expanded_callback, inverse
+
+    @staticmethod
+    def _umap_df(umap_fit_3D: np.ndarray, umap_fit_2D: np.ndarray):
+        """
+        Combines 3D and 2D UMAP coordinates in a dataframe
+        :param umap_fit_3D: coordinates of the 3D UMAP
+        :param umap_fit_2D: coordinates of the 2D UMAP
+        :return: dataframe of the umap coordinates
+        """
+        df_umap_3D = DataFrame(
+            data=umap_fit_3D, columns=["x_umap_3D", "y_umap_3D", "z_umap_3D"]
+        )
         df_umap_2D = DataFrame(
-            data=umap_fit, columns=["x_umap_2D", "y_umap_2D"]
+            data=umap_fit_2D, columns=["x_umap_2D", "y_umap_2D"]
         )
 
         # Combine
-        df_umap = pd.concat([df_umap_2D, df_umap_3D], axis=1)
-
-        return df_umap
+        return pd.concat([df_umap_2D, df_umap_3D], axis=1)
 
-    def _generate_pca(self, data: np.ndarray):
+    def _generate_pca(self, data: np.ndarray, pca_paras: dict = None):
         """
         generate PCA coords for given data
         :param data: embeddings data
+        :param pca_paras: HDF5 file and IDs to stream the embeddings from, see
+        _get_pca_paras
         :return: dataframe with PCA coordinates
         """
-        from sklearn.decomposition import PCA
+        if pca_paras is not None:
+            return self._pca_df(
+                *pca_fit_streaming(pca_paras["hdf_path"], pca_paras["uids"])
+            )
+
+        return self._pca_df(*pca_fit(data))
+
+    def _get_pca_paras(self, embs: np.ndarray, embs_uids: list):
+        """
+        Large embeddings are streamed from the HDF5 file for PCA instead of
+        decomposing the matrix in memory
+        :param embs: embeddings data
+        :param embs_uids: IDs of the embeddings in the order of the rows
+        :return: HDF5 file and IDs, None for PCA in memory
+        """
+        if embs.nbytes < STREAMING_PCA_BYTES:
+            return None
+
+        if self.verbose:
+            print(
+                f"Embeddings take {embs.nbytes / 2**20:.0f} MB, PCA is"
+                " calculated in chunks."
+            )
 
-        fit = PCA(n_components=3, random_state=42)
-        pca_fit = fit.fit_transform(data)
-        df_pca = DataFrame(data=pca_fit, columns=self.PCA_AXIS_NAMES)
+        return dict(hdf_path=str(self.hdf_path), uids=list(embs_uids))
+
+    def _pca_df(self, pca_coords: np.ndarray, variance_ratio: np.ndarray):
+        """
+        Combines PCA coordinates and explained variance in a dataframe
+        :param pca_coords: coordinates of the 3D PCA
+        :param variance_ratio: explained variance ratio of the components
+        :return: dataframe with PCA coordinates
+        """
+        df_pca = DataFrame(data=pca_coords, columns=self.PCA_AXIS_NAMES)
 
         # extract variance information from pca
         pca_variance = list()
-        for variance in fit.explained_variance_ratio_:
+        for variance in variance_ratio:
             pca_variance.append(variance * 100)
 
         variance_df = DataFrame({"variance": pca_variance})
@@ -696,49 +1144,177 @@ class DataPreprocessor:
         return df_pca
 
     @staticmethod
-    def generate_tsne(data: np.ndarray, tsne_paras: dict):
+    def generate_tsne(
+        data: np.ndarray,
+        tsne_paras: dict,
+        init_df: DataFrame = None,
+        callback=None,
+    ):
         """
         Generate tsne coordinates for given data
         :param data: embeddings data
         :param tsne_paras: hyperparameters of t-SNE saved in a dictionary
+        :param init_df: t-SNE coordinates in the order of the data to start
+        from, e.g. the displayed layout
+        :param callback: receives the intermediate layouts of a progressive
+        calculation, see tsne_fit_both
         :return: dataframe with t-sne coordinates
         """
-        from sklearn.manifold import TSNE
-
-        # 3D
-        fit = TSNE(
-            n_components=3,
-            random_state=42,
-            init="random",
-            learning_rate=tsne_paras["learning_rate"],
-            n_iter=tsne_paras["iterations"],
-            perplexity=tsne_paras["perplexity"],
-            metric=tsne_paras["tsne_metric"],
-        )
-        tsne_fit = fit.fit_transform(data)
-        df_tsne_3D = DataFrame(
-            data=tsne_fit, columns=["x_tsne_3D", "y_tsne_3D", "z_tsne_3D"]
+        (
+            data,
+            init_df,
+            callback,
+            inverse,
+        ) = DataPreprocessor._collapse_duplicates(data, init_df, callback)
+
+        init = None
+        if init_df is not None:
+            init = (
+                init_df[get_axis_names("TSNE", False)].to_numpy(float),
+                init_df[get_axis_names("TSNE", True)].to_numpy(float),
+            )
+
+        tsne_fit_3D, tsne_fit_2D = tsne_fit_both(
+            data, tsne_paras, init, callback
         )
+        if inverse is not None:
+            tsne_fit_3D = tsne_fit_3D[inverse]
+            tsne_fit_2D = tsne_fit_2D[inverse]
 
-        # 2D
-        fit = TSNE(
-            n_components=2,
-            random_state=42,
-            init="random",
-            learning_rate=tsne_paras["learning_rate"],
-            n_iter=tsne_paras["iterations"],
-            perplexity=tsne_paras["perplexity"],
-            metric=tsne_paras["tsne_metric"],
+        return DataPreprocessor._tsne_df(tsne_fit_3D, tsne_fit_2D)
+
+    @staticmethod
+    def _tsne_df(tsne_fit_3D: np.ndarray, tsne_fit_2D: np.ndarray):
+        """
+        Combines 3D and 2D t-SNE coordinates in a dataframe
+        :param tsne_fit_3D: coordinates of the 3D t-SNE
+        :param tsne_fit_2D: coordinates of the 2D t-SNE
+        :return: dataframe with t-sne coordinates
+        """
+        df_tsne_3D = DataFrame(
+            data=tsne_fit_3D, columns=["x_tsne_3D", "y_tsne_3D", "z_tsne_3D"]
         )
-        tsne_fit = fit.fit_transform(data)
         df_tsne_2D = DataFrame(
-            data=tsne_fit, columns=["x_tsne_2D", "y_tsne_2D"]
+            data=tsne_fit_2D, columns=["x_tsne_2D", "y_tsne_2D"]
         )
 
         # Combine
-        df_tsne = pd.concat([df_tsne_2D, df_tsne_3D], axis=1)
+        return pd.concat([df_tsne_2D, df_tsne_3D], axis=1)
 
-        return df_tsne
+    def _run_reducers_sequential(
+        self, embs: np.ndarray, reduced: np.ndarray, pca_paras: dict
+    ):
+        """
+        Runs the reducers one after another in this process
+        :param embs: embeddings data
+        :param reduced: input of UMAP and t-SNE, see reduce_embeddings
+        :param pca_paras: HDF5 file and IDs to stream from for PCA or None
+        :return: dataframes of the UMAP, PCA and t-SNE coordinates
+        """
+        with self.profiler.stage("umap"):
+            df_umap = self.generate_umap(reduced, self.umap_paras)
+        with self.profiler.stage("pca"):
+            df_pca = self._generate_pca(embs, pca_paras)
+        with self.profiler.stage("tsne"):
+            df_tsne = self.generate_tsne(reduced, self.tsne_paras)
+
+        return df_umap, df_pca, df_tsne
+
+    def _run_reducers(self, embs: np.ndarray, embs_uids: list):
+        """
+        Runs UMAP 3D/2D, PCA and t-SNE 3D/2D in parallel worker processes, so
+        the wall time is bounded by the slowest reducer. The workers map the
+        embeddings from a temporary .npy file and share the cores.
+        :param embs: embeddings data
+        :param embs_uids: IDs of the embeddings in the order of the rows
+        :return: dataframes of the UMAP, PCA and t-SNE coordinates
+        """
+        pca_paras = self._get_pca_paras(embs, embs_uids)
+        reduced = self.reduce_embeddings(embs, embs_uids)
+        tasks = dict(
+            umap_3D=self.umap_paras,
+            umap_2D=self.umap_paras,
+            pca=pca_paras,
+        )
+        # openTSNE shares the affinities of 3D and 2D within one process
+        if self.tsne_paras.get("backend", "sklearn") == "opentsne":
+            tasks["tsne"] = self.tsne_paras
+        else:
+            tasks["tsne_3D"] = self.tsne_paras
+            tasks["tsne_2D"] = self.tsne_paras
+
+        n_threads = available_threads()
+        # nothing to gain from extra processes
+        if n_threads < 2:
+            return self._run_reducers_sequential(embs, reduced, pca_paras)
+
+        # identical embeddings are projected once by UMAP and t-SNE
+        reducer_input, _, _, inverse = self._collapse_duplicates(reduced)
+
+        n_workers = min(len(tasks), n_threads)
+        embs_path = (
+            self.output_d / f".reducers_{self.hdf_path.stem}_{os.getpid()}.npy"
+        )
+        np.save(embs_path, np.ascontiguousarray(embs))
+        # PCA runs on the full embeddings, UMAP and t-SNE on the reduced ones
+        reduced_path = embs_path
+        if reducer_input is not embs:
+            reduced_path = embs_path.with_name(f"{embs_path.stem}_reduced.npy")
+            np.save(reduced_path, np.ascontiguousarray(reducer_input))
+
+        results = dict()
+        try:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                # fresh interpreters, the thread limits apply before numpy is loaded
+                mp_context=get_context("spawn"),
+                initializer=limit_threads,
+                initargs=(max(1, n_threads // n_workers),),
+            ) as executor:
+                futures = [
+                    executor.submit(
+                        run_reducer,
+                        name,
+                        str(embs_path if name == "pca" else reduced_path),
+                        paras,
+                    )
+                    for name, paras in tasks.items()
+                ]
+                for tid, future in enumerate(as_completed(futures), start=1):
+                    name, result, start, wall, cpu, peak_rss = future.result()
+                    results[name] = result
+                    self.profiler.add_record(
+                        name, start, wall, cpu, peak_rss, tid=tid
+                    )
+                    if self.verbose:
+                        print(
+                            f"{name} finished in {wall:.1f} s"
+                            f" ({len(results)}/{len(tasks)})"
+                        )
+        except BrokenProcessPool:
+            # e.g. a script without main guard or killed by the OOM killer
+            print("Reducer processes failed, they are run one after another.")
+            return self._run_reducers_sequential(embs, reduced, pca_paras)
+        finally:
+            for path in {embs_path, reduced_path}:
+                os.remove(path)
+
+        if "tsne" in results:
+            tsne_fit_3D, tsne_fit_2D = results["tsne"]
+        else:
+            tsne_fit_3D, tsne_fit_2D = results["tsne_3D"], results["tsne_2D"]
+        umap_fit_3D, umap_fit_2D = results["umap_3D"], results["umap_2D"]
+        if inverse is not None:
+            umap_fit_3D = umap_fit_3D[inverse]
+            umap_fit_2D = umap_fit_2D[inverse]
+            tsne_fit_3D = tsne_fit_3D[inverse]
+            tsne_fit_2D = tsne_fit_2D[inverse]
+
+        return (
+            self._umap_df(umap_fit_3D, umap_fit_2D),
+            self._pca_df(*results["pca"]),
+            self._tsne_df(tsne_fit_3D, tsne_fit_2D),
+        )
 
     def _check_coordinates(self, data_frame: DataFrame) -> bool:
         """
@@ -769,34 +1345,6 @@ class DataPreprocessor:
         # All values of the x,y & z column are correct
         return True
 
-    def _update_df(self, df_csv: DataFrame, pres_df_csv: DataFrame):
-        """
-        new columns in data compared to present df.csv is added to df.csv
-        :param df_csv: dataframe of data
-        :param pres_df_csv: dataframe of df.csv
-        :return: updated dataframe of df.csv
-        """
-        # extract column names
-        df_cols = set(df_csv.columns)
-        pres_df_cols = set(pres_df_csv.columns)
-
-        # get missing columns in present df
-        missing_cols = df_cols - pres_df_cols
-
-        # add missing columns to the present df
-        for col in missing_cols:
-            pres_df_csv.insert(
-                len(pres_df_cols) - len(self.AXIS_NAMES), col, df_csv[col]
-            )
-            if self.verbose:
-                print(
-                    f"Missing column {col} from the .csv file has been added to"
-                    " the present df.csv file."
-                )
-
-        # return updated df
-        return pres_df_csv
-
     @staticmethod
     def _check_csv_uids(embeddings_uids: list[str], csv_uids: list[str]):
         """
@@ -823,13 +1371,10 @@ class DataPreprocessor:
         :param df: dataframe with all the data
         :return: the wanted dictionary
         """
-        umap_paras_dict = dict()
-        n_neighbours = self.umap_paras["n_neighbours"]
-        min_dist = self.umap_paras["min_dist"]
-        metric = self.umap_paras["metric"]
-        umap_paras_string = (
-            str(n_neighbours) + " ; " + str(min_dist) + " ; " + metric
+        umap_paras_dict = self.load_projections(
+            "umap", df.index[df[self.UMAP_AXIS_NAMES[0]].notna()]
         )
+        umap_paras_string = umap_paras_to_string(self.umap_paras)
         coords_df = df[self.UMAP_AXIS_NAMES]
         umap_paras_dict[umap_paras_string] = coords_df
 
@@ -841,21 +1386,11 @@ class DataPreprocessor:
         :param df: dataframe with all the data
         :return: the wanted dictionary
         """
-        tsne_paras_dict = dict()
-        iterations = self.tsne_paras["iterations"]
-        perplexity = self.tsne_paras["perplexity"]
-        learning_rate = self.tsne_paras["learning_rate"]
-        tsne_metric = self.tsne_paras["tsne_metric"]
-        # String representation of the current TSNE parameters
-        tsne_paras_string = (
-            str(iterations)
-            + " ; "
-            + str(perplexity)
-            + " ; "
-            + str(learning_rate)
-            + " ; "
-            + str(tsne_metric)
+        tsne_paras_dict = self.load_projections(
+            "tsne", df.index[df[self.TSNE_AXIS_NAMES[0]].notna()]
         )
+        # String representation of the current TSNE parameters
+        tsne_paras_string = tsne_paras_to_string(self.tsne_paras)
         coords_df = df[self.TSNE_AXIS_NAMES]
         tsne_paras_dict[tsne_paras_string] = coords_df
 
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is then not recorded
+    resource = None
+
+
+def current_rss() -> int:
+    """
+    Resident set size of the current process
+    :return: RSS in bytes, 0 if it can't be determined
+    """
+    statm = Path("/proc/self/statm")
+    if statm.is_file():
+        with open(statm, "r") as f:
+            pages = int(f.readline().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE")
+
+    return max_rss()
+
+
+def max_rss() -> int:
+    """
+    High-water mark of the resident set size of the current process
+    :return: peak RSS in bytes, 0 if it can't be determined
+    """
+    if resource is None:
+        return 0
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    if sys.platform == "darwin":
+        return peak
+    return peak * 1024
+
+
+class _RSSSampler(threading.Thread):
+    """Polls the RSS in the background to catch the peak reached within a stage"""
+
+    def __init__(self, interval: float):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.peak = max(self.peak, current_rss())
+
+    def stop(self) -> int:
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss())
+        return self.peak
+
+
+class StageProfiler:
+    """
+    Records wall time, CPU time and peak RSS of named preprocessing stages.
+    Disabled profilers cost nothing, so stages can always be wrapped. The
+    cProfile statistics of a stage that runs several times are added up,
+    nested stages are covered by the statistics of their outermost stage.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        cprofile: bool = False,
+        sample_interval: float = 0.01,
+    ):
+        self.enabled = enabled or cprofile
+        self.cprofile = cprofile
+        self.sample_interval = sample_interval
+        self.records = list()
+        self._origin = time.perf_counter()
+        self._depth = 0
+        # name of an outermost stage: added up statistics, number of runs and
+        # the names of the stages nested in it
+        self._profiles = dict()
+        self._profiled_stage = None
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager measuring the enclosed block as one stage
+        :param name: name of the stage
+        """
+        if not self.enabled:
+            yield
+            return
+
+        sampler = _RSSSampler(self.sample_interval)
+        sampler.start()
+
+        # cProfile can't be nested, only the outermost stage is profiled
+        profile = None
+        if self.cprofile and self._depth == 0:
+            profile = cProfile.Profile()
+            self._profiled_stage = name
+            profile.enable()
+        profiled_in = self._profiled_stage if self.cprofile else None
+
+        depth = self._depth
+        self._depth += 1
+        rss_start = current_rss()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            cpu_time = time.process_time() - cpu_start
+            wall_end = time.perf_counter()
+            self._depth -= 1
+
+            if profile is not None:
+                profile.disable()
+                self._profiled_stage = None
+                self._add_profile(name, profile)
+            elif profiled_in is not None:
+                nested = self._profiles.setdefault(
+                    profiled_in, dict(stats=None, runs=0, nested=list())
+                )["nested"]
+                if name not in nested:
+                    nested.append(name)
+
+            peak_rss = sampler.stop()
+
+            self.records.append(
+                dict(
+                    name=name,
+                    depth=depth,
+                    start=wall_start - self._origin,
+                    wall=wall_end - wall_start,
+                    cpu=cpu_time,
+                    rss_start=rss_start,
+                    peak_rss=peak_rss,
+                    profiled_in=profiled_in,
+                )
+            )
+
+    def _add_profile(self, name: str, profile: cProfile.Profile):
+        """
+        Adds the statistics of a run of an outermost stage to the earlier runs
+        of the same name
+        :param name: name of the stage
+        :param profile: finished profile of the run
+        """
+        entry = self._profiles.setdefault(
+            name, dict(stats=None, runs=0, nested=list())
+        )
+        if entry["stats"] is None:
+            entry["stats"] = pstats.Stats(profile)
+        else:
+            entry["stats"].add(profile)
+        entry["runs"] += 1
+
+    def add_record(
+        self,
+        name: str,
+        start: float,
+        wall: float,
+        cpu: float,
+        peak_rss: int,
+        tid: int = 0,
+    ):
+        """
+        Adds a stage measured elsewhere, e.g. in a worker process, nested in
+        the currently open stage
+        :param name: name of the stage
+        :param start: time.perf_counter() at the start of the stage
+        :param wall: wall time in seconds
+        :param cpu: CPU time in seconds
+        :param peak_rss: peak RSS of the measuring process in bytes
+        :param tid: row of the stage in the timeline
+        """
+        if not self.enabled:
+            return
+
+        self.records.append(
+            dict(
+                name=name,
+                depth=self._depth,
+                start=start - self._origin,
+                wall=wall,
+                cpu=cpu,
+                rss_start=0,
+                peak_rss=peak_rss,
+                tid=tid,
+            )
+        )
+
+    def to_chrome_trace(self) -> dict:
+        """
+        Converts the records into the Chrome trace event format (chrome://tracing, Perfetto)
+        :return: trace in dictionary format
+        """
+        pid = os.getpid()
+        events = list()
+        for record in self.records:
+            events.append(
+                dict(
+                    name=record["name"],
+                    cat="preprocessing",
+                    ph="X",
+                    ts=record["start"] * 1e6,
+                    dur=record["wall"] * 1e6,
+                    pid=pid,
+                    tid=record.get("tid", 0),
+                    args=dict(
+                        cpu_s=round(record["cpu"], 4),
+                        rss_start_mb=round(record["rss_start"] / 2**20, 1),
+                        peak_rss_mb=round(record["peak_rss"] / 2**20, 1),
+                        profiled_in=record.get("profiled_in"),
+                    ),
+                )
+            )
+            events.append(
+                dict(
+                    name="RSS",
+                    ph="C",
+                    ts=(record["start"] + record["wall"]) * 1e6,
+                    pid=pid,
+                    args=dict(mb=round(record["peak_rss"] / 2**20, 1)),
+                )
+            )
+
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def write(self, output_d: Path, stem: str):
+        """
+        Saves the timeline and, if requested, the cProfile dumps to the output directory
+        :param output_d: output directory
+        :param stem: name of the dataset, used in the file names
+        :return: path of the trace file, None if disabled
+        """
+        if not self.enabled:
+            return None
+
+        trace_path = output_d / f"profile_{stem}.json"
+        with open(trace_path, "w") as f:
+            json.dump(self.to_chrome_trace(), f, indent=1)
+
+        for name, entry in self._profiles.items():
+            entry["stats"].dump_stats(output_d / f"profile_{stem}_{name}.prof")
+
+        return trace_path
+
+    def report(self) -> str:
+        """
+        Human readable summary of the recorded stages
+        :return: table in string format
+        """
+        lines = [
+            f"{'stage':<28}{'wall [s]':>10}{'cpu [s]':>10}{'peak RSS [MB]':>15}"
+        ]
+        for record in sorted(self.records, key=lambda r: r["start"]):
+            name = "  " * record["depth"] + record["name"]
+            lines.append(
+                f"{name:<28}{record['wall']:>10.3f}{record['cpu']:>10.3f}"
+                f"{record['peak_rss'] / 2**20:>15.1f}"
+            )
+        lines.append(f"process peak RSS: {max_rss() / 2**20:.1f} MB")
+        for name, entry in self._profiles.items():
+            line = f"cProfile of {name}: {entry['runs']} run(s)"
+            if entry["nested"]:
+                line += f", includes {', '.join(entry['nested'])}"
+            lines.append(line)
+
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import threading
+import uuid
+
+import numpy as np
+from pandas import DataFrame
+
+
+class ProgressiveJob:
+    """
+    UMAP or t-SNE recalculation running in a background thread. The latest
+    intermediate layouts are kept, so the graph can be updated while the
+    optimization is still running, and the recalculation can be cancelled
+    between two steps.
+    """
+
+    def __init__(
+        self,
+        kind: str,
+        paras: dict,
+        paras_string: str,
+        embeddings: np.ndarray,
+        init_df: DataFrame = None,
+    ):
+        """
+        :param kind: umap or tsne
+        :param paras: parameters of the recalculation
+        :param paras_string: parameters in string format, key of the result
+        :param embeddings: the embeddings in a numpy stack
+        :param init_df: coordinates in the order of the embeddings to start
+        from, None for a new layout
+        """
+        self.job_id = uuid.uuid4().hex
+        self.kind = kind
+        self.paras = paras
+        self.paras_string = paras_string
+        self.embeddings = embeddings
+        self.init_df = init_df
+
+        # replaced as a whole by the worker thread, never modified
+        self.layouts = (None, None)
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+
+        self._cancel_event = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name=f"progressive-{kind}", daemon=True
+        )
+
+    def start(self):
+        """
+        Starts the recalculation in the background
+        """
+        self._thread.start()
+
+    def cancel(self):
+        """
+        Stops the recalculation after the current step, the result is discarded
+        """
+        self._cancel_event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        :return: True if the recalculation was cancelled
+        """
+        return self._cancel_event.is_set()
+
+    @property
+    def finished(self) -> bool:
+        """
+        :return: True if the recalculation is done, failed or was cancelled
+        """
+        return not self._thread.is_alive()
+
+    def _update(self, progress: float, layouts: list) -> bool:
+        """
+        Callback of the reducers after every step
+        :param progress: share of the optimization that is done
+        :param layouts: current 3D and 2D coordinates
+        :return: True if the recalculation should stop
+        """
+        self.layouts = tuple(
+            None if layout is None else np.array(layout, copy=True)
+            for layout in layouts
+        )
+        self.progress = progress
+
+        return self.cancelled
+
+    def _run(self):
+        # imports umap and sklearn, which the app loads lazily
+        from src.preprocessing import DataPreprocessor
+
+        try:
+            if self.kind == "umap":
+                result = DataPreprocessor.generate_umap(
+                    self.embeddings, self.paras, self.init_df, self._update
+                )
+            else:
+                result = DataPreprocessor.generate_tsne(
+                    self.embeddings, self.paras, self.init_df, self._update
+                )
+        except Exception as e:
+            self.error = e
+            return
+
+        if not self.cancelled:
+            self.result = result
@@ -0,0 +1,646 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from src.profiler import max_rss
+
+# reduced budgets of recalculations started from the displayed layout
+WARM_START_EPOCHS = 100
+WARM_START_ITERATIONS = 300
+
+# epochs and iterations between two intermediate layouts of a progressive
+# recalculation
+PROGRESSIVE_EPOCHS = 50
+PROGRESSIVE_ITERATIONS = 50
+
+# embeddings larger than this (in bytes) are streamed from the HDF5 file in
+# chunks of PCA_CHUNK_SIZE proteins for PCA
+STREAMING_PCA_BYTES = 2**30
+PCA_CHUNK_SIZE = 4096
+
+# rows hashed at once to find identical embeddings
+UNIQUE_CHUNK_SIZE = 65536
+
+# environment variables read by the numeric libraries at import time
+THREAD_VARIABLES = [
+    "OMP_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "NUMBA_NUM_THREADS",
+]
+
+
+def available_threads() -> int:
+    """
+    Number of threads this process may use, a limit set by a parent process
+    (or the user) is respected
+    :return: number of threads
+    """
+    limit = os.environ.get("OMP_NUM_THREADS")
+    if limit is not None and limit.isdigit() and int(limit) > 0:
+        return int(limit)
+
+    # cores the process may run on, e.g. restricted by a batch scheduler
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def limit_threads(n_threads: int):
+    """
+    Initializer of worker processes, so parallel workers don't oversubscribe
+    the cores. Must run before numpy, sklearn or numba are imported.
+    :param n_threads: number of threads per worker
+    """
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(n_threads)
+
+
+def compute_array(data):
+    """
+    Embeddings stored in half precision are computed in float32, numpy and
+    the reducers have no fast float16 kernels
+    :param data: embeddings data
+    :return: the data, a float32 copy of float16 data
+    """
+    import numpy as np
+
+    data = np.asarray(data)
+    if data.dtype == np.float16:
+        return data.astype(np.float32)
+
+    return data
+
+
+def unique_rows(data):
+    """
+    Finds identical rows, e.g. the embeddings of identical sequences. The
+    rows are hashed as 64-bit words in chunks, rows with the same hash are
+    compared to rule out collisions.
+    :param data: embeddings data
+    :return: row of the first occurrence of every unique row and the index
+    of the unique row of every row
+    """
+    import numpy as np
+    import pandas as pd
+
+    data = np.asarray(data)
+    if len(data) == 0:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+
+    row_bytes = data.dtype.itemsize * data.shape[1]
+    n_words = -(-row_bytes // 8)
+    multipliers = np.random.default_rng(42).integers(
+        1, 2**63, n_words, dtype=np.uint64
+    )
+    multipliers |= np.uint64(1)
+
+    hashes = np.empty(len(data), dtype=np.uint64)
+    for start in range(0, len(data), UNIQUE_CHUNK_SIZE):
+        chunk = np.ascontiguousarray(data[start : start + UNIQUE_CHUNK_SIZE])
+        chunk = chunk.view(np.uint8).reshape(len(chunk), row_bytes)
+        if row_bytes % 8 != 0:
+            chunk = np.pad(chunk, ((0, 0), (0, n_words * 8 - row_bytes)))
+        # wraps around modulo 2**64
+        hashes[start : start + len(chunk)] = (
+            chunk.view(np.uint64) @ multipliers
+        )
+
+    inverse, _ = pd.factorize(hashes)
+    first = np.empty(inverse.max() + 1, dtype=int)
+    first[inverse[::-1]] = np.arange(len(data))[::-1]
+
+    for start in range(0, len(data), UNIQUE_CHUNK_SIZE):
+        stop = start + UNIQUE_CHUNK_SIZE
+        chunk = np.ascontiguousarray(data[start:stop])
+        representatives = np.ascontiguousarray(
+            data[first[inverse[start:stop]]]
+        )
+        if not np.array_equal(
+            chunk.view(np.uint8), representatives.view(np.uint8)
+        ):
+            # hash collision, sorts the rows instead
+            rows = np.ascontiguousarray(data).view(
+                np.dtype((np.void, row_bytes))
+            )[:, 0]
+            _, first, inverse = np.unique(
+                rows, return_index=True, return_inverse=True
+            )
+            break
+
+    return first, inverse
+
+
+def umap_fit(
+    data,
+    umap_paras: dict,
+    n_components: int,
+    init=None,
+    n_epochs: int = None,
+    learning_rate: float = 1.0,
+    precomputed_knn: tuple = None,
+):
+    """
+    Fits UMAP with the given number of components. A fixed random state makes
+    umap-learn run single-threaded, so only the exact mode sets one.
+    :param data: embeddings data
+    :param umap_paras: parameters of the UMAP calculation
+    :param n_components: dimension of the projection
+    :param init: coordinates to start from with a reduced number of epochs,
+    spectral initialization if None
+    :param n_epochs: number of epochs, the default of umap-learn (or the warm
+    start budget) if None
+    :param learning_rate: initial learning rate of the optimization
+    :param precomputed_knn: nearest neighbours of the data, so consecutive fits
+    don't search them again
+    :return: coordinates as numpy array
+    """
+    # Tutorial: https://umap-learn.readthedocs.io/en/latest/basic_usage.html
+    # Parameters: https://umap-learn.readthedocs.io/en/latest/parameters.html
+    import numba
+    import umap
+
+    if n_epochs is None and init is not None:
+        n_epochs = WARM_START_EPOCHS
+    data = compute_array(data)
+
+    if umap_paras.get("mode", "exact") == "fast":
+        random_state = None
+        # numba can't use more threads than it was started with
+        n_jobs = umap_paras.get("threads", 0)
+        if n_jobs <= 0 or n_jobs > numba.config.NUMBA_NUM_THREADS:
+            n_jobs = -1
+    else:
+        # use random_state=42 for reproducibility
+        random_state = 42
+        n_jobs = 1
+
+    fit = umap.UMAP(
+        n_neighbors=umap_paras["n_neighbours"],
+        min_dist=umap_paras["min_dist"],
+        random_state=random_state,
+        n_components=n_components,
+        metric=umap_paras["metric"],
+        n_jobs=n_jobs,
+        init="spectral" if init is None else init,
+        n_epochs=n_epochs,
+        learning_rate=learning_rate,
+        precomputed_knn=(
+            (None, None, None) if precomputed_knn is None else precomputed_knn
+        ),
+    )
+
+    return fit.fit_transform(data)
+
+
+def umap_fit_progressive(
+    data, umap_paras: dict, init: tuple = None, callback=None
+):
+    """
+    Fits 3D and 2D UMAP in steps of PROGRESSIVE_EPOCHS epochs, each step
+    continues from the layouts of the previous one. umap-learn has no hook into
+    its optimization, so every step is a fit of its own sharing the nearest
+    neighbours, the learning rate decays over the steps.
+    :param data: embeddings data
+    :param umap_paras: parameters of the UMAP calculation
+    :param init: 3D and 2D coordinates to start from with a reduced number of
+    epochs, spectral initialization if None
+    :param callback: called with the progress (0 to 1) and the 3D and 2D
+    layouts after every step, stops the calculation by returning True
+    :return: 3D and 2D coordinates as numpy arrays
+    """
+    layouts = [None, None] if init is None else list(init)
+    if layouts[0] is not None:
+        n_epochs = WARM_START_EPOCHS
+    else:
+        # default of umap-learn
+        n_epochs = 500 if len(data) <= 10000 else 200
+    # converted once for all steps
+    data = compute_array(data)
+
+    # searched once instead of in every step
+    from umap.umap_ import nearest_neighbors
+
+    knn = nearest_neighbors(
+        data,
+        umap_paras["n_neighbours"],
+        umap_paras["metric"],
+        dict(),
+        False,
+        42 if umap_paras.get("mode", "exact") == "exact" else None,
+    )
+
+    for done in range(0, n_epochs, PROGRESSIVE_EPOCHS):
+        epochs = min(PROGRESSIVE_EPOCHS, n_epochs - done)
+        for idx, n_components in enumerate([3, 2]):
+            layouts[idx] = umap_fit(
+                data,
+                umap_paras,
+                n_components,
+                layouts[idx],
+                n_epochs=epochs,
+                learning_rate=1.0 - done / n_epochs,
+                precomputed_knn=knn,
+            )
+
+        progress = (done + epochs) / n_epochs
+        if callback is not None and callback(progress, layouts):
+            break
+
+    return layouts[0], layouts[1]
+
+
+def pca_fit(data, n_components: int = 3):
+    """
+    Fits PCA with the given number of components
+    :param data: embeddings data
+    :param n_components: dimension of the projection
+    :return: coordinates and explained variance ratios as numpy arrays
+    """
+    from sklearn.decomposition import PCA
+
+    fit = PCA(n_components=n_components, random_state=42)
+    pca_fit = fit.fit_transform(compute_array(data))
+
+    return pca_fit, fit.explained_variance_ratio_
+
+
+def hdf_chunks(hdf_path: str, uids: list, chunk_size: int = PCA_CHUNK_SIZE):
+    """
+    Reads the embeddings of the HDF5 file in chunks of similar size
+    :param hdf_path: path of the HDF5 file holding one embedding per protein
+    :param uids: IDs of the proteins in the order of the rows
+    :param chunk_size: maximum number of proteins per chunk
+    :return: generator of the chunks as numpy arrays
+    """
+    import h5py
+    import numpy as np
+
+    n_chunks = max(1, -(-len(uids) // chunk_size))
+    with h5py.File(hdf_path, "r") as hdf:
+        for chunk_uids in np.array_split(np.asarray(uids), n_chunks):
+            yield np.vstack([hdf[uid][:] for uid in chunk_uids])
+
+
+def pca_fit_streaming(
+    hdf_path: str,
+    uids: list,
+    n_components: int = 3,
+    chunk_size: int = PCA_CHUNK_SIZE,
+):
+    """
+    Fits PCA incrementally on chunks read from the HDF5 file, so the embeddings
+    and a centered copy of them don't have to fit into memory. The file is
+    read twice, to fit and to project.
+    :param hdf_path: path of the HDF5 file holding one embedding per protein
+    :param uids: IDs of the proteins in the order of the rows
+    :param n_components: dimension of the projection
+    :param chunk_size: maximum number of proteins per chunk
+    :return: coordinates and explained variance ratios as numpy arrays
+    """
+    import numpy as np
+    from sklearn.decomposition import IncrementalPCA
+
+    fit = IncrementalPCA(n_components=n_components)
+    for chunk in hdf_chunks(hdf_path, uids, chunk_size):
+        fit.partial_fit(chunk)
+
+    pca_fit = np.concatenate(
+        [
+            fit.transform(chunk)
+            for chunk in hdf_chunks(hdf_path, uids, chunk_size)
+        ]
+    )
+
+    return pca_fit, fit.explained_variance_ratio_
+
+
+def resolve_tsne_backend(backend: str) -> str:
+    """
+    Picks the t-SNE implementation. openTSNE is optional, sklearn is used if it
+    isn't installed.
+    :param backend: auto, opentsne or sklearn
+    :return: opentsne or sklearn
+    """
+    if backend == "sklearn":
+        return backend
+
+    try:
+        import openTSNE  # noqa: F401
+    except ImportError:
+        if backend == "opentsne":
+            print(
+                "openTSNE is not installed, sklearn is used for t-SNE.\nInstall"
+                " it with pip install openTSNE"
+            )
+        return "sklearn"
+
+    return "opentsne"
+
+
+def tsne_fit(data, tsne_paras: dict, n_components: int, init=None):
+    """
+    Fits t-SNE of sklearn with the given number of components
+    :param data: embeddings data
+    :param tsne_paras: hyperparameters of t-SNE saved in a dictionary
+    :param n_components: dimension of the projection
+    :param init: coordinates to start from with a reduced number of
+    iterations, random initialization if None
+    :return: coordinates as numpy array
+    """
+    from sklearn.manifold import TSNE
+
+    iterations = tsne_paras["iterations"]
+    early_exaggeration = 12.0
+    if init is not None:
+        # sklearn needs at least 250 iterations. The layout is already spread
+        # out, so it isn't exaggerated.
+        iterations = max(250, min(iterations, WARM_START_ITERATIONS))
+        early_exaggeration = 1.0
+
+    fit = TSNE(
+        n_components=n_components,
+        random_state=42,
+        init="random" if init is None else init,
+        early_exaggeration=early_exaggeration,
+        learning_rate=tsne_paras["learning_rate"],
+        n_iter=iterations,
+        perplexity=tsne_paras["perplexity"],
+        metric=tsne_paras["tsne_metric"],
+    )
+
+    return fit.fit_transform(compute_array(data))
+
+
+def opentsne_fit(data, tsne_paras: dict, init: tuple = None, callback=None):
+    """
+    Fits 3D and 2D t-SNE with openTSNE. The affinities are computed once and
+    shared by both runs, the layouts are initialized with PCA. 2D uses the
+    FFT-accelerated gradient on large datasets, 3D Barnes-Hut.
+    :param data: embeddings data
+    :param tsne_paras: hyperparameters of t-SNE saved in a dictionary
+    :param init: 3D and 2D coordinates to continue from with a reduced number
+    of iterations, PCA initialization if None
+    :param callback: called with the progress (0 to 1) and the 3D and 2D
+    layouts every PROGRESSIVE_ITERATIONS iterations, stops the calculation by
+    returning True
+    :return: 3D and 2D coordinates as numpy arrays
+    """
+    import numpy as np
+    from openTSNE import TSNEEmbedding, affinity, initialization
+
+    n_jobs = available_threads()
+    data = compute_array(data)
+
+    affinities = affinity.PerplexityBasedNN(
+        data,
+        perplexity=tsne_paras["perplexity"],
+        metric=tsne_paras["tsne_metric"],
+        n_jobs=n_jobs,
+        random_state=42,
+    )
+
+    embeddings = list()
+    for idx, n_components in enumerate([3, 2]):
+        # FFT interpolation only exists for up to 2 dimensions and has a fixed
+        # cost that only pays off for larger datasets
+        if n_components <= 2 and len(data) >= 10000:
+            gradient_method = "fft"
+        else:
+            gradient_method = "bh"
+
+        if init is None:
+            start = initialization.pca(
+                data, n_components=n_components, random_state=42
+            )
+        else:
+            start = np.ascontiguousarray(init[idx], dtype=float)
+
+        embeddings.append(
+            TSNEEmbedding(
+                start,
+                affinities,
+                negative_gradient_method=gradient_method,
+                n_jobs=n_jobs,
+                random_state=42,
+            )
+        )
+
+    # phases of the optimization as iterations, exaggeration and momentum
+    if init is not None:
+        # the displayed layout is only refined to the new affinities
+        phases = [
+            (min(tsne_paras["iterations"], WARM_START_ITERATIONS), None, 0.8)
+        ]
+    else:
+        # same schedule as sklearn: 250 iterations of early exaggeration
+        # are part of the iterations
+        phases = [
+            (250, 12, 0.5),
+            (max(0, tsne_paras["iterations"] - 250), None, 0.8),
+        ]
+    n_iter = sum(phase[0] for phase in phases)
+
+    # the optimizer keeps its state between calls, so optimizing in steps
+    # gives the same layouts as optimizing at once
+    done = 0
+    for iterations, exaggeration, momentum in phases:
+        step = iterations if callback is None else PROGRESSIVE_ITERATIONS
+        step = max(1, step)
+        for phase_done in range(0, iterations, step):
+            step_iter = min(step, iterations - phase_done)
+            for idx in range(len(embeddings)):
+                embeddings[idx] = embeddings[idx].optimize(
+                    n_iter=step_iter,
+                    exaggeration=exaggeration,
+                    momentum=momentum,
+                    learning_rate=tsne_paras["learning_rate"],
+                )
+            done += step_iter
+
+            layouts = [np.asarray(embedding) for embedding in embeddings]
+            if callback is not None and callback(done / n_iter, layouts):
+                return layouts[0], layouts[1]
+
+    return np.asarray(embeddings[0]), np.asarray(embeddings[1])
+
+
+def tsne_fit_both(data, tsne_paras: dict, init: tuple = None, callback=None):
+    """
+    Fits 3D and 2D t-SNE with the backend of the parameters
+    :param data: embeddings data
+    :param tsne_paras: hyperparameters of t-SNE saved in a dictionary
+    :param init: 3D and 2D coordinates to start from, None for a new layout
+    :param callback: called with the progress (0 to 1) and the 3D and 2D
+    layouts, stops the calculation by returning True. sklearn only reports
+    finished layouts.
+    :return: 3D and 2D coordinates as numpy arrays
+    """
+    if tsne_paras.get("backend", "sklearn") == "opentsne":
+        return opentsne_fit(data, tsne_paras, init, callback)
+
+    data = compute_array(data)
+    layouts = [None, None] if init is None else list(init)
+    for idx, n_components in enumerate([3, 2]):
+        layouts[idx] = tsne_fit(data, tsne_paras, n_components, layouts[idx])
+        if callback is not None and callback((idx + 1) / 2, layouts):
+            break
+
+    return layouts[0], layouts[1]
+
+
+def run_reducer(name: str, embeddings_path: str, paras: dict):
+    """
+    Runs one reducer in a worker process on the memory-mapped embeddings
+    :param name: umap_3D, umap_2D, pca, tsne_3D, tsne_2D or tsne (both)
+    :param embeddings_path: path of the .npy file holding the embeddings
+    :param paras: parameters of the reducer, for PCA the HDF5 file and IDs to
+    stream the embeddings from or None
+    :return: name, result of the fit and the start, wall time, CPU time and
+    peak RSS of the worker
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    data = np.load(embeddings_path, mmap_mode="r")
+    kind, _, dim = name.partition("_")
+    if kind == "umap":
+        result = umap_fit(data, paras, int(dim[0]))
+    elif kind == "pca" and paras is not None:
+        result = pca_fit_streaming(paras["hdf_path"], paras["uids"])
+    elif kind == "pca":
+        result = pca_fit(data)
+    elif dim:
+        result = tsne_fit(data, paras, int(dim[0]))
+    else:
+        result = tsne_fit_both(data, paras)
+
+    return (
+        name,
+        result,
+        start,
+        time.perf_counter() - start,
+        time.process_time() - cpu_start,
+        max_rss(),
+    )
+
+
+def set_numba_cache_dir(output_d: Path) -> Path:
+    """
+    Chooses the directory where numba keeps the compiled UMAP kernels between
+    runs. numba reads it once when it is imported, so it is shared by all
+    datasets of the process and must be set once, before the first import,
+    by the entry point. NUMBA_CACHE_DIR takes precedence if already set.
+    :param output_d: output directory of the first dataset of the run
+    :return: path of the cache directory
+    """
+    if "NUMBA_CACHE_DIR" not in os.environ:
+        os.environ["NUMBA_CACHE_DIR"] = str(output_d / "numba_cache")
+
+    return Path(os.environ["NUMBA_CACHE_DIR"])
+
+
+def numba_cache_dir() -> Path:
+    """
+    Directory where numba keeps the compiled UMAP kernels of this process
+    :return: path of the cache directory, None if numba uses its default
+    """
+    cache_d = os.environ.get("NUMBA_CACHE_DIR")
+
+    return Path(cache_d) if cache_d else None
+
+
+def warm_up_umap(
+    umap_paras: dict, n_samples: int, n_features: int, dtype
+) -> float:
+    """
+    Compiles the UMAP and NNDescent kernels by fitting a tiny synthetic dataset
+    of the same dimension and type as the embeddings
+    :param umap_paras: parameters of the UMAP calculation
+    :param n_samples: number of embeddings
+    :param n_features: dimension of the embeddings
+    :param dtype: data type of the embeddings
+    :return: duration in seconds
+    """
+    import numpy as np
+
+    start = time.perf_counter()
+
+    data = np.random.default_rng(42).random((128, n_features)).astype(dtype)
+    # UMAP switches to NNDescent for larger datasets, which is compiled
+    # separately as the tiny dataset takes the exact path
+    if n_samples >= 4096:
+        from pynndescent import NNDescent
+
+        NNDescent(data, n_neighbors=10, metric=umap_paras["metric"])
+    tiny_paras = dict(umap_paras, n_neighbours=10)
+    umap_fit(data, tiny_paras, 3)
+    umap_fit(data, tiny_paras, 2)
+
+    return time.perf_counter() - start
+
+
+def start_umap_warm_up(umap_paras: dict, embeddings, background: bool = True):
+    """
+    Warms up UMAP so the first recalculation doesn't wait for the compilation.
+    The duration of the first warm-up is stored next to the numba cache to
+    report the time saved by the cache in later runs.
+    :param umap_paras: parameters of the UMAP calculation
+    :param embeddings: the embeddings in a numpy stack
+    :param background: run in a daemon thread instead of blocking
+    :return: the thread, None if not run in the background
+    """
+    cache_d = numba_cache_dir()
+
+    def run():
+        try:
+            seconds = warm_up_umap(
+                umap_paras, *embeddings.shape, embeddings.dtype
+            )
+        except Exception as e:
+            # e.g. metrics which need a certain dimension
+            print(f"UMAP warm-up skipped: {e}")
+            return
+
+        if cache_d is None:
+            print(f"UMAP warm-up took {seconds:.1f} s")
+            return
+
+        stats_path = cache_d / "warmup.json"
+        if stats_path.is_file():
+            with open(stats_path, "r") as f:
+                cold = json.load(f)["cold"]
+            print(
+                f"UMAP warm-up took {seconds:.1f} s, the numba cache saved"
+                f" {max(0.0, cold - seconds):.1f} s"
+            )
+        else:
+            cache_d.mkdir(parents=True, exist_ok=True)
+            with open(stats_path, "w") as f:
+                json.dump(dict(cold=seconds), f)
+            print(
+                f"UMAP warm-up took {seconds:.1f} s, kernels are cached in"
+                f" {cache_d}"
+            )
+
+    if not background:
+        run()
+        return None
+
+    # numba's thread pool must be started by the main thread, otherwise the
+    # interpreter hangs at exit
+    import numba
+
+    numba.get_num_threads()
+
+    thread = threading.Thread(target=run, name="umap-warm-up", daemon=True)
+    thread.start()
+
+    return thread
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+from bisect import bisect_left
+
+import numpy as np
+import pandas as pd
+from pandas import DataFrame
+
+# options of the molecules dropdown menu returned for a search
+SEARCH_RESULTS = 50
+
+
+class SearchIndex:
+    """
+    Finds proteins by their ID or metadata for the molecules dropdown menu,
+    so the menu doesn't have to hold all IDs. IDs are found by their prefix
+    with a binary search over the sorted IDs, then by a substring in a single
+    string of all IDs, and proteins by the text values of their metadata.
+    Searches are case-insensitive.
+    """
+
+    def __init__(self, ids: list):
+        """
+        :param ids: IDs shown in the dropdown menu, in the order of the rows
+        of the metadata
+        """
+        self.ids = list(ids)
+        lower_ids = [str(seq_id).lower() for seq_id in self.ids]
+
+        # rows in the order of their IDs for prefix searches
+        self.order = np.argsort(np.asarray(lower_ids, dtype=object))
+        self.sorted_ids = [lower_ids[row] for row in self.order]
+
+        # all IDs separated by newlines for substring searches, the start of
+        # every ID maps a match back to its row
+        self.text = "\n".join(lower_ids)
+        lengths = np.fromiter(map(len, lower_ids), dtype=np.int64)
+        self.starts = np.concatenate([[0], np.cumsum(lengths + 1)[:-1]])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def prefix_rows(self, query: str, limit: int) -> list:
+        """
+        :param query: lowercase beginning of the IDs
+        :param limit: maximal number of rows
+        :return: rows whose ID starts with the query, in the order of the IDs
+        """
+        start = bisect_left(self.sorted_ids, query)
+        rows = list()
+        for position in range(start, min(start + limit, len(self))):
+            if not self.sorted_ids[position].startswith(query):
+                break
+            rows.append(int(self.order[position]))
+
+        return rows
+
+    def substring_rows(self, query: str, limit: int) -> list:
+        """
+        :param query: lowercase part of the IDs
+        :param limit: maximal number of rows
+        :return: rows whose ID contains the query, in the order of the rows
+        """
+        rows = list()
+        position = self.text.find(query)
+        while position >= 0 and len(rows) < limit:
+            row = np.searchsorted(self.starts, position, side="right") - 1
+            row = int(row)
+            rows.append(row)
+            # continue after the ID of the match
+            if row + 1 >= len(self):
+                break
+            position = self.text.find(query, self.starts[row + 1])
+
+        return rows
+
+    @staticmethod
+    def metadata_rows(df: DataFrame, query: str, limit: int) -> list:
+        """
+        :param df: metadata in the order of the IDs, text columns are
+        categoricals
+        :param query: lowercase part of a value
+        :param limit: maximal number of rows
+        :return: rows whose value of a text column contains the query, with
+        the column and the value
+        """
+        matches = list()
+        for column in df.columns:
+            values = df[column]
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                continue
+
+            categories = values.cat.categories
+            matched = [
+                code
+                for code, category in enumerate(categories)
+                if query in str(category).lower()
+            ]
+            if not matched:
+                continue
+
+            codes = values.cat.codes.to_numpy()
+            for row in np.flatnonzero(np.isin(codes, matched)):
+                matches.append((int(row), column, categories[codes[row]]))
+                if len(matches) >= limit:
+                    return matches
+
+        return matches
+
+    def search(
+        self,
+        query: str,
+        df: DataFrame = None,
+        limit: int = SEARCH_RESULTS,
+    ) -> list:
+        """
+        Options of the dropdown menu matching a search. IDs starting with the
+        query come first, then IDs containing it, then proteins with a
+        metadata value containing it.
+        :param query: text typed into the dropdown menu
+        :param df: metadata in the order of the IDs, not searched if None
+        :param limit: maximal number of options
+        :return: options with the ID as value, metadata matches are labelled
+        with the matching value
+        """
+        query = query.strip().lower().replace("\n", " ")
+
+        rows = self.prefix_rows(query, limit)
+        if query and len(rows) < limit:
+            found = set(rows)
+            for row in self.substring_rows(query, limit + len(found)):
+                if row not in found:
+                    rows.append(row)
+                    found.add(row)
+                if len(rows) >= limit:
+                    break
+        options = [
+            dict(label=self.ids[row], value=self.ids[row]) for row in rows
+        ]
+
+        if not query or df is None or len(options) >= limit:
+            return options
+
+        found = set(rows)
+        for row, column, value in self.metadata_rows(
+            df, query, limit + len(found)
+        ):
+            if row in found:
+                continue
+            found.add(row)
+            options.append(
+                dict(
+                    label=f"{self.ids[row]} ({column}: {value})",
+                    value=self.ids[row],
+                )
+            )
+            if len(options) >= limit:
+                break
+
+        return options
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+
+def _save_shared(array: np.ndarray, path: Path) -> np.memmap:
+    """
+    Saves an array as .npy file and maps it back read-only. The file is written
+    to a temporary name and swapped in, so running processes keep their mapping.
+    :param array: array to be shared
+    :param path: path of the .npy file
+    :return: read-only memory map of the array
+    """
+    # already mapped from this file, e.g. distance matrices of the precompute command
+    if (
+        isinstance(array, np.memmap)
+        and Path(array.filename).resolve() == path.resolve()
+    ):
+        return array
+
+    # written by another process with the same data, e.g. a worker that
+    # loaded the dataset first, whose pages are shared by mapping it
+    if path.is_file():
+        shared = np.load(path, mmap_mode="r")
+        if (
+            shared.dtype == array.dtype
+            and shared.shape == array.shape
+            and np.array_equal(shared, array)
+        ):
+            return shared
+
+    tmp_path = path.with_suffix(f".{os.getpid()}.tmp.npy")
+    np.save(tmp_path, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+    return np.load(path, mmap_mode="r")
+
+
+def share_arrays(
+    output_d: Path, stem: str, embeddings: np.ndarray, distance_dic: dict
+):
+    """
+    Places the embeddings and distance matrices in memory-mapped files in the
+    output directory. Every worker maps the same pages of the OS page cache
+    instead of holding its own copy.
+    :param output_d: output directory
+    :param stem: name of the dataset, used in the file names
+    :param embeddings: the embeddings in a numpy stack
+    :param distance_dic: distance matrices in a dictionary
+    :return: memory-mapped embeddings and distance dictionary
+    """
+    shared_d = output_d / "shared"
+    shared_d.mkdir(parents=True, exist_ok=True)
+
+    embeddings = _save_shared(embeddings, shared_d / f"{stem}_embeddings.npy")
+
+    shared_distance_dic = dict()
+    for metric, dis_mat in distance_dic.items():
+        shared_distance_dic[metric] = _save_shared(
+            dis_mat, shared_d / f"{stem}_{metric}.npy"
+        )
+
+    return embeddings, shared_distance_dic
+
+
+def memory_footprint(
+    df,
+    embeddings: np.ndarray,
+    distance_dic: dict,
+    figure_cache_mb: float = None,
+) -> int:
+    """
+    Estimates the memory held by one dataset, its data and the caches of the
+    rendered figures and spatial indexes at their limits
+    :param df: dataframe with all data
+    :param embeddings: the embeddings in a numpy stack
+    :param distance_dic: distance matrices in a dictionary
+    :param figure_cache_mb: memory in MB of the rendered figures, None if the
+    callbacks are not registered, which hold the caches
+    :return: size in bytes
+    """
+    from src.spatial import spatial_index_nbytes
+
+    nbytes = int(df.memory_usage(index=True, deep=True).sum())
+    nbytes += embeddings.nbytes
+    for dis_mat in distance_dic.values():
+        nbytes += dis_mat.nbytes
+    if figure_cache_mb is not None:
+        nbytes += int(figure_cache_mb * 2**20)
+        nbytes += spatial_index_nbytes(len(df))
+
+    return nbytes
+
+
+def run_production_server(wsgi_app, port: int, workers: int, threads: int):
+    """
+    Serves the application with a production WSGI server on localhost.
+    gunicorn forks the workers after the data is loaded (preload), so they
+    share the memory-mapped arrays. waitress is used as threaded single
+    process fallback, e.g. on Windows.
+    :param wsgi_app: WSGI application, e.g. the flask server of the dash app
+    :param port: port on which the website is locally hosted
+    :param workers: number of worker processes
+    :param threads: number of threads per worker
+    :return: None
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+
+    if BaseApplication is not None:
+
+        class DashApplication(BaseApplication):
+            def __init__(self, wsgi_app, options: dict):
+                self.options = options
+                self.application = wsgi_app
+                super().__init__()
+
+            def load_config(self):
+                for key, value in self.options.items():
+                    self.cfg.set(key, value)
+
+            def load(self):
+                return self.application
+
+        options = dict(
+            bind=f"127.0.0.1:{port}",
+            workers=workers,
+            threads=threads,
+            worker_class="gthread",
+            preload_app=True,
+            # recalculations of UMAP and t-SNE take minutes
+            timeout=0,
+        )
+        DashApplication(wsgi_app, options).run()
+        return
+
+    try:
+        import waitress
+    except ImportError:
+        raise Exception(
+            "Production mode needs gunicorn or waitress!\nInstall one of them,"
+            " e.g. pip install gunicorn"
+        )
+
+    waitress.serve(
+        wsgi_app, host="127.0.0.1", port=port, threads=workers * threads
+    )
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import itertools
+import threading
+
+import numpy as np
+
+# cells per axis of the grid over 2D and 3D coordinates
+GRID_CELLS = {2: 128, 3: 32}
+
+# share of the points of a zoomed level-of-detail view spent outside of the
+# visible region, so its surroundings stay recognizable
+LOD_CONTEXT_SHARE = 0.25
+# points of every group kept by a level-of-detail view
+LOD_GROUP_POINTS = 10
+
+# spatial indexes of displayed layouts kept by a SpatialIndexCache
+SPATIAL_INDEX_CACHE = 8
+
+
+class SpatialIndex:
+    """
+    Uniform grid over the projected coordinates of one layout. The points are
+    sorted by their cell, so the points of a region are sliced out instead of
+    comparing all coordinates.
+    """
+
+    def __init__(self, coords: np.ndarray):
+        """
+        :param coords: 2D or 3D coordinates, rows with missing values are left
+        out of the index
+        """
+        coords = np.asarray(coords, dtype=np.float32)
+        # rows of the coordinates held by the index
+        self.rows = np.flatnonzero(~np.isnan(coords).any(axis=1))
+        self.coords = coords[self.rows]
+        self.shape = (GRID_CELLS[coords.shape[1]],) * coords.shape[1]
+
+        if len(self.rows) > 0:
+            self.lower = self.coords.min(axis=0)
+            self.upper = self.coords.max(axis=0)
+        else:
+            self.lower = np.zeros(coords.shape[1], dtype=np.float32)
+            self.upper = np.zeros(coords.shape[1], dtype=np.float32)
+        extent = self.upper - self.lower
+        self.cell_size = np.where(extent > 0, extent / self.shape[0], 1.0)
+
+        self.cell_ids = np.ravel_multi_index(
+            self._cells(self.coords).T, self.shape
+        )
+        self.order = np.argsort(self.cell_ids, kind="stable")
+        # points of cell i are order[starts[i]:starts[i + 1]]
+        self.starts = np.searchsorted(
+            self.cell_ids[self.order], np.arange(np.prod(self.shape) + 1)
+        )
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _cells(self, coords: np.ndarray) -> np.ndarray:
+        """
+        :param coords: coordinates
+        :return: grid cell of every coordinate per axis, clipped to the grid
+        """
+        cells = np.floor((coords - self.lower) / self.cell_size).astype(int)
+
+        return np.clip(cells, 0, self.shape[0] - 1)
+
+    def _region_positions(self, lower, upper) -> np.ndarray:
+        """
+        :param lower: lower corner of the region
+        :param upper: upper corner of the region
+        :return: positions in the index of the points inside the region
+        """
+        lower = np.asarray(lower, dtype=np.float32)
+        upper = np.asarray(upper, dtype=np.float32)
+        if (
+            len(self) == 0
+            or np.any(upper < self.lower)
+            or np.any(lower > self.upper)
+        ):
+            return np.empty(0, dtype=int)
+
+        lower_cell, upper_cell = self._cells(np.vstack([lower, upper]))
+        # the cells along the last axis are consecutive in the sorted order
+        slices = list()
+        for leading in itertools.product(
+            *[
+                range(lo, hi + 1)
+                for lo, hi in zip(lower_cell[:-1], upper_cell[:-1])
+            ]
+        ):
+            corners = [[*leading, lower_cell[-1]], [*leading, upper_cell[-1]]]
+            first, last = np.ravel_multi_index(
+                np.transpose(corners), self.shape
+            )
+            start, stop = self.starts[first], self.starts[last + 1]
+            slices.append(self.order[start:stop])
+        candidates = np.concatenate(slices)
+
+        inside = np.all(
+            (self.coords[candidates] >= lower)
+            & (self.coords[candidates] <= upper),
+            axis=1,
+        )
+
+        return np.sort(candidates[inside])
+
+    def region(self, lower, upper) -> np.ndarray:
+        """
+        Points inside an axis-aligned box
+        :param lower: lower corner of the box
+        :param upper: upper corner of the box
+        :return: rows of the coordinates inside the box
+        """
+        return self.rows[self._region_positions(lower, upper)]
+
+    def polygon(self, vertices) -> np.ndarray:
+        """
+        Points inside a 2D polygon, e.g. a lasso selection
+        :param vertices: x and y of the vertices of the polygon
+        :return: rows of the coordinates inside the polygon
+        """
+        vertices = np.asarray(vertices, dtype=np.float32)
+        if len(vertices) < 3:
+            return np.empty(0, dtype=int)
+
+        candidates = self._region_positions(
+            vertices.min(axis=0), vertices.max(axis=0)
+        )
+        x, y = self.coords[candidates].T
+
+        # even-odd rule, a horizontal ray from every point crosses the edges
+        inside = np.zeros(len(candidates), dtype=bool)
+        for (x0, y0), (x1, y1) in zip(vertices, np.roll(vertices, -1, axis=0)):
+            crosses = (y0 > y) != (y1 > y)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                x_cross = x0 + (y - y0) * (x1 - x0) / (y1 - y0)
+            inside ^= crosses & (x < x_cross)
+
+        return self.rows[candidates[inside]]
+
+    def _sample(
+        self,
+        positions: np.ndarray,
+        codes: np.ndarray,
+        n_samples: int,
+        rng: np.random.Generator,
+    ) -> np.ndarray:
+        """
+        Density-preserving subsample. Every occupied cell of a grid coarse
+        enough for the budget keeps one point and the other points are drawn
+        in proportion to the number of points of their cell, so dense regions
+        keep their density and sparse regions and outliers stay visible. Every
+        group additionally keeps LOD_GROUP_POINTS representatives, as long as
+        there are few groups.
+        :param positions: positions in the index to sample from
+        :param codes: non-negative group code of every position
+        :param n_samples: expected number of points to keep
+        :param rng: random number generator
+        :return: positions of the sample
+        """
+        if len(positions) <= n_samples:
+            return positions
+
+        # coarsen the grid until its cells take at most a quarter of the budget
+        factor = 1
+        while (self.shape[0] // factor) ** len(self.shape) > n_samples // 4:
+            if self.shape[0] // factor == 1:
+                break
+            factor *= 2
+        coarse_shape = (self.shape[0] // factor,) * len(self.shape)
+        cells = np.unravel_index(self.cell_ids[positions], self.shape)
+        keys = np.ravel_multi_index(
+            tuple(
+                np.minimum(cell // factor, coarse_shape[0] - 1)
+                for cell in cells
+            ),
+            coarse_shape,
+        )
+
+        shuffle = rng.permutation(len(positions))
+        keys = keys[shuffle]
+        order = np.argsort(keys, kind="stable")
+        _, first, counts = np.unique(
+            keys[order], return_index=True, return_counts=True
+        )
+        rank = np.arange(len(order)) - np.repeat(first, counts)
+        # share of the points beyond the first one of every cell
+        share = max(0, n_samples - len(counts)) / (
+            len(positions) - len(counts)
+        )
+        # rounded at random, so the expected size is the budget
+        quota = (counts - 1) * share
+        quota = 1 + np.floor(quota + rng.random(len(quota))).astype(int)
+        keep = np.zeros(len(positions), dtype=bool)
+        keep[shuffle[order[rank < np.repeat(quota, counts)]]] = True
+
+        # representatives of every group
+        codes = codes[shuffle]
+        order = np.argsort(codes, kind="stable")
+        _, first, counts = np.unique(
+            codes[order], return_index=True, return_counts=True
+        )
+        # e.g. not for numeric columns with a group per value
+        if len(counts) * LOD_GROUP_POINTS <= n_samples // 4:
+            rank = np.arange(len(order)) - np.repeat(first, counts)
+            keep[shuffle[order[rank < LOD_GROUP_POINTS]]] = True
+
+        return positions[keep]
+
+    def level_of_detail(
+        self,
+        max_points: int,
+        codes: np.ndarray,
+        region: tuple = None,
+        seed: int = 42,
+    ) -> np.ndarray:
+        """
+        Points of a level-of-detail view. Zoomed out, a density-preserving
+        subsample of all points is returned. Zoomed into a region, all points
+        of the region are returned as long as they fit into the budget, and a
+        smaller subsample of the rest as context.
+        :param max_points: approximate number of points to return
+        :param codes: group code of every row of the coordinates
+        :param region: lower and upper corner of the visible region, None if
+        zoomed out
+        :param seed: seed of the subsample, so the view doesn't flicker
+        :return: sorted rows of the coordinates to display
+        """
+        if len(self) <= max_points:
+            return self.rows
+
+        rng = np.random.default_rng(seed)
+        # non-negative codes, missing values are coded as -1
+        codes = np.asarray(codes)[self.rows] + 1
+
+        if region is None:
+            positions = self._sample(
+                np.arange(len(self)), codes, max_points, rng
+            )
+            return self.rows[np.sort(positions)]
+
+        inside = self._region_positions(*region)
+        outside_mask = np.ones(len(self), dtype=bool)
+        outside_mask[inside] = False
+        outside = np.flatnonzero(outside_mask)
+
+        context = int(max_points * LOD_CONTEXT_SHARE)
+        if len(inside) > max_points - context:
+            inside = self._sample(
+                inside, codes[inside], max_points - context, rng
+            )
+        else:
+            context = max_points - len(inside)
+        outside = self._sample(outside, codes[outside], context, rng)
+
+        return self.rows[np.sort(np.concatenate([inside, outside]))]
+
+
+def view_region(view: dict, lower, upper):
+    """
+    Visible region of the graph from the zoom stored by the level-of-detail
+    callback. For 2D the axis ranges are exact. For 3D the region is estimated
+    from the camera: the box around its center shrinks with its distance to
+    the center, generously, so no visible point is missed.
+    :param view: x and y ranges (2D) or center and zoom of the camera (3D),
+    None if zoomed out
+    :param lower: lower corner of the coordinates
+    :param upper: upper corner of the coordinates
+    :return: lower and upper corner of the region, None if everything is
+    visible
+    """
+    if view is None:
+        return None
+    lower = np.asarray(lower, dtype=float)
+    upper = np.asarray(upper, dtype=float)
+
+    if "zoom" in view:
+        # stored for a graph of another dimension
+        if len(view["center"]) != len(lower):
+            return None
+        extent = upper - lower
+        center = (lower + upper) / 2 + np.asarray(view["center"]) * extent / 2
+        region_lower = center - extent * view["zoom"]
+        region_upper = center + extent * view["zoom"]
+    else:
+        region_lower, region_upper = lower.copy(), upper.copy()
+        for axis, name in enumerate(["x", "y"]):
+            if view.get(name) is not None:
+                region_lower[axis], region_upper[axis] = sorted(view[name])
+
+    if np.all(region_lower <= lower) and np.all(region_upper >= upper):
+        return None
+
+    return region_lower, region_upper
+
+
+def spatial_index_nbytes(n_points: int) -> int:
+    """
+    Upper bound of the memory held by the spatial indexes of a dataset, every
+    index of a full SpatialIndexCache over 3D coordinates of all points
+    :param n_points: number of points of the dataset
+    :return: size in bytes
+    """
+    # rows, cell ids and order as int64 and the float32 coordinates
+    per_index = n_points * (3 * 8 + 3 * 4)
+    # start of every grid cell
+    per_index += (GRID_CELLS[3] ** 3 + 1) * 8
+
+    return SPATIAL_INDEX_CACHE * per_index
+
+
+class SpatialIndexCache:
+    """
+    Spatial indexes of the displayed layouts, keyed by dimensionality
+    reduction, dimension and projection. An index is rebuilt when the
+    coordinates of its projection are replaced, the least recently used
+    indexes are dropped.
+    """
+
+    def __init__(self, max_size: int = SPATIAL_INDEX_CACHE):
+        """
+        :param max_size: number of indexes kept
+        """
+        self.max_size = max_size
+        # key: coordinates the index was built from and the index
+        self._indexes = dict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, source, coords: np.ndarray) -> SpatialIndex:
+        """
+        :param key: dimensionality reduction, dimension and parameters
+        :param source: object holding the coordinates of the projection, the
+        index is rebuilt if it is replaced
+        :param coords: displayed coordinates
+        :return: spatial index over the coordinates
+        """
+        with self._lock:
+            entry = self._indexes.pop(key, None)
+        if entry is None or entry[0] is not source:
+            entry = (source, SpatialIndex(coords))
+
+        with self._lock:
+            self._indexes[key] = entry
+            while len(self._indexes) > self.max_size:
+                self._indexes.pop(next(iter(self._indexes)))
+
+        return entry[1]
@@ -0,0 +1,158 @@
+// Recoloring and switching between 3D and 2D in the browser, used with
+// --clientside. The server sends the coordinates of the displayed projection
+// once and the groups of a column the first time it is selected, see
+// send_projection_points and send_column_groups in callbacks.py.
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    rostspace: {
+        // groups of the columns received so far, by column
+        columns: {},
+        // column selected before its groups were received
+        pending: null,
+
+        triggered: function () {
+            return dash_clientside.callback_context.triggered.map(
+                function (trigger) {
+                    return trigger.prop_id;
+                }
+            );
+        },
+
+        // asks the server for the groups of a column it hasn't sent yet
+        request_column: function (column, metadata_version, quantile_symbols) {
+            var rostspace = window.dash_clientside.rostspace;
+            var triggered = rostspace.triggered();
+
+            if (triggered.indexOf("metadata_version.data") >= 0) {
+                metadata_version.changed.forEach(function (changed) {
+                    delete rostspace.columns[changed];
+                });
+            }
+            if (triggered.indexOf("quantile_symbols_switch.value") >= 0) {
+                rostspace.columns = {};
+            }
+
+            if (!column || column in rostspace.columns) {
+                return window.dash_clientside.no_update;
+            }
+            // the same column may be requested again after a reload
+            return {column: column, time: Date.now()};
+        },
+
+        // shows the figure of the server, or builds the traces of the
+        // selected column and dimension from the groups and coordinates
+        display_figure: function (rendered, column, dim, groups, points, figure) {
+            var rostspace = window.dash_clientside.rostspace;
+            var triggered = rostspace.triggered();
+
+            if (triggered.indexOf("rendered_figure.data") >= 0) {
+                return rendered || window.dash_clientside.no_update;
+            }
+            if (triggered.indexOf("column_groups.data") >= 0) {
+                rostspace.columns[groups.column] = groups;
+                // the groups of the displayed column are kept for later
+                if (rostspace.pending !== groups.column) {
+                    return window.dash_clientside.no_update;
+                }
+            }
+
+            var encoding = rostspace.columns[column];
+            if (!encoding || !points || !figure) {
+                rostspace.pending = column;
+                return window.dash_clientside.no_update;
+            }
+            rostspace.pending = null;
+
+            var three_d = dim === "3D";
+            var axes = points.axes[dim].map(function (axis) {
+                return points.coords[axis];
+            });
+
+            // rows of every group
+            var rows = encoding.groups.map(function () {
+                return [];
+            });
+            encoding.codes.forEach(function (code, row) {
+                rows[code].push(row);
+            });
+
+            function pick(values, group_rows) {
+                return group_rows.map(function (row) {
+                    return values[row];
+                });
+            }
+
+            var data = encoding.groups.map(function (group, code) {
+                var group_rows = rows[code];
+                var marker = {
+                    size: 10,
+                    color: group.color,
+                    symbol: group.symbol,
+                    line: {color: "black", width: 1},
+                };
+                if (group.color === null) {
+                    marker.color = pick(encoding.values, group_rows);
+                    marker.coloraxis = "coloraxis";
+                }
+                var trace = {
+                    type: three_d ? "scatter3d" : "scatter",
+                    x: pick(axes[0], group_rows),
+                    y: pick(axes[1], group_rows),
+                    mode: "markers",
+                    name: group.name,
+                    opacity: group.opacity,
+                    marker: marker,
+                    text: pick(points.ids, group_rows),
+                    showlegend: group.showlegend,
+                    hoverinfo: "name+text",
+                    hoverlabel: {namelength: -1},
+                    hovertemplate: group.color === null
+                        ? encoding.colored_hovertemplate
+                        : encoding.hovertemplate,
+                };
+                if (three_d) {
+                    trace.z = pick(axes[2], group_rows);
+                }
+                if (points.multiplicity) {
+                    trace.customdata = pick(points.multiplicity, group_rows);
+                }
+                return trace;
+            });
+
+            // the highlighting traces are kept, a new dimension clears them
+            var same_dim = figure.data.length > 0
+                && (figure.data[0].type === "scatter3d") === three_d;
+            figure.data.forEach(function (trace) {
+                if (trace.hoverinfo !== "skip") {
+                    return;
+                }
+                if (same_dim) {
+                    data.push(trace);
+                    return;
+                }
+                var empty = Object.assign({}, trace, {
+                    type: three_d ? "scatter3d" : "scatter",
+                    x: [],
+                    y: [],
+                });
+                if (three_d) {
+                    empty.z = [];
+                } else {
+                    delete empty.z;
+                }
+                data.push(empty);
+            });
+
+            // the zoom and camera are kept for the same dimension
+            var layout = Object.assign(
+                {}, same_dim ? figure.layout : points.layouts[dim]
+            );
+            if (encoding.coloraxis) {
+                layout.coloraxis = encoding.coloraxis;
+            } else {
+                delete layout.coloraxis;
+            }
+
+            return {data: data, layout: layout};
+        },
+    },
+});
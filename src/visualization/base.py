@@ -5,6 +5,8 @@ import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
 from dash import Dash, dcc, html
 
+from src.dataset import tsne_paras_to_string, umap_paras_to_string
+
 metric_options = [
     "euclidean",
     "cosine",
@@ -41,14 +43,16 @@ help_modal_icon_style = {
 }
 
 
-def get_app():
+def get_app(requests_pathname_prefix: str = None):
     """
     Initializes dash application
+    :param requests_pathname_prefix: URL prefix if the app is not served at the root
     :return: application
     """
     app = Dash(
         __name__,
         external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP],
+        requests_pathname_prefix=requests_pathname_prefix,
     )
 
     return app
@@ -61,12 +65,13 @@ def init_app(
     dim_red: str,
     tsne_paras: dict,
     original_id_col: list,
+    requests_pathname_prefix: str = None,
 ):
     """
     Set up the layout of the application
     :return: application
     """
-    app = get_app()
+    app = get_app(requests_pathname_prefix)
 
     app.layout = dbc.Container(
         [
@@ -177,6 +182,19 @@ def get_graph_offcanvas(
             ),
             html.Br(),
             html.Br(),
+            dcc.Markdown("Metadata"),
+            dbc.Button(
+                "Reload the csv file",
+                id="metadata_reload_button",
+                color="dark",
+                outline=True,
+            ),
+            dbc.Switch(
+                id="quantile_symbols_switch",
+                label="Mark the quartiles of numeric columns with symbols",
+                value=False,
+            ),
+            html.Br(),
             dcc.Markdown("Dimensions"),
             dbc.RadioItems(
                 options=[
@@ -202,6 +220,16 @@ def get_graph_offcanvas(
             ),
             html.Br(),
             dcc.Markdown("Dimensionality reduction"),
+            dbc.Switch(
+                id="warm_start_switch",
+                label="Recalculate from the displayed layout (faster)",
+                value=False,
+            ),
+            dbc.Switch(
+                id="progressive_switch",
+                label="Show the layout while it is recalculated",
+                value=False,
+            ),
             dbc.Tabs(
                 id="dim_red_tabs",
                 children=[
@@ -257,6 +285,22 @@ def get_graph_offcanvas(
                                 ],
                             ),
                             html.Br(),
+                            dbc.RadioItems(
+                                id="umap_mode_radio",
+                                options=[
+                                    {"label": "exact", "value": "exact"},
+                                    {"label": "fast", "value": "fast"},
+                                ],
+                                value=umap_paras.get("mode", "exact"),
+                                inline=True,
+                            ),
+                            dbc.Tooltip(
+                                "exact: reproducible layout, fast: multithreaded"
+                                " layout that differs between calculations",
+                                target="umap_mode_radio",
+                                placement="left",
+                            ),
+                            html.Br(),
                             dbc.Button(
                                 "Recalculate UMAP",
                                 id="umap_recalculation_button",
@@ -405,24 +449,10 @@ def get_graph_container(
     :return: Layout of the offcanvas
     """
     # UMAP parameters in string format
-    umap_paras_string = str(
-        str(umap_paras["n_neighbours"])
-        + " ; "
-        + str(umap_paras["min_dist"])
-        + " ; "
-        + umap_paras["metric"],
-    )
+    umap_paras_string = umap_paras_to_string(umap_paras)
 
     # TSNE parameters in string format
-    tsne_paras_string = str(
-        str(tsne_paras["iterations"])
-        + " ; "
-        + str(tsne_paras["perplexity"])
-        + " ; "
-        + str(tsne_paras["learning_rate"])
-        + " ; "
-        + str(tsne_paras["tsne_metric"])
-    )
+    tsne_paras_string = tsne_paras_to_string(tsne_paras)
 
     # width sizing of the dropdown menu column and whether 2 dropdowns are above the graph or not
     if pdb:
@@ -460,7 +490,11 @@ def get_graph_container(
                     children=[
                         dcc.Dropdown(
                             id="molecules_dropdown",
-                            options=original_id_col,
+                            options=[],
+                            placeholder=(
+                                f"Search {len(original_id_col)} proteins by "
+                                "ID or metadata"
+                            ),
                             multi=True,
                             style={"margin-top": "5px"},
                         ),
@@ -475,6 +509,16 @@ def get_graph_container(
         dcc.Store(id="highlighting_bool", storage_type="memory", data=False),
         # Storage to save last camera data (relayoutData)
         dcc.Store(id="relayoutData_save", storage_type="memory", data={}),
+        # Storage to save the zoomed region of a level-of-detail view
+        dcc.Store(id="lod_region", storage_type="memory"),
+        # the metadata file is checked for changes every 10 seconds
+        dcc.Interval(id="metadata_interval", interval=10000),
+        # version of the metadata and the columns changed by the last reload
+        dcc.Store(
+            id="metadata_version",
+            storage_type="memory",
+            data=dict(version=0, changed=[]),
+        ),
         get_graph_offcanvas(
             umap_paras,
             umap_paras_string,
@@ -527,6 +571,46 @@ def get_graph_container(
                 ),
             ],
         ),
+        # progress of a recalculation in the progressive mode
+        dbc.Collapse(
+            id="progressive_collapse",
+            is_open=False,
+            children=[
+                dbc.Stack(
+                    direction="horizontal",
+                    gap=2,
+                    style={"margin-top": "5px"},
+                    children=[
+                        dbc.Progress(
+                            id="progressive_progress",
+                            value=0,
+                            color="dark",
+                            style={"flex": "1"},
+                        ),
+                        dbc.Button(
+                            "Cancel",
+                            id="progressive_cancel_button",
+                            color="dark",
+                            outline=True,
+                            size="sm",
+                        ),
+                    ],
+                ),
+            ],
+        ),
+        dcc.Interval(
+            id="progressive_interval", interval=1000, disabled=True
+        ),
+        dcc.Store(id="progressive_job", storage_type="memory"),
+        dcc.Store(id="progressive_result", storage_type="memory"),
+        dcc.Store(id="progressive_coords", storage_type="memory"),
+        html.Div(id="progressive_dummy", hidden=True),
+        # figure of the server and the data to recolor it in the browser,
+        # used with --clientside
+        dcc.Store(id="rendered_figure", storage_type="memory"),
+        dcc.Store(id="projection_points", storage_type="memory"),
+        dcc.Store(id="column_request", storage_type="memory"),
+        dcc.Store(id="column_groups", storage_type="memory"),
         dcc.Graph(
             id="graph",
             figure=fig,
@@ -194,12 +194,13 @@ def init_app_pdb(
     fig: go.Figure,
     dim_red: str,
     tsne_paras: dict,
+    requests_pathname_prefix: str = None,
 ):
     """
     Layout for the molecule displaying, in general the right column in pdb mode
     :return: application layout
     """
-    app = get_app()
+    app = get_app(requests_pathname_prefix)
 
     app.layout = dbc.Container(
         [
@@ -299,7 +300,11 @@ def init_app_pdb(
                             ),
                             dcc.Dropdown(
                                 id="molecules_dropdown",
-                                options=original_id_col,
+                                options=[],
+                                placeholder=(
+                                    f"Search {len(original_id_col)} proteins by "
+                                    "ID or metadata"
+                                ),
                                 multi=True,
                                 style={"margin-bottom": "5px"},
                             ),
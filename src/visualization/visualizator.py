@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
-import sys
 from colorsys import hls_to_rgb
 
 import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
-from matplotlib import cm
 from pandas import DataFrame
 
+from src.dataset import MULTIPLICITY_COLUMN, get_axis_names
+from src.spatial import SpatialIndex
+
 from .base import init_app
-from .pdb import init_app_pdb
+
+# bins of a numeric column marked with symbols and sampled from in a
+# level-of-detail view
+QUANTILE_SYMBOL_BINS = 4
+LOD_QUANTILE_BINS = 10
 
 
 class Visualizator:
@@ -117,116 +122,205 @@ class Visualizator:
         return rgb_list
 
     @staticmethod
-    def handle_colorbar(
-        col_groups: list,
-        fig: go.Figure,
-        n_symbols: int,
-        color_list: list,
-        two_d: bool,
-    ):
+    def is_continuous(values: pd.Series) -> bool:
         """
-        Creates a colorbar trace for the plot if only numeric values are in the group.
-        :param col_groups: the column groups
-        :param fig: the graph figure
-        :param n_symbols: number of different symbols to be displayed.
-        :param color_list: list with the different colors to be displayed.
-        :param two_d: if True graph should be displayed in 2D
-        :return: flag whether only numeric values are in the column and number of symbols to be used
+        Numeric columns are colored with a colorscale in one trace instead of
+        one trace per value
+        :param values: the selected column
+        :return: True if the column holds numbers or nothing but np.nan
         """
-        numeric_flag = False
-        if all(
-            [
-                isinstance(item, int) or isinstance(item, float)
-                for item in col_groups
-            ]
+        return pd.api.types.is_numeric_dtype(
+            values
+        ) and not pd.api.types.is_bool_dtype(values)
+
+    @staticmethod
+    def quantile_codes(values: pd.Series, n_bins: int) -> np.ndarray:
+        """
+        Bins the values of a numeric column by their quantiles
+        :param values: the selected column
+        :param n_bins: number of bins, fewer if values repeat
+        :return: bin of every row, -1 for np.nan
+        """
+        codes = pd.qcut(values, n_bins, labels=False, duplicates="drop")
+        # a column with a single value has no quantiles
+        codes[codes.isna() & values.notna()] = 0
+        return codes.fillna(-1).to_numpy(dtype=int)
+
+    @staticmethod
+    def sort_key(val):
+        """
+        Order of the groups in the legend: 1. int and float 2. str
+        (case-insensitive) 3. rest 4. np.nan
+        :param val: value of a group
+        :return: key to sort the groups by
+        """
+        if (
+            isinstance(val, float)
+            and not pd.isna(val)
+            or isinstance(val, int)
         ):
-            # Only numeric values and np.nan in the group
-            numeric_flag = True
-
-            # Only one symbol to be used
-            n_symbols = 1
-
-            # Find min and max value of the group, excluding np.nan
-            min_val = sys.float_info.max
-            max_val = sys.float_info.min
-            for item in col_groups:
-                if (
-                    isinstance(item, int)
-                    or isinstance(item, float)
-                    and not pd.isna(item)
-                ):
-                    if min_val > item:
-                        min_val = item
-                    if max_val < item:
-                        max_val = item
-
-            if np.nan in col_groups:
-                no_na_len = len(col_groups) - 1
-            else:
-                no_na_len = len(col_groups)
-
-            viridis = cm.get_cmap("viridis", no_na_len)
-            color_list = list()
-            for i in range(len(col_groups)):
-                # change rgba to rgb and range of values from 0-1 to 0-255
-                rgba_tuple = viridis(i)
-                rgba_list = list(rgba_tuple)
-                red = rgba_list[0] * 255
-                green = rgba_list[1] * 255
-                blue = rgba_list[2] * 255
-                rgb_list = [red, green, blue]
-                rgb_tuple = tuple(rgb_list)
-
-                color_list.append(rgb_tuple)
-
-            # Use plotly Viridis as colorscale
-            colorscale = list()
-            for col in color_list:
-                colorscale.append(f"rgb{col}")
-
-            # create colorbar
-            colorbar = dict(
-                title="Colorbar",
-                lenmode="fraction",
-                len=0.5,
-                yanchor="bottom",
-                ypad=50,
+            return 0, val
+        elif pd.isna(val):
+            return 3, val
+        elif isinstance(val, str):
+            val = val.lower()
+            return 1, val
+        else:
+            return 2, val
+
+    @staticmethod
+    def group_points(values: pd.Series, quantile_symbols: bool = False):
+        """
+        Groups the proteins by the selected column, every group is displayed
+        as a trace. Text columns get a group per value. Numeric columns are
+        colored with a colorscale in a single group, or a group per quartile
+        if they are marked with symbols.
+        :param values: the selected column
+        :param quantile_symbols: mark the quartiles of a numeric column with
+        different symbols
+        :return: group of every protein, name, color, symbol, opacity and
+        legend entry of every group and the coloraxis of a numeric column.
+        Groups without a color are colored by their values on the coloraxis.
+        """
+        nan_mask = values.isna().to_numpy()
+        groups = list()
+        coloraxis = None
+
+        if Visualizator.is_continuous(values):
+            codes = np.zeros(len(values), dtype=int)
+            if quantile_symbols and not nan_mask.all():
+                codes = Visualizator.quantile_codes(
+                    values, QUANTILE_SYMBOL_BINS
+                )
+                for code in range(codes.max() + 1):
+                    group_values = values[codes == code]
+                    lower, upper = group_values.min(), group_values.max()
+                    groups.append(
+                        dict(
+                            name=f"{lower:.4g} - {upper:.4g}",
+                            color=None,
+                            symbol=Visualizator.SYMBOLS[code],
+                            opacity=1.0,
+                            showlegend=True,
+                        )
+                    )
+            elif not nan_mask.all():
+                # a single trace is explained by the colorbar
+                groups.append(
+                    dict(
+                        name=str(values.name),
+                        color=None,
+                        symbol="circle",
+                        opacity=1.0,
+                        showlegend=False,
+                    )
+                )
+
+            coloraxis = dict(
+                colorscale="Viridis",
+                cmin=values.min(),
+                cmax=values.max(),
+                colorbar=dict(
+                    title=str(values.name),
+                    lenmode="fraction",
+                    len=0.5,
+                    yanchor="bottom",
+                    ypad=50,
+                ),
             )
+        else:
+            col_groups = [
+                group
+                for group in values.unique().tolist()
+                if not pd.isna(group)
+            ]
+            col_groups.sort(key=Visualizator.sort_key)
+            codes = pd.Categorical(values, categories=col_groups).codes
 
-            # create and add a dummy trace that holds the colorbar
-            if not two_d:
-                color_trace = go.Scatter3d(
-                    x=[None],
-                    y=[None],
-                    z=[None],
-                    mode="markers",
-                    marker=dict(
-                        colorscale=colorscale,
-                        showscale=True,
-                        colorbar=colorbar,
-                        cmin=min_val,
-                        cmax=max_val,
-                    ),
-                    showlegend=False,
+            if len(col_groups) > 0:
+                color_list = Visualizator.gen_distinct_colors(
+                    n=len(col_groups)
                 )
-            else:
-                color_trace = go.Scatter(
-                    x=[None],
-                    y=[None],
-                    mode="markers",
-                    marker=dict(
-                        colorscale=colorscale,
-                        showscale=True,
-                        colorbar=colorbar,
-                        cmin=min_val,
-                        cmax=max_val,
-                    ),
-                    showlegend=False,
+            # number of symbols depends on the number of groups
+            n_symbols = Visualizator.n_symbols_equation(n=len(col_groups))
+            for group_idx, group_value in enumerate(col_groups):
+                groups.append(
+                    dict(
+                        name=str(group_value),
+                        color=f"rgb{color_list[group_idx]}",
+                        symbol=Visualizator.SYMBOLS[group_idx % n_symbols],
+                        opacity=1.0,
+                        showlegend=True,
+                    )
                 )
 
-            fig.add_trace(color_trace)
+        # proteins without a value come last
+        if nan_mask.any():
+            codes = np.where(nan_mask, len(groups), codes)
+            groups.append(
+                dict(
+                    name="nan",
+                    color="lightgrey",
+                    symbol="circle",
+                    opacity=0.3,
+                    showlegend=True,
+                )
+            )
+
+        return np.asarray(codes, dtype=int), groups, coloraxis
+
+    @staticmethod
+    def hovertemplate(
+        selected_column: str, show_multiplicity: bool, colored: bool
+    ) -> str:
+        """
+        Hover info of a trace
+        :param selected_column: column of the graph
+        :param show_multiplicity: the multiplicity is the customdata
+        :param colored: the trace is colored by the values of the column
+        :return: hovertemplate of the trace
+        """
+        hovertemplate = "%{text}"
+        if show_multiplicity:
+            hovertemplate += "<br>multiplicity: %{customdata}"
+        if colored:
+            # the value isn't given by the name of the trace
+            hovertemplate += f"<br>{selected_column}: %{{marker.color}}"
+
+        return hovertemplate
+
+    @staticmethod
+    def style_layout(
+        fig: go.Figure,
+        df: DataFrame,
+        dim_red: str,
+        umap_paras: dict,
+        tsne_paras: dict,
+        two_d: bool,
+        download: bool = False,
+    ):
+        """
+        Sets up the layout of the graph, which doesn't depend on the
+        selected column
+        :param fig: graph figure
+        :param df: dataframe with the variance of the PCA components
+        :param dim_red: to be displayed dimensionality reduction
+        :param umap_paras: parameters of the UMAP calculation
+        :param tsne_paras: parameters of the TSNE calculation
+        :param two_d: if True graph should be displayed in 2D
+        :param download: boolean whether it is rendered for downloading or not
+        :return: None
+        """
+        if not two_d:
+            Visualizator.update_layout(fig)
+        else:
+            if not download:
+                # Safe space for displaying info toast and nearest neighbour
+                fig.update_layout(margin=dict(l=370))
+
+        Visualizator.handle_title(dim_red, umap_paras, tsne_paras, fig)
 
-        return numeric_flag, n_symbols, color_list
+        Visualizator.customize_axis_titles(dim_red, fig, df, two_d)
 
     @staticmethod
     def customize_axis_titles(
@@ -320,7 +414,8 @@ class Visualizator:
                 "UMAP"
                 + f"<br>n_neighbours: {umap_paras['n_neighbours']},"
                 f" min_dist: {umap_paras['min_dist']}, "
-                f"<br>metric: {umap_paras['metric']}"
+                f"<br>metric: {umap_paras['metric']},"
+                f" mode: {umap_paras.get('mode', 'exact')}"
             )
         elif dim_red == "PCA":
             title = "PCA"
@@ -330,7 +425,8 @@ class Visualizator:
                 + f"<br>iterations: {tsne_paras['iterations']}, perplexity:"
                 f" {tsne_paras['perplexity']}, <br>learning_rate:"
                 f" {tsne_paras['learning_rate']}, metric:"
-                f" {tsne_paras['tsne_metric']}"
+                f" {tsne_paras['tsne_metric']},"
+                f" backend: {tsne_paras.get('backend', 'sklearn')}"
             )
 
         fig.update_layout(
@@ -368,6 +464,10 @@ class Visualizator:
         dim_red: str = "UMAP",
         two_d: bool = False,
         download: bool = False,
+        max_points: int = 0,
+        region: tuple = None,
+        index: SpatialIndex = None,
+        quantile_symbols: bool = False,
     ):
         """
         Renders the plotly graph with the selected column in the dataframe df
@@ -378,173 +478,120 @@ class Visualizator:
         :param dim_red: to be displayed dimensionality reduction
         :param two_d: if True plot should be in 2D
         :param download: boolean  whether it is rendered for downloading or not
+        :param max_points: approximate number of points of a level-of-detail
+        view, 0 renders all points
+        :param region: lower and upper corner of the zoomed region of a
+        level-of-detail view, None if zoomed out
+        :param index: spatial index over the displayed coordinates of the
+        dataframe, built if None
+        :param quantile_symbols: mark the quartiles of a numeric column with
+        different symbols
         :return: plotly graphical object
         """
 
-        # custom separator to sort str, int and float (str case-insensitive)
-        # order: 1. int and float 2. str 3. rest 4. np.nan
-        def my_comparator(val):
-            if (
-                isinstance(val, float)
-                and not pd.isna(val)
-                or isinstance(val, int)
-            ):
-                return 0, val
-            elif pd.isna(val):
-                return 3, val
-            elif isinstance(val, str):
-                val = val.lower()
-                return 1, val
-            else:
-                return 2, val
-
-        mapped_index = None
+        # the dataframe is shared, it must not be modified here
+        hover_ids = df.index
         if original_id_col is not None:
-            # swap index
-            mapped_index = df.index
-            df.index = original_id_col
-
-        col_groups = df[selected_column].unique().tolist()
-        col_groups.sort(key=my_comparator)
-
-        # get nr of col groups without nan
-        if np.nan in col_groups:
-            n_col_groups = len(col_groups) - 1
-        else:
-            n_col_groups = len(col_groups)
-
-        color_list = Visualizator.gen_distinct_colors(n=n_col_groups)
+            # display the original IDs instead of the mapped ones
+            hover_ids = pd.Index(original_id_col)
 
-        # Figure out how many symbols to use depending on number of column groups
-        n_symbols = Visualizator.n_symbols_equation(n=n_col_groups)
-
-        fig = go.Figure()
-
-        numeric_flag, n_symbols, color_list = Visualizator.handle_colorbar(
-            col_groups, fig, n_symbols, color_list, two_d
+        codes, groups, coloraxis = Visualizator.group_points(
+            df[selected_column], quantile_symbols
         )
 
-        df["class_index"] = np.ones(len(df)) * -100
-
-        if not two_d:
-            if dim_red == "UMAP":
-                x = "x_umap_3D"
-                y = "y_umap_3D"
-                z = "z_umap_3D"
-            elif dim_red == "PCA":
-                x = "x_pca_3D"
-                y = "y_pca_3D"
-                z = "z_pca_3D"
-            else:
-                x = "x_tsne_3D"
-                y = "y_tsne_3D"
-                z = "z_tsne_3D"
-        else:
-            if dim_red == "UMAP":
-                x = "x_umap_2D"
-                y = "y_umap_2D"
-            elif dim_red == "PCA":
-                x = "x_pca_3D"
-                y = "y_pca_3D"
-            else:
-                x = "x_tsne_2D"
-                y = "y_tsne_2D"
-
-        # iterate over different values of the selected column
-        for group_idx, group_value in enumerate(col_groups):
-            # Show only nan in legend if colorbar is shown
-            show_legend = True
-            if numeric_flag:
-                if not pd.isna(group_value):
-                    show_legend = False
-
-            # set up opacity dependent on nan or not
-            if pd.isna(group_value):
-                opacity = 0.3
-                symbol = "circle"
-                color = "lightgrey"
-            else:
-                opacity = 1.0
-                symbol = Visualizator.SYMBOLS[group_idx % n_symbols]
-                color = f"rgb{color_list[group_idx]}"
-
-            # extract df with only group value
-            if not pd.isna(group_value):
-                df_group = df[df[selected_column] == group_value]
-            else:
-                df_group = df[df[selected_column].isna()]
-
-            if not two_d:
-                trace = go.Scatter3d(
-                    x=df_group[x],
-                    y=df_group[y],
-                    z=df_group[z],
-                    mode="markers",
-                    name=group_value,
-                    opacity=opacity,
-                    marker=dict(
-                        size=10,
-                        color=color,
-                        symbol=symbol,
-                        line=dict(color="black", width=1),
-                    ),
-                    text=df_group.index.to_list(),
-                    showlegend=show_legend,
+        # level of detail, only a subsample of the points is sent
+        df_points = df
+        if 0 < max_points < len(df):
+            if index is None:
+                index = SpatialIndex(
+                    df[get_axis_names(dim_red, two_d)].to_numpy()
                 )
-            else:
-                trace = go.Scatter(
-                    x=df_group[x],
-                    y=df_group[y],
-                    mode="markers",
-                    name=group_value,
-                    opacity=opacity,
-                    marker=dict(
-                        size=10,
-                        color=color,
-                        symbol=Visualizator.SYMBOLS[group_idx % n_symbols],
-                        line=dict(color="black", width=1),
-                    ),
-                    text=df_group.index.to_list(),
-                    showlegend=show_legend,
+            # every value of a numeric column would be a group of its own
+            lod_codes = codes
+            if coloraxis is not None:
+                lod_codes = Visualizator.quantile_codes(
+                    df[selected_column], LOD_QUANTILE_BINS
                 )
-            fig.add_trace(trace)
-            # Give the different group values a number
-            df.loc[
-                df[selected_column] == group_value, "class_index"
-            ] = group_idx
-
-        # Set hover-info
-        fig.update_traces(
-            hoverinfo=["name", "text"],
-            hoverlabel=dict(namelength=-1),
-            hovertemplate="%{text}",
+            rows = index.level_of_detail(max_points, lod_codes, region)
+            df_points = df.iloc[rows]
+            hover_ids = hover_ids[rows]
+            codes = codes[rows]
+
+        # proteins with identical embeddings lie on top of each other
+        show_multiplicity = (
+            MULTIPLICITY_COLUMN in df.columns
+            and df[MULTIPLICITY_COLUMN].max() > 1
         )
 
-        if not two_d:
-            Visualizator.update_layout(fig)
-        else:
-            if not download:
-                # Safe space for displaying info toast and nearest neighbour
-                fig.update_layout(margin=dict(l=370))
+        fig = go.Figure()
 
-        Visualizator.handle_title(dim_red, umap_paras, tsne_paras, fig)
+        axis_names = get_axis_names(dim_red, two_d)
+
+        # a trace per group of the selected column
+        for code, group in enumerate(groups):
+            group_mask = codes == code
+            df_group = df_points[group_mask]
+            multiplicity = None
+            if show_multiplicity:
+                multiplicity = df_group[MULTIPLICITY_COLUMN].to_numpy()
+
+            marker = dict(
+                size=10,
+                color=group["color"],
+                symbol=group["symbol"],
+                line=dict(color="black", width=1),
+            )
+            colored = group["color"] is None
+            if colored:
+                marker.update(
+                    color=df_group[selected_column].to_numpy(),
+                    coloraxis="coloraxis",
+                )
 
-        Visualizator.customize_axis_titles(dim_red, fig, df, two_d)
+            trace = dict(
+                x=df_group[axis_names[0]],
+                y=df_group[axis_names[1]],
+                mode="markers",
+                name=group["name"],
+                opacity=group["opacity"],
+                marker=marker,
+                text=hover_ids[group_mask].to_numpy(),
+                customdata=multiplicity,
+                showlegend=group["showlegend"],
+                hoverinfo=["name", "text"],
+                hoverlabel=dict(namelength=-1),
+                hovertemplate=Visualizator.hovertemplate(
+                    selected_column, show_multiplicity, colored
+                ),
+            )
+            if not two_d:
+                trace["z"] = df_group[axis_names[2]]
+                fig.add_trace(go.Scatter3d(**trace))
+            else:
+                fig.add_trace(go.Scatter(**trace))
 
-        # swap index again
-        if original_id_col is not None:
-            df.index = mapped_index
+        if coloraxis is not None:
+            fig.update_layout(coloraxis=coloraxis)
+
+        Visualizator.style_layout(
+            fig, df, dim_red, umap_paras, tsne_paras, two_d, download
+        )
 
         return fig
 
     def get_base_app(
-        self, umap_paras: dict, tsne_paras: dict, original_id_col: list
+        self,
+        umap_paras: dict,
+        tsne_paras: dict,
+        original_id_col: list,
+        requests_pathname_prefix: str = None,
     ):
         """
         Initializes the dash app in base.py
         :param umap_paras: Parameters of the UMAP calculation
         :param tsne_paras: Parameters of the TSNE calculation
         :param original_id_col: list with the original IDs
+        :param requests_pathname_prefix: URL prefix if the app is not served at the root
         :return: the application layout
         """
         return init_app(
@@ -554,18 +601,27 @@ class Visualizator:
             self.dim_red,
             tsne_paras,
             original_id_col,
+            requests_pathname_prefix,
         )
 
     def get_pdb_app(
-        self, orig_id_col: list[str], umap_paras: dict, tsne_paras: dict
+        self,
+        orig_id_col: list[str],
+        umap_paras: dict,
+        tsne_paras: dict,
+        requests_pathname_prefix: str = None,
     ):
         """
         Initializes the dash app in pdb.py
         :param orig_id_col: List of the original IDs
         :param umap_paras: Parameters of the UMAP calculation
         :param tsne_paras: Parameters of the TSNE calculation
+        :param requests_pathname_prefix: URL prefix if the app is not served at the root
         :return: the application layout
         """
+        # dash_bio is only needed for the molecule viewer
+        from .pdb import init_app_pdb
+
         return init_app_pdb(
             orig_id_col,
             umap_paras,
@@ -573,4 +629,5 @@ class Visualizator:
             self.fig,
             self.dim_red,
             tsne_paras,
+            requests_pathname_prefix,
         )
@@ -4,7 +4,12 @@ from pathlib import Path
 import numpy
 import numpy as np
 
-from src.callbacks import get_callbacks, get_callbacks_pdb
+from src.callbacks import (
+    get_callbacks,
+    get_callbacks_pdb,
+    to_mapped_id,
+    to_original_id,
+)
 from src.preprocessing import DataPreprocessor
 from src.structurecontainer import StructureContainer
 from src.visualization.visualizator import Visualizator
@@ -33,7 +38,7 @@ def setup():
     pca_flag = False
     tsne_flag = False
     iterations = 1000
-    perplexity = 30
+    perplexity = 30.0
     learning_rate = 10
     tsne_metric = "euclidean"
     n_neighbours = 25
@@ -186,3 +191,14 @@ def test_silhouette():
     expected = np.float64(0.0)
 
     assert output == expected
+
+
+def test_id_conversion():
+    import pandas as pd
+
+    df = pd.DataFrame(index=["S0", "S1", "S2"])
+    original_ids = pd.Index(["P0", "P1", "P2"])
+
+    assert to_mapped_id(["P2", "P0"], original_ids, df) == ["S2", "S0"]
+    assert to_original_id(["S2", "S0"], original_ids, df) == ["P2", "P0"]
+    assert to_mapped_id(["P1"], list(original_ids), df) == ["S1"]
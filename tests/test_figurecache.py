@@ -0,0 +1,35 @@
+import pickle
+
+import plotly.graph_objects as go
+
+from src.figurecache import FigureCache
+
+
+def test_figure_cache():
+    fig = go.Figure(go.Scatter(x=list(range(100)), y=list(range(100))))
+    size = len(pickle.dumps(fig, protocol=pickle.HIGHEST_PROTOCOL))
+    source = object()
+
+    # room for two figures
+    cache = FigureCache(2.5 * size / 2**20)
+    cache.put(("group", "UMAP", False, "a", False), source, fig)
+    cache.put(("group", "UMAP", True, "a", False), source, fig)
+
+    # every session gets its own copy
+    copy = cache.get(("group", "UMAP", False, "a", False), source)
+    assert copy is not fig and copy == fig
+    copy.add_trace(go.Scatter(x=[], y=[]))
+    copy = cache.get(("group", "UMAP", False, "a", False), source)
+    assert len(copy.data) == 1
+
+    # the least recently used figure is dropped
+    cache.put(("length", "UMAP", False, "a", False), source, fig)
+    assert len(cache) == 2 and cache.nbytes == 2 * size
+    assert cache.get(("group", "UMAP", True, "a", False), source) is None
+
+    # recalculated coordinates and changed columns are rendered again
+    assert cache.get(("length", "UMAP", False, "a", False), object()) is None
+    cache.invalidate(["group"])
+    assert len(cache) == 0 and cache.nbytes == 0
+
+    assert not FigureCache(0).put(("group",), source, fig)
@@ -0,0 +1,96 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+# libraries that are only needed for recalculations, scores or the molecule
+# viewer
+LAZY_MODULES = [
+    "umap",
+    "numba",
+    "sklearn",
+    "scipy.stats",
+    "dash_bio",
+    "matplotlib",
+    "Bio",
+]
+
+# generous upper bound in seconds, importing the server modules takes ~1.5s
+# on a laptop
+IMPORT_BUDGET = 5.0
+# generous upper bound in seconds from the start to an app ready to serve on
+# a dataset whose projections are cached, ~3s on a laptop
+STARTUP_BUDGET = 15.0
+
+
+def run_python(code: str):
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_entry_point_imports_nothing_heavy():
+    loaded = run_python(
+        "import json, sys\n"
+        "import src.app\n"
+        "print(json.dumps(sorted(\n"
+        "    m for m in ('pandas', 'dash', 'plotly') if m in sys.modules\n"
+        ")))"
+    )
+    assert loaded == []
+
+
+def test_server_import_budget():
+    measured = run_python(
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import src.app\n"
+        "from src.callbacks import get_callbacks\n"
+        "from src.preprocessing import DataPreprocessor\n"
+        "from src.structurecontainer import StructureContainer\n"
+        "from src.visualization.visualizator import Visualizator\n"
+        "duration = time.perf_counter() - start\n"
+        f"lazy = [m for m in {LAZY_MODULES!r} if m in sys.modules]\n"
+        "print(json.dumps(dict(duration=duration, lazy=lazy)))"
+    )
+
+    assert measured["lazy"] == []
+    assert measured["duration"] < IMPORT_BUDGET
+
+
+def test_cached_startup_budget():
+    # the parameters of tests/test_callbacks.py, which share its cache
+    arguments = [
+        "-o",
+        "data/VA",
+        "--hdf",
+        "data/VA/VA.h5",
+        "--csv",
+        "data/VA/VA.csv",
+        "--fasta",
+        "data/VA/VA.fasta",
+        "--learning_rate",
+        "10",
+        "--tsne_backend",
+        "sklearn",
+    ]
+    code = (
+        "import json, time\n"
+        "start = time.perf_counter()\n"
+        "from src.app import Parser, get_application\n"
+        f"get_application(Parser({arguments!r}))\n"
+        "duration = time.perf_counter() - start\n"
+        "print(json.dumps(dict(duration=duration)))"
+    )
+    # the first start computes the projections if they aren't cached yet
+    run_python(code)
+
+    measured = run_python(code)
+    assert measured["duration"] < STARTUP_BUDGET
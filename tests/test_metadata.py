@@ -0,0 +1,61 @@
+import pandas as pd
+
+from src.metadata import categorize, read_metadata
+
+
+def test_read_metadata(tmp_path):
+    csv_path = tmp_path / "labels.csv"
+    csv_path.write_text("ID;group;length\nP1;A;10\nP2;B;12\nP3;A;\n")
+    df, mapped_flag, csv_less_flag = read_metadata(csv_path, ";", 0)
+    assert not mapped_flag and not csv_less_flag
+    assert list(df.index) == ["P1", "P2", "P3"]
+
+    df = categorize(df)
+    assert isinstance(df["group"].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_float_dtype(df["length"])
+    assert (df["group"] == "A").tolist() == [True, False, True]
+
+    # written by fasta_mapper.py, the mapped IDs are in the first column
+    mapped_path = tmp_path / "mapped.csv"
+    mapped_path.write_text("mapped_id,original_id\nS0,P1\nS1,P2\n")
+    df, mapped_flag, csv_less_flag = read_metadata(mapped_path, ",", 1)
+    assert mapped_flag and csv_less_flag
+    assert list(df.index) == ["S0", "S1"]
+
+    assert read_metadata(tmp_path / "missing.csv", ",", 0) == (
+        None,
+        False,
+        True,
+    )
+
+
+def test_metadata_reloader(tmp_path):
+    from src.dataset import PCA_AXIS_NAMES, DatasetSnapshot, MetadataReloader
+
+    csv_path = tmp_path / "labels.csv"
+    csv_path.write_text("ID,group,length\nP1,A,10\nP2,B,12\n")
+
+    def read():
+        df, _, _ = read_metadata(csv_path, ",", 0)
+        return categorize(df), None
+
+    coords = pd.DataFrame(
+        [[0.0, 1.0, 2.0], [3.0, 4.0, 5.0]],
+        index=["P1", "P2"],
+        columns=PCA_AXIS_NAMES,
+    )
+    dataset = DatasetSnapshot(read()[0].join(coords), dict(), dict())
+    csv_header = ["group", "length"]
+    reloader = MetadataReloader(dataset, csv_header, csv_path, read)
+    assert reloader.reload() == 0
+
+    # unknown proteins are left out, the coordinates are kept
+    csv_path.write_text("ID,group,note\nP1,C,x\nP2,B,y\nP3,A,z\n")
+    assert reloader.reload(force=True) == 1
+    assert reloader.changed_since(0) == ["length", "group", "note"]
+    assert csv_header == ["group", "note"]
+    assert list(dataset.df.index) == ["P1", "P2"]
+    pd.testing.assert_frame_equal(
+        dataset.df[PCA_AXIS_NAMES], coords, check_names=False
+    )
+    assert dataset.df.at["P1", "group"] == "C"
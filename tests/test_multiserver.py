@@ -0,0 +1,52 @@
+from pathlib import Path
+
+from src.multiserver import DatasetRegistry
+
+
+def test_lru_eviction(monkeypatch):
+    conf_files = [
+        Path("conf/A.yaml"),
+        Path("conf/B.yaml"),
+        Path("conf/C.yaml"),
+    ]
+    # budget of 2.5 MB, every dataset takes 1 MB
+    registry = DatasetRegistry(conf_files, memory_budget=2.5, verbose=False)
+
+    loads = list()
+
+    def fake_load(name):
+        loads.append(name)
+        return f"app_{name}", 2**20
+
+    monkeypatch.setattr(registry, "_load", fake_load)
+
+    assert registry.get("A") == "app_A"
+    registry.get("B")
+    # A is now the most recently used dataset
+    registry.get("A")
+    registry.get("C")
+
+    assert registry.is_loaded("A")
+    assert not registry.is_loaded("B")
+    assert registry.is_loaded("C")
+
+    registry.get("B")
+    assert loads == ["A", "B", "C", "B"]
+    assert not registry.is_loaded("A")
+
+
+def test_preload(monkeypatch):
+    conf_files = [Path(f"conf/{name}.yaml") for name in "ABCD"]
+    registry = DatasetRegistry(conf_files, memory_budget=2.5, verbose=False)
+    monkeypatch.setattr(
+        registry, "_load", lambda name: (f"app_{name}", 2**20)
+    )
+
+    # C doesn't fit next to A and B, D isn't loaded
+    registry.preload()
+    assert [registry.is_loaded(name) for name in "ABCD"] == [
+        False,
+        True,
+        True,
+        False,
+    ]
@@ -0,0 +1,243 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.precompute import parameter_grid
+from src.preprocessing import DataPreprocessor
+
+
+def test_parameter_grid():
+    defaults = dict(n_neighbours=25, min_dist=0.5, metric="euclidean")
+    grid = parameter_grid(dict(n_neighbours=[10, 50], min_dist=1), defaults)
+
+    assert grid == [
+        dict(n_neighbours=10, min_dist=1.0, metric="euclidean"),
+        dict(n_neighbours=50, min_dist=1.0, metric="euclidean"),
+    ]
+    assert parameter_grid(dict(), defaults) == [defaults]
+
+
+def test_projection_store(tmp_path):
+    data_preprocessor = DataPreprocessor(
+        tmp_path,
+        Path("data/VA/VA.h5"),
+        None,
+        None,
+        ",",
+        0,
+        None,
+        False,
+        "UMAP",
+        dict(),
+        dict(),
+        False,
+    )
+    coords_df = pd.DataFrame(
+        [[0.0, 1.0], [2.0, 3.0]],
+        index=["P1", "P2"],
+        columns=["x_umap_2D", "y_umap_2D"],
+    )
+    data_preprocessor.save_projection("umap", "10 ; 0.1 ; cosine", coords_df)
+
+    projections = data_preprocessor.load_projections("umap", ["P2", "P1"])
+    pd.testing.assert_frame_equal(
+        projections["10 ; 0.1 ; cosine"], coords_df, check_names=False
+    )
+    # proteins removed from the csv file are left out
+    projections = data_preprocessor.load_projections("umap", ["P1"])
+    pd.testing.assert_frame_equal(
+        projections["10 ; 0.1 ; cosine"], coords_df.loc[["P1"]]
+    )
+    # stored without some of the proteins
+    assert data_preprocessor.load_projections("umap", ["P1", "P3"]) == dict()
+
+
+def test_reduce_embeddings(tmp_path):
+    data_preprocessor = DataPreprocessor(
+        tmp_path,
+        Path("data/VA/VA.h5"),
+        None,
+        None,
+        ",",
+        0,
+        None,
+        False,
+        "UMAP",
+        dict(pre_reduction=5),
+        dict(pre_reduction=5),
+        False,
+    )
+    rng = np.random.default_rng(42)
+    embs = rng.random((20, 16))
+    uids = [f"P{idx}" for idx in range(20)]
+
+    reduced = data_preprocessor.reduce_embeddings(embs, uids)
+    assert reduced.shape == (20, 5)
+    # stored with the projections and loaded instead of computed again
+    np.testing.assert_array_equal(
+        data_preprocessor.reduce_embeddings(rng.random((20, 16)), uids),
+        reduced,
+    )
+
+
+def test_initial_projection_paras(tmp_path):
+    def preprocessor(
+        umap_mode: str, tsne_backend: str = "sklearn", pre_reduction: int = 0
+    ):
+        umap_paras = dict(
+            n_neighbours=25,
+            min_dist=0.5,
+            metric="euclidean",
+            mode=umap_mode,
+            pre_reduction=pre_reduction,
+        )
+        tsne_paras = dict(
+            iterations=1000,
+            perplexity=30,
+            learning_rate=10,
+            tsne_metric="e",
+            backend=tsne_backend,
+            pre_reduction=pre_reduction,
+        )
+        return DataPreprocessor(
+            tmp_path,
+            Path("data/VA/VA.h5"),
+            None,
+            None,
+            ",",
+            0,
+            None,
+            False,
+            "UMAP",
+            umap_paras,
+            tsne_paras,
+            False,
+        )
+
+    uids = ["P1", "P2"]
+    data_preprocessor = preprocessor("exact")
+    columns = data_preprocessor.AXIS_NAMES
+    coords_df = pd.DataFrame(
+        np.arange(2.0 * len(columns)).reshape(2, -1),
+        index=uids,
+        columns=columns,
+    ).assign(variance=[0.5, np.nan])
+    data_preprocessor._save_coordinates(coords_df)
+    assert data_preprocessor._load_coordinates(uids) is not None
+
+    # computed in the exact mode, not shown under the fast mode
+    data_preprocessor = preprocessor("fast")
+    assert data_preprocessor._load_coordinates(uids) is None
+    projections = data_preprocessor.load_projections("umap", uids)
+    assert list(projections) == ["25 ; 0.5 ; euclidean ; exact"]
+    assert list(projections["25 ; 0.5 ; euclidean ; exact"].columns) == (
+        data_preprocessor.UMAP_AXIS_NAMES
+    )
+    assert data_preprocessor.load_projections("tsne", uids) == dict()
+
+    # the fast UMAP layout is stored again, the sklearn t-SNE is outdated
+    data_preprocessor._save_coordinates(coords_df)
+    data_preprocessor = preprocessor("fast", "opentsne")
+    assert data_preprocessor._load_coordinates(uids) is None
+    projections = data_preprocessor.load_projections("tsne", uids)
+    assert list(projections) == ["1000 ; 30 ; 10 ; e ; sklearn"]
+    assert len(data_preprocessor.load_projections("umap", uids)) == 1
+
+    # computed from the full embeddings, not shown as pre-reduced
+    data_preprocessor._save_coordinates(coords_df)
+    data_preprocessor = preprocessor("fast", "opentsne", 50)
+    assert data_preprocessor._load_coordinates(uids) is None
+    assert "25 ; 0.5 ; euclidean ; fast" in data_preprocessor.load_projections(
+        "umap", uids
+    )
+    data_preprocessor._save_coordinates(coords_df)
+    assert data_preprocessor._load_coordinates(uids) is not None
+
+
+def test_legacy_coordinates(tmp_path):
+    data_preprocessor = DataPreprocessor(
+        tmp_path,
+        Path("data/VA/VA.h5"),
+        None,
+        None,
+        ",",
+        0,
+        None,
+        False,
+        "UMAP",
+        dict(n_neighbours=25, min_dist=0.5, metric="euclidean"),
+        dict(
+            iterations=1000, perplexity=30, learning_rate=10, tsne_metric="e"
+        ),
+        False,
+    )
+    columns = data_preprocessor.AXIS_NAMES
+    legacy_df = pd.DataFrame(
+        np.arange(2.0 * len(columns)).reshape(2, -1),
+        index=["P1", "P2"],
+        columns=columns,
+    ).assign(group=["A", "B"], variance=[0.5, np.nan])
+    legacy_path = tmp_path / "df_VA.csv"
+    legacy_df.to_csv(legacy_path)
+
+    # kept while it doesn't cover the embeddings
+    assert data_preprocessor._load_coordinates(["P1", "P3"]) is None
+    assert legacy_path.is_file()
+
+    coords_df = data_preprocessor._load_coordinates(["P1", "P2"])
+    assert list(coords_df.columns) == columns + ["variance"]
+    assert not legacy_path.is_file()
+    assert data_preprocessor._load_coordinates(["P1", "P2"]) is not None
+
+
+def test_projection_of_other_worker(tmp_path):
+    from src.dataset import (
+        PCA_AXIS_NAMES,
+        TSNE_AXIS_NAMES,
+        UMAP_AXIS_NAMES,
+        DatasetSnapshot,
+    )
+
+    data_preprocessor = DataPreprocessor(
+        tmp_path,
+        Path("data/VA/VA.h5"),
+        None,
+        None,
+        ",",
+        0,
+        None,
+        False,
+        "UMAP",
+        dict(),
+        dict(),
+        False,
+    )
+    uids = ["P1", "P2"]
+    df = pd.DataFrame(0.0, index=uids, columns=PCA_AXIS_NAMES)
+    umap_df = pd.DataFrame(1.0, index=uids, columns=UMAP_AXIS_NAMES)
+    tsne_df = pd.DataFrame(2.0, index=uids, columns=TSNE_AXIS_NAMES)
+
+    def snapshot():
+        # the projection caches of one worker process
+        return DatasetSnapshot(
+            df,
+            dict(initial=umap_df),
+            dict(initial=tsne_df),
+            data_preprocessor.save_projection,
+            lambda kind, paras_string: data_preprocessor.load_projection(
+                kind, paras_string, uids
+            ),
+        )
+
+    worker_1, worker_2 = snapshot(), snapshot()
+    worker_1.add_umap("10 ; 0.1 ; cosine", umap_df + 1)
+
+    frame = worker_2.frame([], "10 ; 0.1 ; cosine", "initial")
+    np.testing.assert_array_equal(frame[UMAP_AXIS_NAMES], 2.0)
+    assert "10 ; 0.1 ; cosine" in worker_2.umap_paras_dict
+    try:
+        worker_2.frame([], "15 ; 0.1 ; cosine", "initial")
+        assert False
+    except KeyError:
+        pass
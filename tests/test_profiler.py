@@ -0,0 +1,60 @@
+import json
+
+from src.profiler import StageProfiler
+
+
+def test_disabled_profiler_records_nothing(tmp_path):
+    profiler = StageProfiler()
+    with profiler.stage("noop"):
+        pass
+
+    assert profiler.records == []
+    assert profiler.write(tmp_path, "test") is None
+
+
+def test_stage_timeline(tmp_path):
+    profiler = StageProfiler(enabled=True, cprofile=True)
+    with profiler.stage("outer"):
+        with profiler.stage("inner"):
+            sum(range(10000))
+
+    names = [record["name"] for record in profiler.records]
+    assert names == ["inner", "outer"]
+    assert all(record["peak_rss"] >= 0 for record in profiler.records)
+
+    trace_path = profiler.write(tmp_path, "test")
+    with open(trace_path) as f:
+        trace = json.load(f)
+
+    stages = [e["name"] for e in trace["traceEvents"] if e["ph"] == "X"]
+    assert stages == ["inner", "outer"]
+    # cProfile is only attached to the outermost stage
+    assert (tmp_path / "profile_test_outer.prof").is_file()
+    assert not (tmp_path / "profile_test_inner.prof").is_file()
+
+
+def test_repeated_stage_profiles(tmp_path):
+    import pstats
+
+    profiler = StageProfiler(cprofile=True)
+    for _ in range(2):
+        with profiler.stage("reducer"):
+            with profiler.stage("fit"):
+                sorted(range(1000))
+
+    profiler.write(tmp_path, "test")
+    stats = pstats.Stats(str(tmp_path / "profile_test_reducer.prof"))
+    calls = [
+        value[0]
+        for (_, _, function), value in stats.stats.items()
+        if function == "<built-in method builtins.sorted>"
+    ]
+    # both runs are kept
+    assert calls == [2]
+    assert "cProfile of reducer: 2 run(s), includes fit" in profiler.report()
+    assert [record["profiled_in"] for record in profiler.records] == [
+        "reducer",
+        "reducer",
+        "reducer",
+        "reducer",
+    ]
@@ -0,0 +1,36 @@
+import numpy as np
+
+from src.progressive import ProgressiveJob
+
+TSNE_PARAS = dict(
+    iterations=250,
+    perplexity=5,
+    learning_rate="auto",
+    tsne_metric="euclidean",
+    backend="sklearn",
+)
+
+
+def test_progressive_job():
+    embeddings = np.random.default_rng(42).random((40, 8))
+    job = ProgressiveJob("tsne", TSNE_PARAS, "key", embeddings)
+    job.start()
+    job._thread.join()
+
+    assert job.finished and job.error is None
+    assert job.progress == 1.0
+    assert job.layouts[0].shape == (40, 3) and job.layouts[1].shape == (40, 2)
+    assert job.result.shape == (40, 5)
+
+
+def test_progressive_job_cancel():
+    embeddings = np.random.default_rng(42).random((40, 8))
+    job = ProgressiveJob("tsne", TSNE_PARAS, "key", embeddings)
+    job.cancel()
+    job.start()
+    job._thread.join()
+
+    # stopped after the 3D layout
+    assert job.cancelled and job.progress == 0.5
+    assert job.layouts[1] is None
+    assert job.result is None
@@ -0,0 +1,91 @@
+import h5py
+import numpy as np
+
+from src.reducers import (
+    compute_array,
+    pca_fit,
+    pca_fit_streaming,
+    unique_rows,
+)
+
+
+def test_pca_fit_streaming(tmp_path):
+    # three strong directions and noise
+    rng = np.random.default_rng(42)
+    data = rng.normal(size=(500, 3)) * [10, 5, 2] @ rng.normal(size=(3, 64))
+    data += rng.normal(size=(500, 64))
+
+    hdf_path = tmp_path / "emb.h5"
+    uids = [f"P{idx}" for idx in range(len(data))]
+    with h5py.File(hdf_path, "w") as hdf:
+        for uid, embedding in zip(uids, data):
+            hdf.create_dataset(uid, data=embedding.astype(np.float32))
+
+    pca_coords, variance_ratio = pca_fit(data)
+    stream_coords, stream_variance_ratio = pca_fit_streaming(
+        str(hdf_path), uids, chunk_size=64
+    )
+
+    assert stream_coords.shape == (len(uids), 3)
+    # the explained variance of the axis titles is kept
+    np.testing.assert_allclose(
+        stream_variance_ratio, variance_ratio, rtol=0.01
+    )
+    # same components up to the sign
+    for axis in range(3):
+        correlation = np.corrcoef(pca_coords[:, axis], stream_coords[:, axis])
+        assert abs(correlation[0, 1]) > 0.99
+
+
+def test_distance_matrix_dtype():
+    from scipy.spatial.distance import cdist
+
+    from src.preprocessing import DataPreprocessor
+
+    data = np.random.default_rng(42).random((1500, 32)).astype(np.float16)
+    compute_data = compute_array(data)
+    assert compute_data.dtype == np.float32
+
+    # filled in blocks of rows, the full matrix is never held in float64
+    dis_mat = DataPreprocessor._distance_matrix(
+        compute_data, "euclidean", np.float32
+    )
+    assert dis_mat.dtype == np.float32
+    np.testing.assert_allclose(
+        dis_mat, cdist(compute_data, compute_data), rtol=1e-5, atol=1e-5
+    )
+
+
+def test_unique_rows():
+    import pandas as pd
+
+    from src.preprocessing import DataPreprocessor
+
+    rng = np.random.default_rng(42)
+    unique = rng.random((50, 13)).astype(np.float32)
+    rows = rng.integers(0, len(unique), 300)
+    data = unique[rows]
+
+    first, inverse = unique_rows(data)
+    assert len(first) == len(np.unique(rows))
+    np.testing.assert_array_equal(data[first][inverse], data)
+    # the first occurrence represents its duplicates
+    np.testing.assert_array_equal(first[inverse[first]], first)
+
+    init_df = pd.DataFrame(data[:, :2])
+    layouts = list()
+    (
+        collapsed,
+        init_df,
+        callback,
+        inverse,
+    ) = DataPreprocessor._collapse_duplicates(
+        data, init_df, lambda _, lays: layouts.extend(lays)
+    )
+    assert len(collapsed) == len(init_df) == len(first)
+    callback(1.0, [collapsed[:, :2], None])
+    np.testing.assert_array_equal(layouts[0], data[:, :2])
+    assert layouts[1] is None
+
+    # without duplicates nothing is copied
+    assert DataPreprocessor._collapse_duplicates(unique)[0] is unique
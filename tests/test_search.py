@@ -0,0 +1,36 @@
+import pandas as pd
+
+from src.search import SearchIndex
+
+
+def test_search_index():
+    ids = ["Q9XYZ1", "P12345", "P12399", "A0P123", "P5"]
+    df = pd.DataFrame(
+        dict(
+            group=pd.Categorical(["Toxin", "Lipase", "toxin-like", "X", None]),
+            length=[10.0, 12.0, 14.0, 16.0, 18.0],
+        ),
+        index=ids,
+    )
+    index = SearchIndex(ids)
+
+    # prefixes first, then substrings, case-insensitive
+    assert [option["value"] for option in index.search("p123")] == [
+        "P12345",
+        "P12399",
+        "A0P123",
+    ]
+    assert [option["value"] for option in index.search("p1", limit=1)] == [
+        "P12345"
+    ]
+    assert index.search("") == [
+        dict(label=seq_id, value=seq_id) for seq_id in sorted(ids)
+    ]
+
+    # metadata matches are labelled with the matching value
+    assert index.search("toxin", df) == [
+        dict(label="Q9XYZ1 (group: Toxin)", value="Q9XYZ1"),
+        dict(label="P12399 (group: toxin-like)", value="P12399"),
+    ]
+    assert index.search("toxin") == []
+    assert index.search("12", df) == index.search("12")
@@ -0,0 +1,75 @@
+import numpy as np
+
+from src.spatial import (
+    SPATIAL_INDEX_CACHE,
+    SpatialIndex,
+    SpatialIndexCache,
+    spatial_index_nbytes,
+    view_region,
+)
+
+
+def test_level_of_detail():
+    rng = np.random.default_rng(42)
+    coords = rng.normal(size=(20000, 2))
+    coords[::100] = np.nan
+    codes = rng.integers(0, 5, len(coords))
+    # a small group far away from the rest
+    coords[:3] = 50
+    codes[:3] = 5
+    index = SpatialIndex(coords)
+
+    lower, upper = [-0.5, -0.5], [0.5, 0.5]
+    expected = np.flatnonzero(
+        np.all((coords >= lower) & (coords <= upper), axis=1)
+    )
+    np.testing.assert_array_equal(index.region(lower, upper), expected)
+
+    rows = index.level_of_detail(2000, codes)
+    assert abs(len(rows) - 2000) < 200
+    assert not np.isnan(coords[rows]).any()
+    assert set(codes[rows]) == set(range(6))
+
+    # the zoomed region is filled in completely
+    region = view_region(
+        dict(x=[-0.2, 0.2], y=[-0.2, 0.2]), index.lower, index.upper
+    )
+    rows = index.level_of_detail(2000, codes, region)
+    assert np.isin(index.region(*region), rows).all()
+    assert len(rows) < 2500
+
+
+def test_queries():
+    rng = np.random.default_rng(42)
+    coords = rng.random((5000, 3))
+
+    # lasso selection in 2D: the lower right half of the unit square
+    index_2d = SpatialIndex(coords[:, :2])
+    rows = index_2d.polygon([[0, 0], [1, 0], [1, 1]])
+    np.testing.assert_array_equal(
+        rows, np.flatnonzero(coords[:, 0] > coords[:, 1])
+    )
+
+
+def test_spatial_index_cache():
+    coords = np.random.default_rng(42).random((100, 2))
+    cache = SpatialIndexCache(max_size=2)
+    source = object()
+
+    index = cache.get(("UMAP", True, "a"), source, coords)
+    assert cache.get(("UMAP", True, "a"), source, coords) is index
+    # replaced coordinates of the projection
+    assert cache.get(("UMAP", True, "a"), object(), coords) is not index
+
+    cache.get(("UMAP", True, "b"), source, coords)
+    cache.get(("UMAP", True, "c"), source, coords)
+    assert len(cache._indexes) == 2
+
+
+def test_spatial_index_nbytes():
+    n_points = 1000
+    index = SpatialIndex(np.random.default_rng(42).random((n_points, 3)))
+    arrays = [index.rows, index.coords, index.cell_ids, index.order]
+    nbytes = sum(array.nbytes for array in arrays + [index.starts])
+
+    assert nbytes * SPATIAL_INDEX_CACHE <= spatial_index_nbytes(n_points)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from src.dataset import UMAP_AXIS_NAMES
+from src.visualization.visualizator import Visualizator
+
+UMAP_PARAS = dict(n_neighbours=25, min_dist=0.5, metric="euclidean")
+
+
+def test_group_points():
+    values = pd.Series(["b", None, "A", "b"], name="group")
+    codes, groups, coloraxis = Visualizator.group_points(values)
+    # case-insensitive order, proteins without a value come last
+    assert [group["name"] for group in groups] == ["A", "b", "nan"]
+    assert codes.tolist() == [1, 2, 0, 1]
+    assert coloraxis is None
+
+    values = pd.Series([1.0, 2.0, np.nan, 4.0], name="length")
+    codes, groups, coloraxis = Visualizator.group_points(values)
+    assert codes.tolist() == [0, 0, 1, 0]
+    assert groups[0]["color"] is None and groups[1]["name"] == "nan"
+    assert coloraxis["cmin"] == 1.0 and coloraxis["cmax"] == 4.0
+
+
+def test_continuous_colors():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame(
+        rng.normal(size=(1000, len(UMAP_AXIS_NAMES))),
+        columns=UMAP_AXIS_NAMES,
+        index=[f"P{i}" for i in range(1000)],
+    )
+    df["plddt"] = rng.uniform(0, 100, 1000)
+    df.loc[df.index[:10], "plddt"] = np.nan
+
+    # one trace for all values and one for the missing ones
+    fig = Visualizator.render(df, "plddt", None, UMAP_PARAS, dict())
+    assert [trace.name for trace in fig.data] == ["plddt", "nan"]
+    assert len(fig.data[0].x) == 990 and len(fig.data[1].x) == 10
+    assert fig.layout.coloraxis.cmax == df["plddt"].max()
+
+    # a trace per quartile, all colored by the same colorbar
+    fig = Visualizator.render(
+        df,
+        "plddt",
+        None,
+        UMAP_PARAS,
+        dict(),
+        two_d=True,
+        quantile_symbols=True,
+    )
+    assert len(fig.data) == 5
+    assert [trace.marker.symbol for trace in fig.data[:4]] == (
+        Visualizator.SYMBOLS[:4]
+    )
+    assert sum(len(trace.x) for trace in fig.data[:4]) == 990